@@ -0,0 +1,48 @@
+from typing import Any, Dict
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+import time
+
+from app.metrics import LLM_LATENCY, TOOL_LATENCY, ERRORS
+
+# Agent运行回调（依赖langchain，仅在Agent初始化时导入）
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """记录Agent内部每次LLM调用和工具调用的耗时"""
+
+    # 只做计时，直接在调用线程中执行，无需调度到线程池
+    run_inline = True
+
+    def __init__(self):
+        self._llm_started: Dict[UUID, float] = {}
+        self._tool_started: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        self._llm_started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any):
+        self._llm_started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        started = self._llm_started.pop(run_id, None)
+        if started is not None:
+            LLM_LATENCY.observe(time.perf_counter() - started, kind="agent")
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs: Any):
+        self._llm_started.pop(run_id, None)
+        ERRORS.inc(component="llm")
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs: Any):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        self._tool_started[run_id] = (name, time.perf_counter())
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs: Any):
+        entry = self._tool_started.pop(run_id, None)
+        if entry is not None:
+            TOOL_LATENCY.observe(time.perf_counter() - entry[1], tool=entry[0])
+
+    def on_tool_error(self, error, *, run_id: UUID, **kwargs: Any):
+        entry = self._tool_started.pop(run_id, None)
+        ERRORS.inc(component="tool")
+        if entry is not None:
+            TOOL_LATENCY.observe(time.perf_counter() - entry[1], tool=entry[0])
@@ -1,18 +1,38 @@
 # backend/app/api.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Literal
 
-from app.database import get_db
-from app import crud 
+from app.config import settings
+from app.database import get_async_db
+from app import crud_async as crud
+from app.crud import encode_cursor
 from app.schemas import (
-    SessionCreate, SessionResponse, ChatRequest, 
+    SessionCreate, SessionResponse, SessionSummary, ChatRequest, 
     ChatResponse, MessageResponse,
-    MessageCreate
+    MessageCreate, SearchResponse, PaperSearchResponse, PaperResponse
 )
 from app.services import agent_service
+from app.routing import ROUTE_DIRECT
+from app.context import build_history
+from app.tool_cache import tool_cache
+from app.scheduler import agent_scheduler, AdmissionRejected, AdmissionTicket
+from app.persistence import message_writer
+from app.runs import (
+    stream_runs, run_workers, StreamRun, RunQueueFull,
+    agent_events, make_event_id, parse_event_id
+)
+from app.singleflight import ReplayExpired
+from app.search import search_messages, search_sessions, is_query_syntax_error
+from app.papers import paper_store, search_papers, get_paper, count_papers
+from app.blobs import TOOL_RESULT_MODES, project_tool_results, load_blobs
+from app.retention import list_archives, restore_session
+from app.transfer import export_ndjson, import_ndjson, zstd_compress, zstd_decompress_if_needed
+import asyncio
 import json
+import time
 
 import logging
 
@@ -20,48 +40,200 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
+ToolResultMode = Literal[TOOL_RESULT_MODES]
+
+def tool_results_query():
+    return Query("none", description="工具结果投影：none不返回，refs返回blob引用，full返回完整内容")
+
+def format_sse(chunk: dict, event_id: Optional[str] = None) -> str:
+    """将事件块编码为SSE格式，事件类型写入event字段，可选的事件ID写入id字段"""
+    event_type = chunk.get("type", "token")
+    id_line = f"id: {event_id}\n" if event_id else ""
+    return f"{id_line}event: {event_type}\ndata: {json.dumps(chunk)}\n\n"
+
+def stream_run_response(run: StreamRun, start: int = 0) -> StreamingResponse:
+    """从第start个事件开始，将运行的事件以SSE发送给客户端
+    
+    客户端断开后运行继续执行；交互式运行在宽限期内无人重连时被取消。
+    """
+    async def events():
+        stream_runs.subscribe(run)
+        subscription = run.broadcast.subscribe_indexed(start)
+        try:
+            async for index, chunk in subscription:
+                yield format_sse(chunk, make_event_id(run.id, index))
+        except ReplayExpired as e:
+            logger.warning(f"续传失败: {e}")
+            yield format_sse({'type': 'error', 'content': '错误: 断线时间过长，无法续传', 'is_final': True})
+        finally:
+            await subscription.aclose()
+            stream_runs.unsubscribe(run, settings.stream_cancel_grace_seconds)
+        # 确保发送结束标记
+        yield "data: [DONE]\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            "X-Run-Id": run.id,
+            "Access-Control-Allow-Origin": "*"  # 允许跨域
+        }
+    )
+
+def resume_stream(last_event_id: str, run_id: Optional[str] = None) -> StreamingResponse:
+    """按Last-Event-ID续传流式运行，不重新调用模型"""
+    try:
+        event_run_id, index = parse_event_id(last_event_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if run_id and event_run_id != run_id:
+        raise HTTPException(status_code=400, detail="Last-Event-ID与运行ID不匹配")
+    run = stream_runs.get(event_run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="流式运行不存在或回放缓冲区已过期")
+    if index + 1 < run.broadcast.offset:
+        raise HTTPException(status_code=410, detail="断线时间过长，所需事件已移出回放缓冲区")
+    logger.info(f"续传流式运行 {run.id}，从事件 {index + 1} 开始")
+    return stream_run_response(run, index + 1)
+
+async def admit_agent_run(session_id: Optional[str]) -> AdmissionTicket:
+    """申请Agent运行资格，过载时快速返回429/503并附带Retry-After"""
+    try:
+        return await agent_scheduler.acquire(session_id)
+    except AdmissionRejected as e:
+        logger.warning(f"请求被拒绝({e.status_code}): {e.detail}")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
 # ====================== 会话管理 ======================
 
 @router.post("/sessions", response_model=SessionResponse)
 async def create_session(
     session_data: SessionCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建新的聊天会话"""
-    session = crud.create_session(db, session_data)
+    session = await crud.create_session(db, session_data)
     return session
 
 @router.get("/sessions", response_model=List[SessionResponse])
 async def get_sessions(
-    db: Session = Depends(get_db)
+    tool_results: ToolResultMode = tool_results_query(),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取所有聊天会话"""
-    sessions = crud.get_all_sessions(db)
+    sessions = await crud.get_all_sessions(db)
+    await project_tool_results(db, [m for session in sessions for m in session.messages], tool_results)
     return sessions
 
+@router.get("/sessions/summary", response_model=List[SessionSummary])
+async def get_session_summaries(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    before: Optional[str] = Query(None, description="返回该游标之后（更早更新）的会话"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取会话摘要列表（消息数、最后一条消息预览和时间），不加载消息内容
+    
+    支持limit/offset分页，或使用响应头X-Cursor-Before作为before游标翻页。
+    """
+    try:
+        summaries, has_more = await crud.get_session_summaries(
+            db, limit=limit, offset=offset, before=before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if summaries:
+        last = summaries[-1]
+        response.headers["X-Cursor-Before"] = encode_cursor(last.updated_at, last.id)
+    response.headers["X-Has-More"] = "true" if has_more else "false"
+    return summaries
+
+@router.get("/sessions/export")
+async def export_sessions(
+    compress: Optional[Literal["zstd"]] = Query(None, description="zstd: 输出zstd压缩流"),
+    include_inactive: bool = Query(False, description="是否包含已删除的会话")
+):
+    """以NDJSON流导出全部会话和消息（恒定内存）"""
+    body = export_ndjson(include_inactive=include_inactive)
+    filename = "sessions.ndjson"
+    media_type = "application/x-ndjson"
+    if compress == "zstd":
+        body = zstd_compress(body)
+        filename += ".zst"
+        media_type = "application/zstd"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/sessions/import")
+async def import_sessions(request: Request):
+    """从NDJSON流（可为zstd压缩）批量导入会话和消息，已存在的ID跳过"""
+    content_type = request.headers.get("content-type", "")
+    compressed = True if "zstd" in content_type else None
+    try:
+        counts = await import_ndjson(zstd_decompress_if_needed(request.stream(), compressed))
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"导入数据格式错误: {e}")
+    return counts
+
+@router.get("/sessions/archived")
+async def get_archived_sessions():
+    """列出已归档（从数据库移出）的会话"""
+    return await asyncio.to_thread(list_archives)
+
+@router.post("/sessions/{session_id}/restore")
+async def restore_archived_session(session_id: str):
+    """从归档文件恢复会话"""
+    try:
+        counts = await restore_session(session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Archived session not found")
+    return {"session_id": session_id, **counts}
+
 @router.get("/sessions/{session_id}", response_model=SessionResponse)
 async def get_session(
     session_id: str,
-    db: Session = Depends(get_db)
+    tool_results: ToolResultMode = tool_results_query(),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取特定会话"""
-    session = crud.get_session(db, session_id)
+    session = await crud.get_session(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # 获取会话消息
-    messages = crud.get_messages(db, session_id)
-    session.messages = messages
+    # 获取会话消息（异步会话中不能对关系属性赋值/懒加载，直接组装响应）
+    await message_writer.sync(session_id)
+    messages = await project_tool_results(db, await crud.get_messages(db, session_id), tool_results)
     
-    return session
+    return SessionResponse(
+        id=session.id,
+        title=session.title,
+        created_at=session.created_at,
+        updated_at=session.updated_at,
+        is_active=session.is_active,
+        messages=[MessageResponse.model_validate(m) for m in messages]
+    )
 
 @router.delete("/sessions/{session_id}")
 async def delete_session(
     session_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除会话"""
-    success = crud.delete_session(db, session_id)
+    success = await crud.delete_session(db, session_id)
     if not success:
         raise HTTPException(status_code=404, detail="Session not found")
     return {"message": "Session deleted"}
@@ -69,19 +241,91 @@ async def delete_session(
 @router.get("/sessions/{session_id}/messages", response_model=List[MessageResponse])
 async def get_session_messages(
     session_id: str,
-    db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = Query(None, description="返回该游标之前（更早）的消息"),
+    after: Optional[str] = Query(None, description="返回该游标之后（更新）的消息"),
+    order: Literal["asc", "desc"] = Query("asc", description="desc为最新在前"),
+    tool_results: ToolResultMode = tool_results_query(),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """游标分页获取会话消息
+    
+    默认返回最近的limit条消息（按时间正序）。翻页游标通过响应头返回：
+    X-Cursor-Before（本页最早一条，用于加载更早消息）、X-Cursor-After（本页最新一条）、X-Has-More。
+    工具结果默认不返回，需要时用 tool_results=refs/full 请求，或按引用单独获取。
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="before和after不能同时指定")
+    await message_writer.sync(session_id)
+    try:
+        messages, has_more = await crud.get_messages_page(
+            db, session_id,
+            limit=limit,
+            before=before,
+            after=after,
+            newest_first=(order == "desc")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if messages:
+        oldest, newest = (messages[-1], messages[0]) if order == "desc" else (messages[0], messages[-1])
+        response.headers["X-Cursor-Before"] = encode_cursor(oldest.created_at, oldest.id)
+        response.headers["X-Cursor-After"] = encode_cursor(newest.created_at, newest.id)
+    response.headers["X-Has-More"] = "true" if has_more else "false"
+    return await project_tool_results(db, messages, tool_results)
+
+@router.get("/tool-results/{digest}")
+async def get_tool_result(
+    digest: str,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取会话的所有消息"""
-    messages = crud.get_messages(db, session_id)
-    return messages
+    """按blob引用（内容哈希）获取完整工具结果"""
+    payload = (await load_blobs(db, [digest])).get(digest)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Tool result not found")
+    return {"hash": digest, "content": payload}
+
+# ====================== 搜索 ======================
+
+@router.get("/search", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200, description="检索词，空格分隔的多个词为AND关系"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    session_id: Optional[str] = Query(None, description="仅检索该会话"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """全文检索聊天记录（SQLite FTS5，按BM25相关度排序，附带高亮片段）
+    
+    第一页同时返回标题匹配的会话；通过next_offset翻页。
+    """
+    query = " ".join(q.split())
+    if not query:
+        raise HTTPException(status_code=400, detail="检索词不能为空")
+    try:
+        messages = await search_messages(db, query, limit, offset, session_id)
+        sessions = await search_sessions(db, query, limit) if offset == 0 and not session_id else []
+    except OperationalError as e:
+        # 只有FTS5查询语法错误是客户端错误，其余数据库错误按500上报
+        if not is_query_syntax_error(e):
+            raise
+        logger.warning(f"检索词语法错误: {query} - {e.orig}")
+        raise HTTPException(status_code=400, detail="检索词语法错误，请调整检索词")
+    has_more = len(messages) > limit
+    return SearchResponse(
+        query=query,
+        sessions=sessions,
+        messages=messages[:limit],
+        has_more=has_more,
+        next_offset=offset + limit if has_more else None
+    )
 
 # ====================== 消息处理 ======================
 
 @router.post("/message", response_model=ChatResponse)
-async def send_message(
-    chat_request: ChatRequest,
-    db: Session = Depends(get_db)
-):
+async def send_message(chat_request: ChatRequest):
     """发送消息（非流式）"""
     print ()
     print ('*'*80)
@@ -97,125 +341,219 @@ async def send_message(
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id不能为空")
     
-    # 获取历史消息
-    history_messages = crud.get_messages(db, session_id)
-    history = []
-    for msg in history_messages:
-        history.append({
-            "role": msg.role,
-            "content": msg.content,
-            "tool_calls": msg.tool_calls,
-            "tool_results": msg.tool_results
-        })
-    logger.info(f"本会话历史消息数量: {len(history)}")
-    
-    # 保存用户消息
-    logger.info("保存用户消息到数据库")
-    user_message = crud.create_message(db, MessageCreate(
-        session_id=session_id,
-        role="user",
-        content=chat_request.message
-    ))
-    
-    # 使用Agent处理消息
-    logger.info("调用Agent处理消息")
-    agent_response = await agent_service.process_message(
-        chat_request.message, 
-        history
-    )
-    
-    # 保存Assistant消息
-    logger.info("保存Assistant消息到数据库")
-    assistant_message = crud.create_message(db, MessageCreate(
-        session_id=session_id,
-        role="assistant",
-        content=agent_response["content"],
-        tool_calls=agent_response["tool_calls"],
-        tool_results=agent_response["tool_results"]
-    ))
-    logger.info("Assistant消息保存完成")
-    return ChatResponse(
-        session_id=session_id,
-        message=assistant_message,
-        is_complete=True
-    )
+    # 准入控制：全局并发上限 + 同一会话串行处理
+    ticket = await admit_agent_run(session_id)
+    try:
+        # 获取历史消息（按token预算装入，早期消息折叠为摘要）
+        history = await build_history(session_id)
+        logger.info(f"本会话历史消息数量: {len(history)}")
+        
+        # 保存用户消息
+        logger.info("保存用户消息到数据库")
+        await message_writer.submit(MessageCreate(
+            session_id=session_id,
+            role="user",
+            content=chat_request.message
+        ))
+        
+        # 使用Agent处理消息
+        logger.info("调用Agent处理消息")
+        agent_response = await agent_service.process_message(
+            chat_request.message, 
+            history,
+            session_id
+        )
+        
+        # 保存Assistant消息
+        logger.info("保存Assistant消息到数据库")
+        assistant_message = await message_writer.submit(MessageCreate(
+            session_id=session_id,
+            role="assistant",
+            content=agent_response["content"],
+            tool_calls=agent_response["tool_calls"],
+            tool_results=agent_response["tool_results"],
+            meta={"cache_hit": True} if agent_response.get("cached") else (
+                {"route": ROUTE_DIRECT} if agent_response.get("route") == ROUTE_DIRECT else None
+            )
+        ))
+        logger.info("Assistant消息保存完成")
+        # 入库的是blob引用，本轮回复仍返回完整工具结果
+        return ChatResponse(
+            session_id=session_id,
+            message=MessageResponse.model_validate(assistant_message).model_copy(
+                update={"tool_results": agent_response["tool_results"]}
+            ),
+            is_complete=True
+        )
+    finally:
+        ticket.release()
 
 @router.post("/stream")
 async def stream_message_post(
     chat_request: ChatRequest,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """流式发送消息（POST方法）"""
+    """流式发送消息（POST方法）
+    
+    每个事件带有ID（运行ID:序号）。断线后携带Last-Event-ID请求头重发，
+    会从断点续传同一次运行，不会重复保存用户消息或重新调用模型。
+    """
+    request_started = time.perf_counter()
     logger.info("Received streaming chat request via POST")
     logger.info(f"ChatRequest: {chat_request}")
     
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id:
+        return resume_stream(last_event_id)
+    
     if not chat_request.message:
         raise HTTPException(status_code=400, detail="消息不能为空")
     
     # 如果没有session_id，创建新会话
     session_id = chat_request.session_id
     if not session_id:
-        session = crud.create_session(db, SessionCreate(title=chat_request.message[:50]))
+        session = await crud.create_session(db, SessionCreate(title=chat_request.message[:50]))
         session_id = session.id
     
-    # 保存用户消息
-    user_message = crud.create_message(db, MessageCreate(
-        session_id=session_id,
-        role="user",
-        content=chat_request.message
-    ))
-    
-    # 获取历史消息
-    history_messages = crud.get_messages(db, session_id)
-    history = []
-    for msg in history_messages[:-1]:  # 排除刚添加的用户消息
-        history.append({
-            "role": msg.role,
-            "content": msg.content,
-            "tool_calls": msg.tool_calls,
-            "tool_results": msg.tool_results
-        })
-    
-    async def generate():
-        logger.info("Starting stream generation")
-        try:
-            # 流式处理
-            full_content = ""
-            tool_calls = None
-            
-            async for chunk in agent_service.process_stream(
-                chat_request.message, 
-                history
-            ):
-                full_content += chunk["content"]
-                if chunk.get("tool_calls"):
-                    tool_calls = chunk["tool_calls"]
-                
-                yield f"data: {json.dumps(chunk)}\n\n"
-            
-            # 保存完整的Assistant消息
-            if full_content:
-                crud.create_message(db, MessageCreate(
-                    session_id=session_id,
-                    role="assistant",
-                    content=full_content,
-                    tool_calls=tool_calls
-                ))
-                
-        except Exception as e:
-            logger.error(f"流式处理异常: {e}")
-            yield f"data: {json.dumps({'content': f'错误: {str(e)}', 'is_final': True})}\n\n"
-        finally:
-            # 确保发送结束标记
-            yield "data: [DONE]\n\n"
+    # 新的问题取代本会话中进行中的交互式运行（释放会话锁和并发名额）
+    if stream_runs.cancel_session(session_id):
+        logger.info(f"会话 {session_id} 开始新的问题，已取消进行中的运行")
     
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-            "Access-Control-Allow-Origin": "*"  # 允许跨域
-        }
+    # 准入控制在返回响应前完成，过载时直接返回429/503；凭证在运行结束时释放
+    ticket = await admit_agent_run(session_id)
+    try:
+        # 获取历史消息（在保存本条用户消息之前）
+        history = await build_history(session_id)
+        
+        # 保存用户消息
+        await message_writer.submit(MessageCreate(
+            session_id=session_id,
+            role="user",
+            content=chat_request.message
+        ))
+    except BaseException:
+        ticket.release()
+        raise
+    
+    # 在后台运行，事件写入回放缓冲区，不随客户端断开而中止
+    run = stream_runs.create(session_id, chat_request.message)
+    stream_runs.start(run, agent_events(run, history, request_started), ticket)
+    return stream_run_response(run)
+
+@router.get("/stream/{run_id}")
+async def resume_stream_get(
+    run_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Query(None, description="已收到的最后一个事件ID，缺省时从头回放")
+):
+    """订阅/续传流式运行（兼容浏览器EventSource自动重连发送的Last-Event-ID请求头）"""
+    last_event_id = request.headers.get("Last-Event-ID") or last_event_id
+    if not last_event_id:
+        last_event_id = make_event_id(run_id, -1)
+    return resume_stream(last_event_id, run_id)
+
+# ====================== 后台运行 ======================
+
+@router.post("/runs", status_code=202)
+async def submit_run(
+    chat_request: ChatRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """提交后台Agent运行，立即返回运行ID
+    
+    运行在后台工作池中执行，不受客户端断开或代理超时影响，结果保存为会话消息。
+    通过 GET /runs/{run_id} 轮询状态，或 GET /runs/{run_id}/events 订阅SSE事件。
+    """
+    if not chat_request.message:
+        raise HTTPException(status_code=400, detail="消息不能为空")
+    
+    session_id = chat_request.session_id
+    if not session_id:
+        session = await crud.create_session(db, SessionCreate(title=chat_request.message[:50]))
+        session_id = session.id
+    elif not await crud.get_session(db, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    try:
+        run = run_workers.submit(session_id, chat_request.message)
+    except RunQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    logger.info(f"已提交后台运行 {run.id}（会话 {session_id}）")
+    return run.to_dict()
+
+@router.get("/runs/{run_id}")
+async def get_run(run_id: str):
+    """查询运行状态；结束后包含完整回复内容和保存的消息ID"""
+    run = stream_runs.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="运行不存在或已过期")
+    return run.to_dict()
+
+@router.delete("/runs/{run_id}")
+async def cancel_run(run_id: str):
+    """取消运行（流式或后台），已生成的部分回复标记为cancelled后保存"""
+    run = stream_runs.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="运行不存在或已过期")
+    if not stream_runs.cancel(run):
+        raise HTTPException(status_code=409, detail=f"运行已结束（{run.status}）")
+    return {"message": "Run cancelled", "run_id": run.id}
+
+@router.get("/runs/{run_id}/events")
+async def get_run_events(
+    run_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Query(None, description="已收到的最后一个事件ID，缺省时从头回放")
+):
+    """以SSE订阅运行事件（与 /stream/{run_id} 相同，支持Last-Event-ID续传）"""
+    return await resume_stream_get(run_id, request, last_event_id)
+
+# ====================== 运行状态 ======================
+
+@router.get("/scheduler/stats")
+async def get_scheduler_stats():
+    """Agent调度器的运行/排队/拒绝计数，以及各状态的运行数量"""
+    return {**agent_scheduler.stats(), "runs": stream_runs.stats(), "runs_pending": run_workers.pending}
+
+# ====================== 本地论文库 ======================
+
+@router.get("/papers/search", response_model=PaperSearchResponse)
+async def search_local_papers(
+    q: str = Query(..., min_length=1, max_length=200, description="检索词，多个词为OR关系"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """检索本地论文库（arxiv工具返回过的论文，按BM25相关度排序）"""
+    papers = await search_papers(db, q, limit, offset)
+    has_more = len(papers) > limit
+    return PaperSearchResponse(
+        query=q,
+        papers=papers[:limit],
+        has_more=has_more,
+        next_offset=offset + limit if has_more else None
     )
+
+@router.get("/papers/stats")
+async def get_paper_stats(db: AsyncSession = Depends(get_async_db)):
+    """论文库收录数和local_papers工具的命中率"""
+    return {"papers": await count_papers(db), **paper_store.stats()}
+
+@router.get("/papers/{paper_id:path}", response_model=PaperResponse)
+async def get_local_paper(
+    paper_id: str,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取论文详情（含完整摘要）"""
+    paper = await get_paper(db, paper_id)
+    if not paper:
+        raise HTTPException(status_code=404, detail="Paper not found")
+    return paper
+
+# ====================== 工具缓存 ======================
+
+@router.get("/tools/cache/stats")
+async def get_tool_cache_stats():
+    """工具结果缓存的命中/未命中/淘汰计数"""
+    return tool_cache.stats()
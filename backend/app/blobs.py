@@ -0,0 +1,100 @@
+from typing import Any, Dict, Iterable, List, Optional, Set
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+import hashlib
+
+from app.config import settings
+from app.models import ChatMessage, ToolResultBlob, utc_now
+from app.metrics import observe_db
+
+# 工具结果按内容寻址存储：大体积结果（如arXiv返回的论文摘要）以 sha256(原文) 为主键、
+# zstd压缩后存入tool_result_blobs，相同内容只存一份；消息行的tool_results中只保留引用
+#   {"<tool_call_id>": {"$blob": "<sha256>", "size": <原文字节数>}}
+# 小于 tool_result_blob_min_bytes 的结果和非字符串结果仍内联存储，旧数据无需迁移即可读取。
+
+BLOB_REF = "$blob"
+
+# 消息接口的工具结果投影：none不返回，refs返回引用（小结果内联），full返回完整内容
+TOOL_RESULT_MODES = ("none", "refs", "full")
+
+def is_ref(value: Any) -> bool:
+    return isinstance(value, dict) and BLOB_REF in value
+
+def compress(data: bytes) -> bytes:
+    import zstandard
+
+    return zstandard.ZstdCompressor().compress(data)
+
+def decompress(data: bytes) -> bytes:
+    import zstandard
+
+    return zstandard.ZstdDecompressor().decompress(data)
+
+def externalize(
+    tool_results: Optional[Dict[str, Any]],
+    blobs: Dict[str, Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """把大体积结果替换为引用，待写入的blob行按哈希收集到blobs中（同批相同内容只压缩一次）"""
+    if not tool_results:
+        return tool_results
+    stored = {}
+    for key, value in tool_results.items():
+        if isinstance(value, str):
+            raw = value.encode("utf-8")
+            if len(raw) >= settings.tool_result_blob_min_bytes:
+                digest = hashlib.sha256(raw).hexdigest()
+                if digest not in blobs:
+                    blobs[digest] = {"hash": digest, "data": compress(raw), "size": len(raw), "created_at": utc_now()}
+                stored[key] = {BLOB_REF: digest, "size": len(raw)}
+                continue
+        stored[key] = value
+    return stored
+
+def externalize_messages(messages: Iterable[ChatMessage]) -> List[Dict[str, Any]]:
+    """就地替换待插入消息的tool_results，返回需要写入（已存在则忽略）的blob行"""
+    blobs: Dict[str, Dict[str, Any]] = {}
+    for message in messages:
+        message.tool_results = externalize(message.tool_results, blobs)
+    return list(blobs.values())
+
+def referenced_hashes(tool_results_list: Iterable[Optional[Dict[str, Any]]]) -> Set[str]:
+    return {
+        value[BLOB_REF]
+        for tool_results in tool_results_list if tool_results
+        for value in tool_results.values() if is_ref(value)
+    }
+
+def resolve(tool_results: Optional[Dict[str, Any]], payloads: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """用blob内容替换引用（blob缺失时保留引用）"""
+    if not tool_results:
+        return tool_results
+    return {
+        key: payloads.get(value[BLOB_REF], value) if is_ref(value) else value
+        for key, value in tool_results.items()
+    }
+
+@observe_db
+async def load_blobs(db: AsyncSession, hashes: Iterable[str]) -> Dict[str, str]:
+    """批量读取并解压blob，返回 {哈希: 原文}"""
+    hashes = list(hashes)
+    if not hashes:
+        return {}
+    result = await db.execute(
+        select(ToolResultBlob.hash, ToolResultBlob.data).where(ToolResultBlob.hash.in_(hashes))
+    )
+    return {digest: decompress(data).decode("utf-8") for digest, data in result.all()}
+
+async def project_tool_results(db: AsyncSession, messages: List[ChatMessage], mode: str) -> List[ChatMessage]:
+    """按投影方式设置消息的tool_results（只改已加载对象的值，不会写回数据库）"""
+    if mode == "refs":
+        return messages
+    if mode == "none":
+        for message in messages:
+            set_committed_value(message, "tool_results", None)
+        return messages
+    payloads = await load_blobs(db, referenced_hashes(m.tool_results for m in messages))
+    for message in messages:
+        if message.tool_results:
+            set_committed_value(message, "tool_results", resolve(message.tool_results, payloads))
+    return messages
@@ -0,0 +1,79 @@
+from typing import Iterable
+import logging
+import os
+import sqlite3
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Agent状态检查点：每个会话对应一个LangGraph线程（thread_id = 会话ID），线程状态（含工具调用和工具结果）
+# 保存在独立的SQLite文件中（langgraph-checkpoint-sqlite），每轮只向线程追加新的用户消息，
+# Agent能看到之前检索到的论文，不必重复搜索。
+# 会话消息表仍是唯一可信来源：线程与会话历史不一致（回复缓存命中、运行出错或取消、归档恢复、导入等）
+# 或超出token预算时，删除线程并按会话历史（摘要 + 最近消息）重新播种。
+# 每轮结束后只保留线程的最新检查点（SQLite检查点每一步都保存完整状态，不清理时文件按轮数平方增长）。
+
+CHECKPOINT_TABLES = ("checkpoints", "writes")
+
+# 删除线程最新检查点之前的检查点和待写入记录
+PRUNE_SQL = """
+    DELETE FROM {table}
+    WHERE thread_id = :thread_id AND checkpoint_ns = ''
+      AND checkpoint_id < (
+          SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = :thread_id AND checkpoint_ns = ''
+      )
+"""
+
+async def create_checkpointer():
+    """创建SQLite检查点存储；未启用或未安装 langgraph-checkpoint-sqlite 时返回None（每轮回放会话历史）"""
+    if settings.agent_checkpoint_backend != "sqlite":
+        return None
+    try:
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError:
+        logger.warning("未安装 langgraph-checkpoint-sqlite，Agent状态检查点未启用")
+        return None
+
+    conn = await aiosqlite.connect(settings.agent_checkpoint_path)
+    # 多worker共用同一文件时等待写锁而不是报错（setup中会开启WAL）
+    await conn.execute(f"PRAGMA busy_timeout = {int(settings.sqlite_busy_timeout_ms)}")
+    saver = AsyncSqliteSaver(conn)
+    await saver.setup()
+    logger.info(f"Agent状态检查点: {settings.agent_checkpoint_path}")
+    return saver
+
+async def prune_thread(saver, thread_id: str):
+    """只保留线程的最新检查点"""
+    async with saver.lock:
+        for table in reversed(CHECKPOINT_TABLES):
+            await saver.conn.execute(PRUNE_SQL.format(table=table), {"thread_id": thread_id})
+        await saver.conn.commit()
+
+async def close_checkpointer(saver):
+    if saver is not None:
+        await saver.conn.close()
+
+def delete_threads(session_ids: Iterable[str]) -> int:
+    """删除会话对应的线程（硬删除或归档会话时调用，不依赖服务进程），返回删除的检查点数"""
+    session_ids = list(session_ids)
+    path = settings.agent_checkpoint_path
+    if settings.agent_checkpoint_backend != "sqlite" or not session_ids or not os.path.exists(path):
+        return 0
+    conn = sqlite3.connect(path, timeout=settings.sqlite_busy_timeout_ms / 1000)
+    try:
+        deleted = 0
+        with conn:
+            for i in range(0, len(session_ids), 500):
+                chunk = session_ids[i:i+500]
+                placeholders = ", ".join("?" * len(chunk))
+                deleted += conn.execute(f"DELETE FROM checkpoints WHERE thread_id IN ({placeholders})", chunk).rowcount
+                conn.execute(f"DELETE FROM writes WHERE thread_id IN ({placeholders})", chunk)
+        return deleted
+    except sqlite3.OperationalError as e:
+        # 检查点表尚未创建
+        logger.warning(f"删除Agent线程失败: {e}")
+        return 0
+    finally:
+        conn.close()
@@ -13,15 +13,85 @@ class Settings(BaseSettings):
     
     # 数据库配置
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./research_agent.db")
+    async_database_url: str = os.getenv("ASYNC_DATABASE_URL", "")  # 留空则根据database_url推导异步驱动
+    db_auto_create: bool = os.getenv("DB_AUTO_CREATE", "true").lower() == "true"  # 启动时建表；多worker时由主进程统一建表后关闭
+    # 连接池（同步和异步引擎各有一个池，每个worker进程最多占用 2 * (pool_size + max_overflow) 个连接）
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    db_pool_timeout: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # 等待空闲连接的秒数
+    db_pool_recycle: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # 连接最长使用秒数，避免被数据库/代理断开的陈旧连接
+    db_pool_pre_ping: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # 取出连接前探活
+    # SQLite连接参数（每个新连接执行PRAGMA；留空则保持SQLite默认值）
+    sqlite_journal_mode: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")  # WAL下读写互不阻塞，适合多worker
+    sqlite_synchronous: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # WAL模式下NORMAL不会损坏数据库，仅断电时可能丢失最近提交
+    sqlite_busy_timeout_ms: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # 其他进程持有写锁时的等待时间
     
     # 服务器配置
     host: str = os.getenv("HOST", "0.0.0.0")
     port: int = int(os.getenv("PORT", "8000"))
     debug: bool = os.getenv("DEBUG", "true").lower() == "true"
+    workers: int = int(os.getenv("WORKERS", "1"))  # python -m app.main 启动的worker进程数（大于1时不启用reload）
     
     # Agent配置
     agent_temperature: float = float(os.getenv("AGENT_TEMPERATURE", "0.1"))
     agent_max_tokens: int = int(os.getenv("AGENT_MAX_TOKENS", "2000"))
+    history_max_messages: int = int(os.getenv("HISTORY_MAX_MESSAGES", "50"))  # 加载到Agent上下文的最近消息数
+    context_token_budget: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))  # 历史消息（含摘要）的token预算
+    summary_max_tokens: int = int(os.getenv("SUMMARY_MAX_TOKENS", "500"))  # 滚动摘要的最大长度
+    summary_fold_max_messages: int = int(os.getenv("SUMMARY_FOLD_MAX_MESSAGES", "100"))  # 单次折叠进摘要的最大消息数
+    tokenizer_encoding: str = os.getenv("TOKENIZER_ENCODING", "cl100k_base")  # tiktoken编码（近似DeepSeek分词）
+    agent_max_concurrency: int = int(os.getenv("AGENT_MAX_CONCURRENCY", "8"))  # 全局同时运行的Agent数量上限
+    agent_queue_max_size: int = int(os.getenv("AGENT_QUEUE_MAX_SIZE", "32"))  # 等待运行的最大请求数，超出返回429
+    agent_queue_timeout_seconds: float = float(os.getenv("AGENT_QUEUE_TIMEOUT_SECONDS", "30"))  # 排队超时返回503
+    agent_warmup: bool = os.getenv("AGENT_WARMUP", "true").lower() == "true"  # 启动后在后台预热Agent
+    coalesce_requests: bool = os.getenv("COALESCE_REQUESTS", "true").lower() == "true"  # 合并并发的相同请求
+    stream_replay_max_events: int = int(os.getenv("STREAM_REPLAY_MAX_EVENTS", "5000"))  # 每个流式运行保留的可续传事件数
+    stream_replay_ttl_seconds: int = int(os.getenv("STREAM_REPLAY_TTL_SECONDS", "60"))  # 运行结束后回放缓冲区的保留时间
+    stream_cancel_grace_seconds: float = float(os.getenv("STREAM_CANCEL_GRACE_SECONDS", "10"))  # 客户端断开后等待重连的时间，超时取消运行；负数表示不取消
+    run_workers: int = int(os.getenv("RUN_WORKERS", "4"))  # 后台（分离式）Agent运行的工作协程数
+    run_queue_max_size: int = int(os.getenv("RUN_QUEUE_MAX_SIZE", "100"))  # 等待执行的后台运行上限，超出返回429
+    run_result_ttl_seconds: int = int(os.getenv("RUN_RESULT_TTL_SECONDS", "3600"))  # 后台运行结束后状态和事件的保留时间
+    
+    # 快速通道配置（寒暄、翻译/改写上文等不需要工具的消息跳过Agent，直接调用LLM）
+    fast_path_enabled: bool = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+    fast_path_max_tokens: int = int(os.getenv("FAST_PATH_MAX_TOKENS", "512"))  # 快速通道回复的最大长度
+    fast_path_history_messages: int = int(os.getenv("FAST_PATH_HISTORY_MESSAGES", "6"))  # 快速通道携带的最近消息数（不含摘要）
+    fast_path_small_talk_max_chars: int = int(os.getenv("FAST_PATH_SMALL_TALK_MAX_CHARS", "20"))  # 超过该长度的消息不按寒暄处理
+    fast_path_transform_max_chars: int = int(os.getenv("FAST_PATH_TRANSFORM_MAX_CHARS", "8"))  # 不含指代词（上面/这个/it等）时，加工上文的消息不超过该长度才走快速通道
+    
+    # Agent状态检查点配置（每个会话一个LangGraph线程，保留工具调用和结果，每轮只追加新消息）
+    agent_checkpoint_backend: str = os.getenv("AGENT_CHECKPOINT_BACKEND", "sqlite")  # 留空关闭（每轮回放会话历史）
+    agent_checkpoint_path: str = os.getenv("AGENT_CHECKPOINT_PATH", "./agent_checkpoints.db")
+    agent_checkpoint_token_budget: int = int(os.getenv("AGENT_CHECKPOINT_TOKEN_BUDGET", "16000"))  # 线程超出该token数时按会话历史（摘要+最近消息）重建
+    
+    # 消息持久化配置（组提交）
+    persist_write_behind: bool = os.getenv("PERSIST_WRITE_BEHIND", "true").lower() == "true"
+    persist_batch_size: int = int(os.getenv("PERSIST_BATCH_SIZE", "64"))  # 达到该条数立即提交
+    persist_flush_interval_ms: int = int(os.getenv("PERSIST_FLUSH_INTERVAL_MS", "10"))  # 最长攒批时间
+    bulk_batch_size: int = int(os.getenv("BULK_BATCH_SIZE", "1000"))  # 导入导出时每批处理的行数
+    tool_result_blob_min_bytes: int = int(os.getenv("TOOL_RESULT_BLOB_MIN_BYTES", "512"))  # 达到该大小的工具结果压缩后按内容哈希单独存储
+    
+    # 数据保留配置（python -m app.retention 手动执行，或开启后在服务进程内定期执行）
+    retention_enabled: bool = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+    retention_interval_seconds: int = int(os.getenv("RETENTION_INTERVAL_SECONDS", "21600"))  # 定期执行间隔
+    retention_purge_after_days: int = int(os.getenv("RETENTION_PURGE_AFTER_DAYS", "30"))  # 软删除会话保留天数，之后硬删除；0表示不清理
+    retention_archive_after_days: int = int(os.getenv("RETENTION_ARCHIVE_AFTER_DAYS", "0"))  # 超过该天数未更新的会话归档到文件；0表示不归档
+    retention_archive_dir: str = os.getenv("RETENTION_ARCHIVE_DIR", "./archives")  # 归档文件目录
+    
+    # 工具缓存配置
+    tool_cache_enabled: bool = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+    tool_cache_ttl_seconds: int = int(os.getenv("TOOL_CACHE_TTL_SECONDS", "86400"))  # 工具结果缓存有效期
+    tool_cache_max_entries: int = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "5000"))  # 超出后按最近访问时间淘汰
+    
+    # 本地论文库配置（收录arxiv工具返回的论文，供Agent优先检索）
+    paper_store_enabled: bool = os.getenv("PAPER_STORE_ENABLED", "true").lower() == "true"
+    paper_search_top_k: int = int(os.getenv("PAPER_SEARCH_TOP_K", "3"))  # local_papers工具每次返回的论文数
+    
+    # 回复缓存配置（默认关闭，适用于低温度等确定性设置）
+    response_cache_backend: str = os.getenv("RESPONSE_CACHE_BACKEND", "")  # 留空关闭；memory 或 sqlite
+    response_cache_ttl_seconds: int = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+    response_cache_max_entries: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    response_cache_path: str = os.getenv("RESPONSE_CACHE_PATH", "./response_cache.db")  # sqlite后端的文件路径
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,116 @@
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime
+
+from app import crud_async as crud
+from app.crud import encode_cursor
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import ChatMessage, ConversationSummary
+from app.tokens import count_tokens
+from app.services import agent_service
+from app.persistence import message_writer
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 尚无摘要时从会话的第一条消息开始折叠
+FOLD_START = encode_cursor(datetime.min, "")
+
+def _message_tokens(message: ChatMessage) -> int:
+    """消息的token数（旧数据未记录时现场计算）"""
+    return message.tokens or count_tokens(message.content)
+
+def _to_history(message: ChatMessage) -> Dict:
+    return {
+        "role": message.role,
+        "content": message.content,
+        "tool_calls": message.tool_calls,
+        "tool_results": message.tool_results
+    }
+
+async def _fold_until(
+    session_id: str,
+    summary: Optional[ConversationSummary],
+    start: ChatMessage
+) -> Tuple[str, int]:
+    """按时间正序把摘要已覆盖位置之后、窗口起点之前的消息分批折叠进摘要，直到追上窗口起点
+
+    每批先读出消息并释放数据库会话，再调用LLM生成摘要，最后用新会话保存，LLM调用期间不占用数据库连接。
+    摘要生成失败时停止，下次组装上下文时从已保存的位置继续。返回 (摘要内容, 摘要token数)。
+    """
+    content = summary.content if summary else ""
+    tokens = summary.tokens if summary else 0
+    covered = FOLD_START
+    if summary and summary.covered_until_at is not None:
+        covered = encode_cursor(summary.covered_until_at, summary.covered_until_id)
+    boundary = (start.created_at, start.id)
+    limit = max(1, settings.summary_fold_max_messages)
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            page, has_more = await crud.get_messages_page(db, session_id, limit=limit, after=covered)
+        unfolded = [m for m in page if (m.created_at, m.id) < boundary]
+        if not unfolded:
+            return content, tokens
+        try:
+            folded = await agent_service.summarize(content, [_to_history(m) for m in unfolded])
+        except Exception as e:
+            logger.error(f"生成会话摘要失败: {e}")
+            return content, tokens
+        async with AsyncSessionLocal() as db:
+            saved = await crud.save_conversation_summary(db, session_id, folded, unfolded[-1])
+        content, tokens = saved.content, saved.tokens
+        covered = encode_cursor(unfolded[-1].created_at, unfolded[-1].id)
+        logger.info(f"会话 {session_id} 摘要已更新，折叠消息 {len(unfolded)} 条")
+        # 本批已到达窗口起点，或之后没有更多消息
+        if len(unfolded) < len(page) or not has_more:
+            return content, tokens
+
+async def build_history(session_id: str) -> List[Dict]:
+    """组装Agent上下文历史
+
+    从最新消息开始装入token预算（context_token_budget），预算之外的早期消息
+    折叠进按会话保存的滚动摘要；摘要只在有新消息滑出窗口时才重新生成。
+    """
+    await message_writer.sync(session_id)
+    async with AsyncSessionLocal() as db:
+        recent = await crud.get_latest_messages(db, session_id, settings.history_max_messages)
+        if not recent:
+            return []
+        summary = await crud.get_conversation_summary(db, session_id)
+    covered = None
+    if summary and summary.covered_until_at is not None:
+        covered = (summary.covered_until_at, summary.covered_until_id)
+
+    summary_tokens = summary.tokens if summary else 0
+    budget = max(settings.context_token_budget - summary_tokens, 0)
+
+    # 从最新消息往前装入预算（至少保留最新一条），已被摘要覆盖的消息不再重复
+    window = []
+    used = 0
+    for message in reversed(recent):
+        if covered and (message.created_at, message.id) <= covered:
+            break
+        tokens = _message_tokens(message)
+        if window and used + tokens > budget:
+            break
+        window.append(message)
+        used += tokens
+    window.reverse()
+
+    # 窗口之前仍未折叠的消息并入摘要
+    content = summary.content if summary else ""
+    if window:
+        content, summary_tokens = await _fold_until(session_id, summary, window[0])
+
+    history = []
+    if content:
+        history.append({
+            "role": "system",
+            "content": f"以下是本会话早期对话的摘要：\n{content}",
+            "tool_calls": None,
+            "tool_results": None
+        })
+    history.extend(_to_history(m) for m in window)
+    logger.info(f"上下文历史: 摘要{summary_tokens}token + {len(window)}条消息/{used}token")
+    return history
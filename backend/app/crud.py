@@ -1,12 +1,18 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+from sqlalchemy import select, update, insert, and_, or_, func
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
+import base64
 
-from app.models import ChatSession, ChatMessage
-from app.schemas import SessionCreate, MessageCreate
+from app.models import ChatSession, ChatMessage, ConversationSummary, ToolResultBlob, generate_uuid, utc_now
+from app.blobs import externalize_messages
+from app.schemas import SessionCreate, MessageCreate, SessionSummary
+from app.tokens import count_tokens
+from app.metrics import observe_db
 
 # ====================== 会话操作函数 ======================
 
+@observe_db
 def create_session(db: Session, session_data: SessionCreate) -> ChatSession:
     """创建新的聊天会话"""
     db_session = ChatSession(
@@ -19,6 +25,7 @@ def create_session(db: Session, session_data: SessionCreate) -> ChatSession:
     
     return db_session
 
+@observe_db
 def get_session(db: Session, session_id: str) -> Optional[ChatSession]:
     """获取聊天会话"""
     return db.query(ChatSession).filter(
@@ -26,12 +33,85 @@ def get_session(db: Session, session_id: str) -> Optional[ChatSession]:
         ChatSession.is_active == True
     ).first()
 
+@observe_db
 def get_all_sessions(db: Session) -> List[ChatSession]:
     """获取所有聊天会话"""
     return db.query(ChatSession).filter(
         ChatSession.is_active == True
     ).order_by(ChatSession.updated_at.desc()).all()
 
+SUMMARY_PREVIEW_LENGTH = 100
+
+def build_session_summaries_query(
+    limit: int,
+    offset: int = 0,
+    before: Optional[str] = None
+):
+    """构造会话摘要查询：一条SQL取出会话及其消息数、最后一条消息预览和时间
+    
+    统计项均为按(session_id, created_at, id)索引求值的关联子查询，只对当前页的会话计算。
+    """
+    message_count = select(func.count(ChatMessage.id)).where(
+        ChatMessage.session_id == ChatSession.id
+    ).correlate(ChatSession).scalar_subquery()
+    last_message = select(ChatMessage).where(
+        ChatMessage.session_id == ChatSession.id
+    ).correlate(ChatSession).order_by(
+        ChatMessage.created_at.desc(), ChatMessage.id.desc()
+    ).limit(1)
+    last_message_preview = last_message.with_only_columns(
+        func.substr(ChatMessage.content, 1, SUMMARY_PREVIEW_LENGTH)
+    ).scalar_subquery()
+    last_message_at = last_message.with_only_columns(
+        ChatMessage.created_at
+    ).scalar_subquery()
+    
+    stmt = select(
+        ChatSession,
+        message_count.label("message_count"),
+        last_message_preview.label("last_message_preview"),
+        last_message_at.label("last_message_at")
+    ).where(ChatSession.is_active == True)
+    if before:
+        updated_at, session_id = decode_cursor(before)
+        stmt = stmt.where(or_(
+            ChatSession.updated_at < updated_at,
+            and_(ChatSession.updated_at == updated_at, ChatSession.id < session_id)
+        ))
+    # 多取一条用于判断是否还有更多
+    return stmt.order_by(
+        ChatSession.updated_at.desc(), ChatSession.id.desc()
+    ).offset(offset).limit(limit + 1)
+
+def to_session_summaries(rows, limit: int) -> Tuple[List[SessionSummary], bool]:
+    """将摘要查询结果转换为SessionSummary列表，返回 (摘要列表, 是否还有更多)"""
+    summaries = [
+        SessionSummary(
+            id=session.id,
+            title=session.title,
+            created_at=session.created_at,
+            updated_at=session.updated_at,
+            is_active=session.is_active,
+            message_count=count or 0,
+            last_message_preview=preview,
+            last_message_at=last_at
+        )
+        for session, count, preview, last_at in rows[:limit]
+    ]
+    return summaries, len(rows) > limit
+
+@observe_db
+def get_session_summaries(
+    db: Session,
+    limit: int = 50,
+    offset: int = 0,
+    before: Optional[str] = None
+) -> Tuple[List[SessionSummary], bool]:
+    """获取会话摘要列表（不加载消息）"""
+    rows = db.execute(build_session_summaries_query(limit, offset, before)).all()
+    return to_session_summaries(rows, limit)
+
+@observe_db
 def update_session(db: Session, session_id: str, update_data: Dict[str, Any]) -> Optional[ChatSession]:
     """更新会话信息"""
     session = get_session(db, session_id)
@@ -44,6 +124,7 @@ def update_session(db: Session, session_id: str, update_data: Dict[str, Any]) ->
         db.refresh(session)
     return session
 
+@observe_db
 def delete_session(db: Session, session_id: str) -> bool:
     """删除聊天会话（软删除）"""
     session = get_session(db, session_id)
@@ -54,8 +135,67 @@ def delete_session(db: Session, session_id: str) -> bool:
         return True
     return False
 
+# ====================== 分页游标 ======================
+
+def encode_cursor(timestamp: datetime, record_id: str) -> str:
+    """将 (时间戳, id) 编码为不透明游标"""
+    raw = f"{timestamp.isoformat()}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """解析游标，格式错误时抛出ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, message_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), message_id
+    except Exception as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
+
+def build_messages_page_query(
+    session_id: str,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None
+):
+    """构造键集分页查询，返回 (查询语句, 是否按时间正序)
+    
+    多取一条用于判断是否还有更多；无游标或before游标时倒序扫描索引以取到最新的消息。
+    """
+    stmt = select(ChatMessage).where(ChatMessage.session_id == session_id)
+    if after:
+        created_at, message_id = decode_cursor(after)
+        stmt = stmt.where(or_(
+            ChatMessage.created_at > created_at,
+            and_(ChatMessage.created_at == created_at, ChatMessage.id > message_id)
+        )).order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
+        ascending = True
+    else:
+        if before:
+            created_at, message_id = decode_cursor(before)
+            stmt = stmt.where(or_(
+                ChatMessage.created_at < created_at,
+                and_(ChatMessage.created_at == created_at, ChatMessage.id < message_id)
+            ))
+        stmt = stmt.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        ascending = False
+    return stmt.limit(limit + 1), ascending
+
+def order_messages_page(
+    rows: List[ChatMessage],
+    limit: int,
+    ascending: bool,
+    newest_first: bool
+) -> Tuple[List[ChatMessage], bool]:
+    """截取一页结果并按要求的方向排序"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if ascending == newest_first:
+        rows.reverse()
+    return rows, has_more
+
 # ====================== 消息操作函数 ======================
 
+@observe_db
 def create_message(db: Session, message_data: MessageCreate) -> ChatMessage:
     """创建消息"""
     # 确保会话存在
@@ -69,9 +209,14 @@ def create_message(db: Session, message_data: MessageCreate) -> ChatMessage:
         role=message_data.role,
         content=message_data.content,
         tool_calls=message_data.tool_calls,
-        tool_results=message_data.tool_results
+        tool_results=message_data.tool_results,
+        meta=message_data.meta,
+        tokens=count_tokens(message_data.content)
     )
     
+    blob_rows = externalize_messages([db_message])
+    if blob_rows:
+        db.execute(insert_ignore(db, ToolResultBlob), blob_rows)
     db.add(db_message)
     
     # 更新会话时间
@@ -81,18 +226,39 @@ def create_message(db: Session, message_data: MessageCreate) -> ChatMessage:
     
     return db_message
 
+@observe_db
 def get_messages(db: Session, session_id: str, limit: int = 50) -> List[ChatMessage]:
-    """获取会话消息"""
-    return db.query(ChatMessage).filter(
-        ChatMessage.session_id == session_id
-    ).order_by(ChatMessage.created_at.asc()).limit(limit).all()
+    """获取会话消息（最近的limit条，按时间正序）"""
+    return get_latest_messages(db, session_id, limit)
+
+@observe_db
+def get_latest_messages(db: Session, session_id: str, limit: int = 50) -> List[ChatMessage]:
+    """获取会话最近的N条消息（按时间正序），走复合索引，耗时与会话长度无关"""
+    messages, _ = get_messages_page(db, session_id, limit=limit)
+    return messages
 
+@observe_db
+def get_messages_page(
+    db: Session,
+    session_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    newest_first: bool = False
+) -> Tuple[List[ChatMessage], bool]:
+    """游标分页获取会话消息，返回 (消息列表, 是否还有更多)"""
+    stmt, ascending = build_messages_page_query(session_id, limit, before, after)
+    rows = list(db.execute(stmt).scalars().all())
+    return order_messages_page(rows, limit, ascending, newest_first)
+
+@observe_db
 def get_message(db: Session, message_id: str) -> Optional[ChatMessage]:
     """获取特定消息"""
     return db.query(ChatMessage).filter(
         ChatMessage.id == message_id
     ).first()
 
+@observe_db
 def delete_messages(db: Session, session_id: str) -> int:
     """删除会话的所有消息"""
     result = db.query(ChatMessage).filter(
@@ -101,16 +267,111 @@ def delete_messages(db: Session, session_id: str) -> int:
     db.commit()
     return result
 
+# ====================== 会话摘要函数 ======================
+
+@observe_db
+def get_conversation_summary(db: Session, session_id: str) -> Optional[ConversationSummary]:
+    """获取会话的滚动摘要"""
+    return db.query(ConversationSummary).filter(
+        ConversationSummary.session_id == session_id
+    ).first()
+
+@observe_db
+def save_conversation_summary(
+    db: Session,
+    session_id: str,
+    content: str,
+    covered_until: ChatMessage
+) -> ConversationSummary:
+    """保存会话的滚动摘要，covered_until为摘要已覆盖到的最后一条消息"""
+    summary = get_conversation_summary(db, session_id)
+    if not summary:
+        summary = ConversationSummary(session_id=session_id)
+        db.add(summary)
+    summary.content = content
+    summary.tokens = count_tokens(content)
+    summary.covered_until_at = covered_until.created_at
+    summary.covered_until_id = covered_until.id
+    db.commit()
+    db.refresh(summary)
+    return summary
+
 # ====================== 批量操作函数 ======================
 
+def build_message_rows(
+    messages_data: List[MessageCreate],
+    session_remap: Optional[Dict[str, str]] = None
+) -> List[ChatMessage]:
+    """构造待批量插入的消息行，时间戳按提交顺序严格递增"""
+    session_remap = session_remap or {}
+    base = utc_now()
+    return [
+        ChatMessage(
+            id=generate_uuid(),
+            session_id=session_remap.get(data.session_id, data.session_id),
+            role=data.role,
+            content=data.content,
+            tool_calls=data.tool_calls,
+            tool_results=data.tool_results,
+            meta=data.meta,
+            tokens=count_tokens(data.content),
+            created_at=base + timedelta(microseconds=i)
+        )
+        for i, data in enumerate(messages_data)
+    ]
+
+def insert_ignore(db, model):
+    """批量插入语句，已存在的主键跳过（导入可重复执行，相同内容的blob只存一份）"""
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(model).on_conflict_do_nothing()
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(model).on_conflict_do_nothing()
+    if dialect == "mysql":
+        return insert(model).prefix_with("IGNORE")
+    return insert(model)
+
+def active_session_ids_query(session_ids):
+    """查询给定ID中仍有效的会话"""
+    return select(ChatSession.id).where(
+        ChatSession.id.in_(session_ids),
+        ChatSession.is_active == True
+    )
+
+def touch_sessions_query(session_ids):
+    """批量更新会话时间"""
+    return update(ChatSession).where(
+        ChatSession.id.in_(session_ids)
+    ).values(updated_at=datetime.now())
+
+@observe_db
 def create_messages_batch(db: Session, messages_data: List[MessageCreate]) -> List[ChatMessage]:
-    """批量创建消息"""
-    messages = []
-    for message_data in messages_data:
-        message = create_message(db, message_data)
-        messages.append(message)
+    """批量创建消息（单个事务：一次批量插入 + 一次会话时间更新）"""
+    if not messages_data:
+        return []
+    session_ids = {data.session_id for data in messages_data}
+    existing = set(db.execute(active_session_ids_query(session_ids)).scalars().all())
+    
+    # 与create_message一致：会话不存在时创建新会话
+    session_remap = {}
+    for session_id in session_ids - existing:
+        new_session = ChatSession(id=generate_uuid(), title="新对话")
+        db.add(new_session)
+        session_remap[session_id] = new_session.id
+    
+    messages = build_message_rows(messages_data, session_remap)
+    blob_rows = externalize_messages(messages)
+    if blob_rows:
+        db.execute(insert_ignore(db, ToolResultBlob), blob_rows)
+    db.add_all(messages)
+    if existing:
+        db.execute(touch_sessions_query(existing))
+    db.commit()
     return messages
 
+@observe_db
 def get_recent_sessions(db: Session, limit: int = 10) -> List[ChatSession]:
     """获取最近活跃的会话"""
     return db.query(ChatSession).filter(
@@ -0,0 +1,245 @@
+from typing import List, Optional, Dict, Any, Tuple
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from datetime import datetime
+
+from app.models import ChatSession, ChatMessage, ConversationSummary, ToolResultBlob, generate_uuid
+from app.blobs import externalize_messages
+from app.schemas import SessionCreate, MessageCreate, SessionSummary
+from app.tokens import count_tokens
+from app.metrics import observe_db
+from app.crud import (
+    build_messages_page_query, order_messages_page,
+    build_session_summaries_query, to_session_summaries,
+    build_message_rows, active_session_ids_query, touch_sessions_query, insert_ignore
+)
+
+# 与 app.crud 一一对应的异步版本，供API路由使用
+
+# ====================== 会话操作函数 ======================
+
+@observe_db
+async def create_session(db: AsyncSession, session_data: SessionCreate) -> ChatSession:
+    """创建新的聊天会话"""
+    db_session = ChatSession(
+        title=session_data.title
+    )
+
+    db.add(db_session)
+    await db.commit()
+    await db.refresh(db_session)
+    # 新会话没有消息，直接标记为已加载，避免序列化时触发懒加载
+    set_committed_value(db_session, "messages", [])
+
+    return db_session
+
+@observe_db
+async def get_session(db: AsyncSession, session_id: str) -> Optional[ChatSession]:
+    """获取聊天会话"""
+    result = await db.execute(
+        select(ChatSession).where(
+            ChatSession.id == session_id,
+            ChatSession.is_active == True
+        )
+    )
+    return result.scalars().first()
+
+@observe_db
+async def get_all_sessions(db: AsyncSession) -> List[ChatSession]:
+    """获取所有聊天会话"""
+    # 异步会话不支持懒加载，消息需预先加载
+    result = await db.execute(
+        select(ChatSession).where(
+            ChatSession.is_active == True
+        ).options(
+            selectinload(ChatSession.messages)
+        ).order_by(ChatSession.updated_at.desc())
+    )
+    return list(result.scalars().all())
+
+@observe_db
+async def get_session_summaries(
+    db: AsyncSession,
+    limit: int = 50,
+    offset: int = 0,
+    before: Optional[str] = None
+) -> Tuple[List[SessionSummary], bool]:
+    """获取会话摘要列表（不加载消息）"""
+    result = await db.execute(build_session_summaries_query(limit, offset, before))
+    return to_session_summaries(result.all(), limit)
+
+@observe_db
+async def update_session(db: AsyncSession, session_id: str, update_data: Dict[str, Any]) -> Optional[ChatSession]:
+    """更新会话信息"""
+    session = await get_session(db, session_id)
+    if session:
+        for key, value in update_data.items():
+            if hasattr(session, key):
+                setattr(session, key, value)
+        session.updated_at = datetime.now()
+        await db.commit()
+        await db.refresh(session)
+    return session
+
+@observe_db
+async def delete_session(db: AsyncSession, session_id: str) -> bool:
+    """删除聊天会话（软删除）"""
+    session = await get_session(db, session_id)
+    if session:
+        session.is_active = False
+        session.updated_at = datetime.now()
+        await db.commit()
+        return True
+    return False
+
+# ====================== 消息操作函数 ======================
+
+@observe_db
+async def create_message(db: AsyncSession, message_data: MessageCreate) -> ChatMessage:
+    """创建消息"""
+    # 确保会话存在
+    session = await get_session(db, message_data.session_id)
+    if not session:
+        # 创建新会话
+        session = await create_session(db, SessionCreate(title="新对话"))
+
+    db_message = ChatMessage(
+        session_id=session.id,
+        role=message_data.role,
+        content=message_data.content,
+        tool_calls=message_data.tool_calls,
+        tool_results=message_data.tool_results,
+        meta=message_data.meta,
+        tokens=count_tokens(message_data.content)
+    )
+
+    blob_rows = externalize_messages([db_message])
+    if blob_rows:
+        await db.execute(insert_ignore(db, ToolResultBlob), blob_rows)
+    db.add(db_message)
+
+    # 更新会话时间
+    session.updated_at = datetime.now()
+    await db.commit()
+    await db.refresh(db_message)
+
+    return db_message
+
+@observe_db
+async def get_messages(db: AsyncSession, session_id: str, limit: int = 50) -> List[ChatMessage]:
+    """获取会话消息（最近的limit条，按时间正序）"""
+    return await get_latest_messages(db, session_id, limit)
+
+@observe_db
+async def get_latest_messages(db: AsyncSession, session_id: str, limit: int = 50) -> List[ChatMessage]:
+    """获取会话最近的N条消息（按时间正序），走复合索引，耗时与会话长度无关"""
+    messages, _ = await get_messages_page(db, session_id, limit=limit)
+    return messages
+
+@observe_db
+async def get_messages_page(
+    db: AsyncSession,
+    session_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    newest_first: bool = False
+) -> Tuple[List[ChatMessage], bool]:
+    """游标分页获取会话消息，返回 (消息列表, 是否还有更多)"""
+    stmt, ascending = build_messages_page_query(session_id, limit, before, after)
+    result = await db.execute(stmt)
+    return order_messages_page(list(result.scalars().all()), limit, ascending, newest_first)
+
+@observe_db
+async def get_message(db: AsyncSession, message_id: str) -> Optional[ChatMessage]:
+    """获取特定消息"""
+    result = await db.execute(
+        select(ChatMessage).where(
+            ChatMessage.id == message_id
+        )
+    )
+    return result.scalars().first()
+
+@observe_db
+async def delete_messages(db: AsyncSession, session_id: str) -> int:
+    """删除会话的所有消息"""
+    result = await db.execute(
+        delete(ChatMessage).where(
+            ChatMessage.session_id == session_id
+        )
+    )
+    await db.commit()
+    return result.rowcount
+
+# ====================== 会话摘要函数 ======================
+
+@observe_db
+async def get_conversation_summary(db: AsyncSession, session_id: str) -> Optional[ConversationSummary]:
+    """获取会话的滚动摘要"""
+    result = await db.execute(
+        select(ConversationSummary).where(
+            ConversationSummary.session_id == session_id
+        )
+    )
+    return result.scalars().first()
+
+@observe_db
+async def save_conversation_summary(
+    db: AsyncSession,
+    session_id: str,
+    content: str,
+    covered_until: ChatMessage
+) -> ConversationSummary:
+    """保存会话的滚动摘要，covered_until为摘要已覆盖到的最后一条消息"""
+    summary = await get_conversation_summary(db, session_id)
+    if not summary:
+        summary = ConversationSummary(session_id=session_id)
+        db.add(summary)
+    summary.content = content
+    summary.tokens = count_tokens(content)
+    summary.covered_until_at = covered_until.created_at
+    summary.covered_until_id = covered_until.id
+    await db.commit()
+    await db.refresh(summary)
+    return summary
+
+# ====================== 批量操作函数 ======================
+
+@observe_db
+async def create_messages_batch(db: AsyncSession, messages_data: List[MessageCreate]) -> List[ChatMessage]:
+    """批量创建消息（单个事务：一次批量插入 + 一次会话时间更新）"""
+    if not messages_data:
+        return []
+    session_ids = {data.session_id for data in messages_data}
+    existing = set((await db.execute(active_session_ids_query(session_ids))).scalars().all())
+
+    # 与create_message一致：会话不存在时创建新会话
+    session_remap = {}
+    for session_id in session_ids - existing:
+        new_session = ChatSession(id=generate_uuid(), title="新对话")
+        db.add(new_session)
+        session_remap[session_id] = new_session.id
+
+    messages = build_message_rows(messages_data, session_remap)
+    blob_rows = externalize_messages(messages)
+    if blob_rows:
+        await db.execute(insert_ignore(db, ToolResultBlob), blob_rows)
+    db.add_all(messages)
+    if existing:
+        await db.execute(touch_sessions_query(existing))
+    await db.commit()
+    return messages
+
+@observe_db
+async def get_recent_sessions(db: AsyncSession, limit: int = 10) -> List[ChatSession]:
+    """获取最近活跃的会话"""
+    result = await db.execute(
+        select(ChatSession).where(
+            ChatSession.is_active == True
+        ).options(
+            selectinload(ChatSession.messages)
+        ).order_by(ChatSession.updated_at.desc()).limit(limit)
+    )
+    return list(result.scalars().all())
@@ -1,17 +1,104 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from app.config import settings
 
-# 创建数据库引擎
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
-)
+# 同步URL方言 -> 异步驱动
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+def get_async_database_url(database_url: str) -> str:
+    """根据database_url推导异步驱动URL（如 sqlite:/// -> sqlite+aiosqlite:///）"""
+    if settings.async_database_url:
+        return settings.async_database_url
+    scheme, sep, rest = database_url.partition("://")
+    dialect, _, driver = scheme.partition("+")
+    async_scheme = ASYNC_DRIVERS.get(dialect)
+    if not sep or not async_scheme or async_scheme.endswith(f"+{driver}"):
+        return database_url
+    return f"{async_scheme}://{rest}"
+
+SQLITE_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SQLITE_SYNCHRONOUS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+def _is_sqlite_memory(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+def engine_options(database_url: str) -> dict:
+    """引擎参数：连接池大小/溢出/超时/回收/探活（SQLite内存库使用单连接池，不接受池大小参数）"""
+    url = make_url(database_url)
+    options = {"pool_pre_ping": settings.db_pool_pre_ping}
+    if url.get_backend_name() == "sqlite":
+        if url.get_driver_name() in ("pysqlite", ""):
+            options["connect_args"] = {"check_same_thread": False}
+        if _is_sqlite_memory(url):
+            return options
+    options.update(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle
+    )
+    return options
+
+def _sqlite_pragmas() -> list:
+    # busy_timeout必须最先设置：多个进程同时切换journal_mode时需要等待而不是直接报database is locked
+    pragmas = []
+    if settings.sqlite_busy_timeout_ms > 0:
+        pragmas.append(f"PRAGMA busy_timeout = {int(settings.sqlite_busy_timeout_ms)}")
+    journal_mode = settings.sqlite_journal_mode.upper()
+    if journal_mode:
+        if journal_mode not in SQLITE_JOURNAL_MODES:
+            raise ValueError(f"无效的SQLITE_JOURNAL_MODE: {settings.sqlite_journal_mode}")
+        pragmas.append(f"PRAGMA journal_mode = {journal_mode}")
+    synchronous = settings.sqlite_synchronous.upper()
+    if synchronous:
+        if synchronous not in SQLITE_SYNCHRONOUS:
+            raise ValueError(f"无效的SQLITE_SYNCHRONOUS: {settings.sqlite_synchronous}")
+        pragmas.append(f"PRAGMA synchronous = {synchronous}")
+    return pragmas
+
+def configure_sqlite(sync_engine):
+    """SQLite文件库：每个新连接设置WAL/synchronous/busy_timeout（同步和aiosqlite驱动都适用）"""
+    if sync_engine.dialect.name != "sqlite" or _is_sqlite_memory(sync_engine.url):
+        return
+    pragmas = _sqlite_pragmas()
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+# 创建数据库引擎（同步，供脚本和建表使用）
+engine = create_engine(settings.database_url, **engine_options(settings.database_url))
+configure_sqlite(engine)
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# 依赖注入获取数据库会话
+# 创建异步数据库引擎（供API使用）
+ASYNC_DATABASE_URL = get_async_database_url(settings.database_url)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+configure_sqlite(async_engine.sync_engine)
+
+# 创建异步会话工厂（提交后不过期，避免在事件循环外触发懒加载）
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# 依赖注入获取数据库会话（同步）
 def get_db():
     db = SessionLocal()
     try:
@@ -19,7 +106,62 @@ def get_db():
     finally:
         db.close()
 
+# 依赖注入获取数据库会话（异步）
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _add_missing_columns(connection):
+    """为已存在的表补加模型中新增的可空列（create_all不会修改旧表）"""
+    from app.models import Base
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+def _create_all(connection):
+    """创建所有表，并为已存在的表补建新增列和索引（create_all不会修改旧表）"""
+    from app.models import Base
+    if connection.dialect.name == "sqlite" and not inspect(connection).get_table_names():
+        # 新库开启增量自动清理，数据保留任务删除数据后可以逐步归还空闲页（旧库需执行一次 vacuum --full）
+        connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+    Base.metadata.create_all(bind=connection)
+    _add_missing_columns(connection)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+    # SQLite全文索引（FTS5虚拟表 + 同步触发器）
+    from app.search import create_search_index
+    create_search_index(connection)
+
+def _check_schema(connection):
+    """不建表的进程（多worker部署由主进程统一建表）只检测可选功能是否可用"""
+    from app.search import detect_search_index
+    detect_search_index(connection)
+
 # 创建所有表
 def create_tables():
-    from app.models import Base
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    with engine.begin() as conn:
+        _create_all(conn)
+
+# 创建所有表（异步）
+async def create_tables_async():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(_create_all)
+
+# 检查已有表结构（异步，db_auto_create关闭时使用）
+async def check_tables_async():
+    async with async_engine.connect() as conn:
+        await conn.run_sync(_check_schema)
+
+# 部署时单独建表/迁移：python -m app.database
+if __name__ == "__main__":
+    create_tables()
+    print(f"数据库表已创建: {engine.url.render_as_string(hide_password=True)}")
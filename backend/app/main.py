@@ -1,11 +1,25 @@
-from fastapi import FastAPI
+import time
+
+# 记录进程启动时间，用于统计冷启动耗时
+PROCESS_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
+import os
 import uvicorn
 
 from app.config import settings
-from app.database import create_tables
+from app.database import create_tables_async, check_tables_async, async_engine
 from app.api import router as chat_router
+from app.services import agent_service
+from app.persistence import message_writer
+from app.runs import run_workers
+from app.retention import retention_loop
+from app.tokens import load_encoding
+from app.metrics import registry, REQUEST_LATENCY, ERRORS, monitor_event_loop_lag
 import logging
 
 # 配置日志
@@ -15,16 +29,61 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def _warmup_agent():
+    """后台构建Agent并记录耗时"""
+    started = time.perf_counter()
+    try:
+        await agent_service.ensure_agent()
+        logger.info(f"Agent预热完成，耗时 {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        logger.error(f"Agent预热失败，将在首次请求时重试: {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时
-    logger.info("Starting Research Agent API...")
-    create_tables()  # 创建数据库表
-    logger.info("Database tables created")
+    logger.info(f"Starting Research Agent API... (模块导入耗时 {time.perf_counter() - PROCESS_STARTED:.2f}s)")
+    started = time.perf_counter()
+    if settings.db_auto_create:
+        await create_tables_async()  # 创建数据库表
+        logger.info(f"Database tables created ({time.perf_counter() - started:.2f}s)")
+    else:
+        # 多worker部署：表已由主进程（或 python -m app.database）创建
+        await check_tables_async()
+    # 分词器可能需要联网下载编码：在后台线程中加载，不阻塞启动和事件循环，加载完成前按字符数估算token
+    encoding_task = asyncio.create_task(asyncio.to_thread(load_encoding))
+    if settings.persist_write_behind:
+        await message_writer.start()
+    await run_workers.start()
+    
+    # 后台预热Agent，不阻塞服务启动；未预热时在首次请求时构建
+    warmup_task = None
+    if settings.agent_warmup:
+        warmup_task = asyncio.create_task(_warmup_agent())
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    # 定期清理/归档/压缩数据库（默认关闭，也可用 python -m app.retention 手动执行）
+    # 多worker时各进程不执行，避免重复归档同一会话
+    retention_task = None
+    if settings.retention_enabled:
+        if settings.db_auto_create:
+            retention_task = asyncio.create_task(retention_loop())
+        else:
+            logger.info("多worker部署不在worker内执行数据保留任务，请定期执行 python -m app.retention run")
+    logger.info(f"应用启动完成，冷启动耗时 {time.perf_counter() - PROCESS_STARTED:.2f}s")
     yield
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    if not encoding_task.done():
+        encoding_task.cancel()
+    lag_monitor.cancel()
+    if retention_task:
+        retention_task.cancel()
     # 关闭时
     logger.info("Shutting down Research Agent API...")
+    await run_workers.stop()
+    await message_writer.stop()
+    await agent_service.close()
+    await async_engine.dispose()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -41,8 +100,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cursor-Before", "X-Cursor-After", "X-Has-More", "Retry-After", "X-Run-Id"],  # 分页游标/过载重试/流式续传
 )
 
+# 请求耗时统计（按路由模板聚合，避免路径参数导致标签膨胀）
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    except Exception:
+        ERRORS.inc(component="http")
+        raise
+    finally:
+        route = request.scope.get("route")
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status)
+        )
+
 # 注册路由
 app.include_router(chat_router)
 
@@ -56,16 +137,37 @@ async def root():
         "redoc": "/redoc"
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus文本格式指标"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "agent_ready": agent_service.is_ready}
 
 # 启动应用
+#   python -m app.main                 单进程（DEBUG=true时自动重载）
+#   WORKERS=4 python -m app.main       多进程：主进程建表一次，worker启动时不再建表
+# 进程内状态（流式续传/后台运行、请求合并、内存回复缓存、并发限制）按worker独立，
+# 多worker时续传和 /runs/{id} 查询需要负载均衡按会话粘滞，或使用单worker。
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host=settings.host,
-        port=settings.port,
-        reload=settings.debug,
-        log_level="info"
-    )
\ No newline at end of file
+    if settings.workers > 1:
+        from app.database import create_tables
+        create_tables()
+        os.environ["DB_AUTO_CREATE"] = "false"
+        uvicorn.run(
+            "app.main:app",
+            host=settings.host,
+            port=settings.port,
+            workers=settings.workers,
+            log_level="info"
+        )
+    else:
+        uvicorn.run(
+            "app.main:app",
+            host=settings.host,
+            port=settings.port,
+            reload=settings.debug,
+            log_level="info"
+        )
\ No newline at end of file
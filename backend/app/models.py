@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, JSON, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
 import uuid
 
 Base = declarative_base()
@@ -9,6 +10,10 @@ Base = declarative_base()
 def generate_uuid():
     return str(uuid.uuid4())
 
+def utc_now():
+    """当前UTC时间（微秒精度，与SQLite的CURRENT_TIMESTAMP同为UTC）"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 class ChatSession(Base):
     """聊天会话模型"""
     __tablename__ = "chat_sessions"
@@ -22,6 +27,11 @@ class ChatSession(Base):
     # 定义一对多关系
     messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # 覆盖侧边栏按活跃状态+更新时间倒序的会话列表查询
+        Index("ix_chat_sessions_active_updated", "is_active", "updated_at"),
+    )
+    
 class ChatMessage(Base):
     """聊天消息模型"""
     __tablename__ = "chat_messages"
@@ -31,9 +41,62 @@ class ChatMessage(Base):
     role = Column(String(20), nullable=False)  # user, assistant, system, tool
     content = Column(Text, nullable=False)
     tool_calls = Column(JSON, nullable=True)  # 存储工具调用信息
-    tool_results = Column(JSON, nullable=True)  # 存储工具调用结果
+    tool_results = Column(JSON, nullable=True)  # 存储工具调用结果（大体积结果只存blob引用，见app.blobs）
+    meta = Column(JSON, nullable=True)  # 附加信息，如回复缓存命中
     tokens = Column(Integer, default=0)
-    created_at = Column(DateTime, default=func.now())
+    # 使用Python端时间戳：SQLite的func.now()只精确到秒，同一秒内的消息无法排序
+    created_at = Column(DateTime, default=utc_now)
     
     # 定义多对一关系
     session = relationship("ChatSession", back_populates="messages")
+    
+    __table_args__ = (
+        # 覆盖按会话分页/取最新N条的查询，避免ORDER BY排序
+        Index("ix_chat_messages_session_created_id", "session_id", "created_at", "id"),
+    )
+
+class ConversationSummary(Base):
+    """会话滚动摘要模型（折叠超出上下文窗口的早期消息）"""
+    __tablename__ = "conversation_summaries"
+    
+    session_id = Column(String(36), ForeignKey("chat_sessions.id", ondelete="CASCADE"), primary_key=True)
+    content = Column(Text, nullable=False, default="")
+    tokens = Column(Integer, default=0)
+    # 摘要已覆盖到的最后一条消息（按 created_at, id 排序）
+    covered_until_at = Column(DateTime, nullable=True)
+    covered_until_id = Column(String(36), nullable=True)
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+class ToolCacheEntry(Base):
+    """工具调用结果缓存模型"""
+    __tablename__ = "tool_cache"
+    
+    key = Column(String(64), primary_key=True)  # sha256(工具名 + 规范化参数)
+    tool_name = Column(String(50), nullable=False)
+    arguments = Column(JSON, nullable=True)  # 规范化后的参数
+    result = Column(Text, nullable=False)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=utc_now)
+    last_accessed_at = Column(DateTime, default=utc_now, index=True)  # LRU淘汰依据
+
+class ToolResultBlob(Base):
+    """工具结果内容寻址存储模型（按原文哈希去重，zstd压缩）"""
+    __tablename__ = "tool_result_blobs"
+    
+    hash = Column(String(64), primary_key=True)  # sha256(原文UTF-8)
+    data = Column(LargeBinary, nullable=False)  # zstd压缩后的原文
+    size = Column(Integer, nullable=False)  # 原文字节数
+    created_at = Column(DateTime, default=utc_now)
+
+class Paper(Base):
+    """本地论文库模型（从arxiv工具结果中解析，按arXiv ID去重）"""
+    __tablename__ = "papers"
+    
+    id = Column(String(64), primary_key=True)  # arXiv ID（不含版本号）；结果中没有ID时为 title:<规范化标题哈希>
+    title = Column(Text, nullable=False)
+    authors = Column(Text, nullable=True)
+    summary = Column(Text, nullable=True)
+    published = Column(String(32), nullable=True)  # arxiv工具给出的日期文本，如 2024-05-01
+    seen = Column(Integer, default=1)  # 在arxiv结果中出现的次数
+    created_at = Column(DateTime, default=utc_now)
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
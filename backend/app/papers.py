@@ -0,0 +1,295 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import select, func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+import argparse
+import hashlib
+import json
+import logging
+import re
+import threading
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Paper, ChatMessage, ToolCacheEntry, ToolResultBlob
+from app.blobs import decompress
+from app.metrics import CACHE_REQUESTS, observe_db
+from app import search
+
+logger = logging.getLogger(__name__)
+
+# 本地论文库：arxiv工具返回的论文（Published/Title/Authors/Summary 格式）解析后写入papers表，
+# 按arXiv ID去重，由FTS5索引（papers_fts，见app.search）提供BM25检索。
+# Agent通过local_papers工具先查本地库，没有相关结果时再调用arxiv联网搜索。
+#   python -m app.papers backfill        从已保存的工具结果和工具缓存中回填论文库
+#   python -m app.papers search <检索词>
+
+# 与ArxivAPIWrapper的输出格式一致（arxiv和local_papers工具的输出额外带arXiv ID行），摘要到下一篇论文或文本结束为止
+ENTRY_PATTERN = re.compile(
+    r"(?:arXiv ID: (?P<arxiv_id>[^\n]*)\n)?Published: (?P<published>[^\n]*)\nTitle: (?P<title>.*?)\nAuthors: (?P<authors>.*?)\n"
+    r"Summary: (?P<summary>.*?)(?=\n\n(?:arXiv ID: [^\n]*\n)?Published: |\Z)",
+    re.S
+)
+# arXiv编号（entry_id链接或裸编号），去掉版本号后作为去重键
+ARXIV_ID_PATTERN = re.compile(
+    r"^(?:https?://arxiv\.org/(?:abs|pdf)/)?(\d{4}\.\d{4,5}|[a-z\-]+(?:\.[A-Z]{2})?/\d{7})(?:v\d+)?$",
+    re.I
+)
+TITLE_KEY_PREFIX = "title:"
+MAX_QUERY_TERMS = 16
+NO_LOCAL_RESULTS = "No matching papers in the local library. Use the arxiv tool to search online."
+
+def normalize_title(title: str) -> str:
+    return " ".join(re.findall(r"\w+", title.lower()))
+
+def title_key(title: str) -> str:
+    return TITLE_KEY_PREFIX + hashlib.sha256(normalize_title(title).encode("utf-8")).hexdigest()[:32]
+
+def make_paper_id(title: str, entry_id: Optional[str] = None) -> str:
+    """论文去重键：arXiv ID（来自结果的entry_id，不含版本号）；没有ID的旧结果退化为规范化标题的哈希
+
+    不从摘要正文中提取编号，摘要里引用的其他论文编号不会被误当作本篇的ID。
+    """
+    match = ARXIV_ID_PATTERN.match((entry_id or "").strip())
+    if match:
+        return match.group(1)
+    return title_key(title)
+
+def parse_arxiv_results(result: str) -> List[Dict[str, Any]]:
+    """从arxiv工具结果中解析论文列表（同一结果中重复的论文只保留一次）"""
+    papers: Dict[str, Dict[str, Any]] = {}
+    for match in ENTRY_PATTERN.finditer(result):
+        title = " ".join(match["title"].split())
+        if not title:
+            continue
+        paper_id = make_paper_id(title, match["arxiv_id"])
+        papers.setdefault(paper_id, {
+            "id": paper_id,
+            "title": title,
+            "authors": " ".join(match["authors"].split()) or None,
+            "summary": match["summary"].strip() or None,
+            "published": match["published"].strip() or None
+        })
+    return list(papers.values())
+
+def format_papers(papers: List[Dict[str, Any]]) -> str:
+    """按arxiv工具的格式输出，Agent无需区分结果来自本地还是网络"""
+    blocks = []
+    for paper in papers:
+        lines = []
+        if not paper["id"].startswith(TITLE_KEY_PREFIX):
+            lines.append(f"arXiv ID: {paper['id']}")
+        lines += [
+            f"Published: {paper['published'] or ''}",
+            f"Title: {paper['title']}",
+            f"Authors: {paper['authors'] or ''}",
+            f"Summary: {paper['summary'] or ''}"
+        ]
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+def _merge(existing: Paper, paper: Dict[str, Any]):
+    """已收录的论文：保留更完整的字段（arxiv工具会截断最后一篇的摘要）"""
+    if paper["summary"] and len(paper["summary"]) > len(existing.summary or ""):
+        existing.summary = paper["summary"]
+    existing.authors = existing.authors or paper["authors"]
+    existing.published = existing.published or paper["published"]
+    existing.seen = (existing.seen or 0) + 1
+
+def build_search_query(dialect: str, query: str, limit: int, offset: int = 0) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """论文检索SQL：FTS5可用时各词为OR关系、按BM25排序（标题权重最高），否则退化为LIKE"""
+    terms = re.findall(r"\w+", query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    params: Dict[str, Any] = {"limit": limit, "offset": offset}
+    if search.fts_enabled and dialect == "sqlite":
+        params["match"] = " OR ".join(f'"{term}"' for term in terms)
+        return """
+            SELECT p.id, p.title, p.authors, p.summary, p.published,
+                   snippet(papers_fts, 2, '<mark>', '</mark>', '…', 32) AS snippet,
+                   bm25(papers_fts, 10.0, 3.0, 1.0) AS rank
+            FROM papers_fts
+            JOIN papers p ON p.rowid = papers_fts.rowid
+            WHERE papers_fts MATCH :match
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset
+        """, params
+    conditions = []
+    for i, term in enumerate(terms):
+        conditions.append(f"p.title LIKE :term{i} ESCAPE '\\' OR p.summary LIKE :term{i} ESCAPE '\\'")
+        params[f"term{i}"] = search._like(term)
+    return f"""
+        SELECT p.id, p.title, p.authors, p.summary, p.published, p.summary AS snippet, NULL AS rank
+        FROM papers p
+        WHERE {' OR '.join(f'({c})' for c in conditions)}
+        ORDER BY p.published DESC, p.id
+        LIMIT :limit OFFSET :offset
+    """, params
+
+def _to_hit(row, query: str) -> Dict[str, Any]:
+    hit = dict(row)
+    if hit["rank"] is None:
+        hit["snippet"] = search.make_snippet(hit["snippet"] or "", re.findall(r"\w+", query))
+    return hit
+
+class PaperStore:
+    """本地论文库（工具在线程池中同步执行，因此使用同步数据库会话）"""
+
+    def __init__(self, top_k: int):
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._stats = {"ingested": 0, "hits": 0, "misses": 0}
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+        if name in ("hits", "misses"):
+            CACHE_REQUESTS.inc(n, cache="papers", result="hit" if name == "hits" else "miss")
+
+    def stats(self) -> Dict[str, Any]:
+        """收录数和本地检索的命中/未命中计数"""
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / total, 4) if total else 0.0
+        return stats
+
+    def ingest(self, result: str) -> int:
+        """解析arxiv工具结果并写入论文库，返回新收录的论文数"""
+        papers = parse_arxiv_results(result)
+        if not papers:
+            return 0
+        db = SessionLocal()
+        try:
+            # 并发写入同一篇论文时主键冲突，重试一次（此时按已收录合并）
+            for attempt in range(2):
+                try:
+                    # 旧结果不含ID时按标题收录过的同一篇论文，拿到arXiv ID后改为按ID收录
+                    title_keys = {
+                        title_key(p["title"]): p["id"] for p in papers if not p["id"].startswith(TITLE_KEY_PREFIX)
+                    }
+                    existing = {
+                        paper.id: paper for paper in db.execute(
+                            select(Paper).where(Paper.id.in_([p["id"] for p in papers] + list(title_keys)))
+                        ).scalars()
+                    }
+                    for key, paper_id in title_keys.items():
+                        if key in existing and paper_id not in existing:
+                            existing[paper_id] = existing.pop(key)
+                            existing[paper_id].id = paper_id
+                    added = 0
+                    for paper in papers:
+                        if paper["id"] in existing:
+                            _merge(existing[paper["id"]], paper)
+                        else:
+                            db.add(Paper(**paper))
+                            added += 1
+                    db.commit()
+                    self._count("ingested", added)
+                    return added
+                except IntegrityError:
+                    db.rollback()
+                    if attempt:
+                        raise
+        finally:
+            db.close()
+
+    def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            built = build_search_query(db.bind.dialect.name, query, limit)
+            if built is None:
+                return []
+            sql, params = built
+            return [_to_hit(row, query) for row in db.execute(text(sql), params).mappings().all()]
+        finally:
+            db.close()
+
+    def lookup(self, query: str) -> str:
+        """local_papers工具的实现：返回最相关的top_k篇论文"""
+        papers = self.search(query, self.top_k)
+        self._count("hits" if papers else "misses")
+        return format_papers(papers) if papers else NO_LOCAL_RESULTS
+
+@observe_db
+async def search_papers(db: AsyncSession, query: str, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+    """检索论文库，返回limit+1条用于判断是否还有更多"""
+    built = build_search_query(db.bind.dialect.name, query, limit + 1, offset)
+    if built is None:
+        return []
+    sql, params = built
+    return [_to_hit(row, query) for row in (await db.execute(text(sql), params)).mappings().all()]
+
+@observe_db
+async def get_paper(db: AsyncSession, paper_id: str) -> Optional[Paper]:
+    return await db.get(Paper, paper_id)
+
+@observe_db
+async def count_papers(db: AsyncSession) -> int:
+    return (await db.execute(select(func.count()).select_from(Paper))).scalar_one()
+
+def _iter_tool_outputs(batch_size: int) -> Iterator[str]:
+    """按主键分页读取已保存的工具结果（blob、消息内联结果、工具缓存），每页读完即释放读锁"""
+    db = SessionLocal()
+    try:
+        sources = (
+            (ToolResultBlob.hash, ToolResultBlob.data, None),
+            (ChatMessage.id, ChatMessage.tool_results, ChatMessage.tool_results.isnot(None)),
+            (ToolCacheEntry.key, ToolCacheEntry.result, ToolCacheEntry.tool_name == "arxiv"),
+        )
+        for key, column, condition in sources:
+            last = None
+            while True:
+                stmt = select(key, column).order_by(key).limit(batch_size)
+                if condition is not None:
+                    stmt = stmt.where(condition)
+                if last is not None:
+                    stmt = stmt.where(key > last)
+                rows = db.execute(stmt).all()
+                if not rows:
+                    break
+                last = rows[-1][0]
+                for _, value in rows:
+                    if isinstance(value, bytes):
+                        yield decompress(value).decode("utf-8")
+                    elif isinstance(value, dict):
+                        yield from (v for v in value.values() if isinstance(v, str))
+                    elif isinstance(value, str):
+                        yield value
+    finally:
+        db.close()
+
+def backfill() -> Dict[str, int]:
+    """从已保存的工具结果中回填论文库"""
+    counts = {"results": 0, "added": 0}
+    for output in _iter_tool_outputs(settings.bulk_batch_size):
+        if "Published: " not in output:
+            continue
+        counts["results"] += 1
+        counts["added"] += paper_store.ingest(output)
+    logger.info(f"论文库回填完成: {counts}")
+    return counts
+
+# 全局本地论文库
+paper_store = PaperStore(top_k=settings.paper_search_top_k)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Research Agent 本地论文库")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("backfill", help="从已保存的工具结果和工具缓存中回填论文库")
+    search_parser = commands.add_parser("search", help="检索本地论文库")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    from app.database import create_tables
+    create_tables()
+    if args.command == "backfill":
+        output = backfill()
+    else:
+        output = paper_store.search(args.query, args.limit)
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
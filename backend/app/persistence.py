@@ -0,0 +1,134 @@
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+
+from app import crud_async as crud
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import ChatMessage
+from app.schemas import MessageCreate
+
+logger = logging.getLogger(__name__)
+
+class MessageWriter:
+    """消息写入管线（组提交）
+
+    并发请求提交的消息进入队列，按批量大小或时间窗口合并为一个事务写入
+    （一次批量插入 + 一次会话时间更新 + 一次提交）。submit默认等待提交完成；
+    读取会话前调用sync(session_id)可保证读到该会话已提交的写入（read-your-writes）。
+    未启动时（如脚本中）直接写库。
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Dict[str, Set[asyncio.Future]] = {}
+        self.batches = 0
+        self.messages = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"消息写入管线已启动（批量 {self.batch_size} 条 / {self.flush_interval * 1000:.0f}ms）")
+
+    async def stop(self):
+        """停止管线，已入队的消息全部写入后返回"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, message_data: MessageCreate, wait: bool = True):
+        """提交一条消息；wait为True时等待组提交完成并返回ChatMessage，否则返回Future"""
+        if not self.running:
+            async with AsyncSessionLocal() as db:
+                return (await crud.create_messages_batch(db, [message_data]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        session_id = message_data.session_id
+        self._pending.setdefault(session_id, set()).add(future)
+        future.add_done_callback(lambda f: self._untrack(session_id, f))
+        await self._queue.put((message_data, future))
+        if not wait:
+            return future
+        # 调用方被取消时不影响消息写入
+        return await asyncio.shield(future)
+
+    async def sync(self, session_id: str):
+        """等待该会话所有已提交的写入完成"""
+        pending = list(self._pending.get(session_id, ()))
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _untrack(self, session_id: str, future: asyncio.Future):
+        futures = self._pending.get(session_id)
+        if futures is not None:
+            futures.discard(future)
+            if not futures:
+                del self._pending[session_id]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch: List[Tuple[MessageCreate, asyncio.Future]] = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[MessageCreate, asyncio.Future]]):
+        try:
+            async with AsyncSessionLocal() as db:
+                messages: List[ChatMessage] = await crud.create_messages_batch(db, [data for data, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"写入消息失败: {e}")
+                self._resolve(batch[0][1], exception=e)
+                return
+            # 整批回滚后逐条重试，只有出错的那条消息的提交方收到异常
+            logger.error(f"批量写入消息失败（{len(batch)}条），逐条重试: {e}")
+            for item in batch:
+                await self._flush([item])
+            return
+        self.batches += 1
+        self.messages += len(batch)
+        for (_, future), message in zip(batch, messages):
+            self._resolve(future, message)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result=None, exception: Optional[BaseException] = None):
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+# 全局消息写入管线
+message_writer = MessageWriter(
+    batch_size=settings.persist_batch_size,
+    flush_interval=settings.persist_flush_interval_ms / 1000
+)
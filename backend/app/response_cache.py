@@ -0,0 +1,128 @@
+from typing import Any, Dict, Iterator, Optional
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from app.config import settings
+from app.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """Agent回复缓存后端基类（按请求键精确匹配）"""
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        raise NotImplementedError
+
+    def _record(self, value: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        CACHE_REQUESTS.inc(cache="response", result="miss" if value is None else "hit")
+        return value
+
+class MemoryResponseCache(ResponseCache):
+    """进程内LRU缓存"""
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            self._entries.pop(key, None)
+            return self._record(None)
+        self._entries.move_to_end(key)
+        return self._record(entry[1])
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        self._entries[key] = (time.time() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+class SQLiteResponseCache(ResponseCache):
+    """本地SQLite文件缓存（跨进程/重启共享），在线程池中执行以免阻塞事件循环"""
+
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_response_cache_accessed ON response_cache (accessed_at)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """在一个事务中使用连接，结束后关闭（sqlite3连接的with只提交或回滚，不关闭连接）"""
+        with closing(sqlite3.connect(self.path, timeout=5)) as conn, conn:
+            yield conn
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM response_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def _set(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + self.ttl_seconds, now)
+            )
+            conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._record(await asyncio.to_thread(self._get, key))
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        await asyncio.to_thread(self._set, key, value)
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """根据配置创建回复缓存，未启用时返回None"""
+    backend = settings.response_cache_backend.lower()
+    if not backend:
+        return None
+    if backend == "memory":
+        return MemoryResponseCache(settings.response_cache_ttl_seconds, settings.response_cache_max_entries)
+    if backend == "sqlite":
+        return SQLiteResponseCache(
+            settings.response_cache_path,
+            settings.response_cache_ttl_seconds,
+            settings.response_cache_max_entries
+        )
+    logger.warning(f"未知的回复缓存后端: {backend}，已禁用回复缓存")
+    return None
@@ -0,0 +1,381 @@
+from typing import Any, AsyncIterator, Dict, List, Optional
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy import select, delete, update, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+
+from app.config import settings
+from app.database import AsyncSessionLocal, engine
+from app.models import ChatSession, ChatMessage, ConversationSummary, ToolResultBlob
+from app.blobs import referenced_hashes
+from app.checkpoints import delete_threads
+from app.tokens import load_encoding
+from app.transfer import export_ndjson, import_ndjson, zstd_compress, zstd_decompress_if_needed
+
+logger = logging.getLogger(__name__)
+
+# 数据保留与压缩
+# - 软删除超过 retention_purge_after_days 天的会话，连同消息和摘要一起硬删除
+# - 超过 retention_archive_after_days 天未更新的会话导出为 <archive_dir>/<会话ID>.ndjson.zst 后从库中删除，可按需恢复
+# - 清理不再被任何消息引用的工具结果blob
+# - SQLite下执行增量VACUUM和ANALYZE，并报告释放的空间
+#   python -m app.retention run [--dry-run]
+#   python -m app.retention list
+#   python -m app.retention restore <会话ID>
+#   python -m app.retention vacuum [--full]
+
+ARCHIVE_SUFFIX = ".ndjson.zst"
+SESSION_ID_PATTERN = re.compile(r"[0-9A-Za-z-]{1,64}")
+
+def archive_path(session_id: str) -> Path:
+    """会话归档文件路径（会话ID来自请求时先校验，避免路径穿越）"""
+    if not SESSION_ID_PATTERN.fullmatch(session_id):
+        raise ValueError(f"无效的会话ID: {session_id}")
+    return Path(settings.retention_archive_dir) / f"{session_id}{ARCHIVE_SUFFIX}"
+
+async def _delete_sessions(db: AsyncSession, session_ids: List[str]) -> int:
+    """硬删除会话及其消息、摘要和Agent线程（不依赖SQLite外键级联），返回删除的消息数"""
+    await asyncio.to_thread(delete_threads, session_ids)
+    result = await db.execute(delete(ChatMessage).where(ChatMessage.session_id.in_(session_ids)))
+    await db.execute(delete(ConversationSummary).where(ConversationSummary.session_id.in_(session_ids)))
+    await db.execute(delete(ChatSession).where(ChatSession.id.in_(session_ids)))
+    return result.rowcount
+
+async def _count_messages(db: AsyncSession, session_ids: List[str]) -> int:
+    return (await db.execute(
+        select(func.count()).select_from(ChatMessage).where(ChatMessage.session_id.in_(session_ids))
+    )).scalar_one()
+
+async def purge_deleted_sessions(cutoff: datetime, dry_run: bool = False) -> Dict[str, int]:
+    """硬删除cutoff之前软删除的会话，按批提交，避免长时间占用写锁"""
+    counts = {"sessions": 0, "messages": 0}
+    stmt = select(ChatSession.id).where(
+        ChatSession.is_active == False,
+        ChatSession.updated_at < cutoff
+    ).order_by(ChatSession.updated_at)
+    async with AsyncSessionLocal() as db:
+        if dry_run:
+            session_ids = list((await db.execute(stmt)).scalars().all())
+            counts["sessions"] = len(session_ids)
+            counts["messages"] = await _count_messages(db, session_ids) if session_ids else 0
+            return counts
+        while True:
+            session_ids = list((await db.execute(stmt.limit(settings.bulk_batch_size))).scalars().all())
+            if not session_ids:
+                return counts
+            counts["messages"] += await _delete_sessions(db, session_ids)
+            counts["sessions"] += len(session_ids)
+            await db.commit()
+
+def _fsync_close(f):
+    try:
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+
+async def _write_file(path: Path, chunks: AsyncIterator[bytes]):
+    """写入文件并落盘，文件操作在线程中执行，不阻塞事件循环"""
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        async for chunk in chunks:
+            await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        raise
+    await asyncio.to_thread(_fsync_close, f)
+
+async def archive_session(session_id: str, cutoff: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """把会话写入压缩归档文件后从库中删除
+
+    先写临时文件再原子改名，文件落盘后才删除数据；指定cutoff时删除前确认会话在此期间没有更新，
+    否则放弃归档。返回None表示会话不存在或已不满足归档条件。
+    """
+    path = archive_path(session_id)
+    async with AsyncSessionLocal() as db:
+        if await db.get(ChatSession, session_id) is None:
+            return None
+    await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    await _write_file(tmp_path, zstd_compress(export_ndjson(include_inactive=True, session_ids=[session_id])))
+    await asyncio.to_thread(os.replace, tmp_path, path)
+
+    async with AsyncSessionLocal() as db:
+        stmt = select(ChatSession.id).where(ChatSession.id == session_id)
+        if cutoff is not None:
+            stmt = stmt.where(ChatSession.is_active == True, ChatSession.updated_at < cutoff)
+        if (await db.execute(stmt)).scalar_one_or_none() is None:
+            await asyncio.to_thread(path.unlink, missing_ok=True)
+            return None
+        messages = await _delete_sessions(db, [session_id])
+        await db.commit()
+    size = (await asyncio.to_thread(path.stat)).st_size
+    return {"session_id": session_id, "messages": messages, "bytes": size}
+
+async def archive_idle_sessions(cutoff: datetime, dry_run: bool = False) -> Dict[str, int]:
+    """归档cutoff之后没有更新的活跃会话"""
+    counts = {"sessions": 0, "messages": 0, "bytes": 0}
+    async with AsyncSessionLocal() as db:
+        session_ids = list((await db.execute(
+            select(ChatSession.id).where(
+                ChatSession.is_active == True,
+                ChatSession.updated_at < cutoff
+            ).order_by(ChatSession.updated_at)
+        )).scalars().all())
+        if dry_run:
+            counts["sessions"] = len(session_ids)
+            counts["messages"] = await _count_messages(db, session_ids) if session_ids else 0
+            return counts
+
+    for session_id in session_ids:
+        try:
+            archived = await archive_session(session_id, cutoff)
+        except Exception as e:
+            logger.error(f"归档会话 {session_id} 失败: {e}")
+            continue
+        if archived:
+            counts["sessions"] += 1
+            counts["messages"] += archived["messages"]
+            counts["bytes"] += archived["bytes"]
+    return counts
+
+async def _read_file(path: Path, chunk_size: int = 65536) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+async def restore_session(session_id: str) -> Dict[str, int]:
+    """从归档文件恢复会话，恢复后视为刚访问过（避免下次保留任务立即再次归档）并删除归档文件"""
+    path = archive_path(session_id)
+    if not path.exists():
+        raise FileNotFoundError(f"会话 {session_id} 没有归档")
+    counts = await import_ndjson(zstd_decompress_if_needed(_read_file(path), compressed=True))
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(ChatSession).where(ChatSession.id == session_id).values(updated_at=datetime.now())
+        )
+        await db.commit()
+    path.unlink()
+    logger.info(f"已恢复归档会话 {session_id}: {counts}")
+    return counts
+
+def _read_archive_header(path: Path) -> Dict[str, Any]:
+    """读取归档文件的第一行（会话记录）"""
+    import zstandard
+
+    with open(path, "rb") as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+        buffer = b""
+        while b"\n" not in buffer:
+            chunk = reader.read(4096)
+            if not chunk:
+                break
+            buffer += chunk
+    return json.loads(buffer.split(b"\n", 1)[0]) if buffer.strip() else {}
+
+def list_archives() -> List[Dict[str, Any]]:
+    """列出归档的会话（按归档时间倒序）"""
+    directory = Path(settings.retention_archive_dir)
+    if not directory.is_dir():
+        return []
+    archives = []
+    for path in directory.glob(f"*{ARCHIVE_SUFFIX}"):
+        stat = path.stat()
+        try:
+            header = _read_archive_header(path)
+        except Exception as e:
+            logger.warning(f"无法读取归档文件 {path}: {e}")
+            header = {}
+        archives.append({
+            "session_id": path.name[:-len(ARCHIVE_SUFFIX)],
+            "title": header.get("title"),
+            "updated_at": header.get("updated_at"),
+            "archived_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+            "bytes": stat.st_size
+        })
+    archives.sort(key=lambda item: item["archived_at"], reverse=True)
+    return archives
+
+# SQLite：单条语句在写锁内完成扫描和删除，不会误删并发写入中正在引用的blob
+SQLITE_ORPHAN_BLOBS = """
+    DELETE FROM tool_result_blobs WHERE hash NOT IN (
+        SELECT json_extract(j.value, '$."$blob"')
+        FROM chat_messages m, json_each(m.tool_results) j
+        WHERE m.tool_results IS NOT NULL AND j.type = 'object'
+          AND json_extract(j.value, '$."$blob"') IS NOT NULL
+    )
+"""
+
+async def delete_orphan_blobs(dry_run: bool = False) -> int:
+    """删除不再被任何消息引用的工具结果blob"""
+    async with AsyncSessionLocal() as db:
+        if db.bind.dialect.name == "sqlite" and not dry_run:
+            result = await db.execute(text(SQLITE_ORPHAN_BLOBS))
+            await db.commit()
+            return result.rowcount
+
+        # 其他数据库：流式扫描引用后删除；只删除扫描开始前就已存在的blob，缩小与并发写入的竞争窗口
+        started = datetime.now() - timedelta(hours=1)
+        referenced = set()
+        result = await db.stream(
+            select(ChatMessage.tool_results).where(ChatMessage.tool_results.isnot(None))
+            .execution_options(yield_per=settings.bulk_batch_size)
+        )
+        async for partition in result.scalars().partitions():
+            referenced |= referenced_hashes(partition)
+        orphans = [
+            digest for digest in (await db.execute(
+                select(ToolResultBlob.hash).where(ToolResultBlob.created_at < started)
+            )).scalars().all()
+            if digest not in referenced
+        ]
+        if dry_run:
+            return len(orphans)
+        for i in range(0, len(orphans), settings.bulk_batch_size):
+            await db.execute(delete(ToolResultBlob).where(
+                ToolResultBlob.hash.in_(orphans[i:i + settings.bulk_batch_size])
+            ))
+        await db.commit()
+        return len(orphans)
+
+def sqlite_path() -> Optional[str]:
+    """SQLite数据库文件路径（非SQLite或内存库返回None）"""
+    if engine.dialect.name != "sqlite" or engine.url.database in (None, "", ":memory:"):
+        return None
+    return engine.url.database
+
+def _sqlite_stats(conn: sqlite3.Connection) -> Dict[str, int]:
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return {
+        "bytes": conn.execute("PRAGMA page_count").fetchone()[0] * page_size,
+        "free_bytes": conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size
+    }
+
+def vacuum(full: bool = False) -> Dict[str, Any]:
+    """归还空闲页并更新统计信息，返回执行前后的数据库大小
+
+    库已开启auto_vacuum=INCREMENTAL时执行增量清理（只移动空闲页，耗时与释放量成正比）；
+    full=True时执行完整VACUUM（重建整个文件，期间阻塞写入），同时把旧库转换为增量模式。
+    """
+    path = sqlite_path()
+    if path is None:
+        return {"skipped": "仅支持SQLite文件数据库"}
+    # isolation_level=None：VACUUM不能在事务中执行；增量清理用executescript执行到完成（execute每次只释放一页）
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        before = _sqlite_stats(conn)
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if full:
+            if mode != 2:
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.executescript("VACUUM")
+            method = "full"
+        elif mode == 2:
+            conn.executescript("PRAGMA incremental_vacuum")
+            method = "incremental"
+        else:
+            method = "none"
+            logger.info("数据库未开启增量自动清理，空闲页留待复用；执行 python -m app.retention vacuum --full 可归还空间")
+        conn.executescript("ANALYZE")
+        after = _sqlite_stats(conn)
+    finally:
+        conn.close()
+    return {
+        "method": method,
+        "bytes_before": before["bytes"],
+        "bytes_after": after["bytes"],
+        "bytes_freed": before["bytes"] - after["bytes"],
+        "free_bytes": after["free_bytes"]
+    }
+
+async def analyze():
+    """非SQLite数据库只更新统计信息（空间回收交给数据库自身的autovacuum）"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(text("ANALYZE"))
+        await db.commit()
+
+async def run_maintenance(dry_run: bool = False, full_vacuum: bool = False) -> Dict[str, Any]:
+    """执行一次完整的数据保留任务，返回报告"""
+    started = time.perf_counter()
+    now = datetime.now()
+    report: Dict[str, Any] = {"started_at": now.isoformat(), "dry_run": dry_run}
+
+    if settings.retention_purge_after_days > 0:
+        report["purged"] = await purge_deleted_sessions(
+            now - timedelta(days=settings.retention_purge_after_days), dry_run
+        )
+    if settings.retention_archive_after_days > 0:
+        report["archived"] = await archive_idle_sessions(
+            now - timedelta(days=settings.retention_archive_after_days), dry_run
+        )
+    report["orphan_blobs"] = await delete_orphan_blobs(dry_run)
+
+    if not dry_run:
+        if sqlite_path() is not None:
+            report["vacuum"] = await asyncio.to_thread(vacuum, full_vacuum)
+        elif engine.dialect.name != "sqlite":
+            await analyze()
+    report["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"数据保留任务完成: {report}")
+    return report
+
+async def retention_loop():
+    """服务进程内的定期数据保留任务（retention_enabled开启时由lifespan启动）"""
+    while True:
+        await asyncio.sleep(settings.retention_interval_seconds)
+        try:
+            await run_maintenance()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"数据保留任务失败: {e}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Research Agent 数据保留与压缩")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="清理软删除会话、归档闲置会话、清理blob并执行VACUUM")
+    run_parser.add_argument("--dry-run", action="store_true", help="只统计将要处理的数据，不做修改")
+    run_parser.add_argument("--full-vacuum", action="store_true", help="执行完整VACUUM（阻塞写入）")
+    commands.add_parser("list", help="列出已归档的会话")
+    restore_parser = commands.add_parser("restore", help="从归档恢复会话")
+    restore_parser.add_argument("session_id")
+    archive_parser = commands.add_parser("archive", help="立即归档指定会话")
+    archive_parser.add_argument("session_id")
+    vacuum_parser = commands.add_parser("vacuum", help="只执行VACUUM和ANALYZE")
+    vacuum_parser.add_argument("--full", action="store_true", help="执行完整VACUUM并开启增量自动清理")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    async def execute():
+        from app.database import create_tables_async, async_engine
+        await create_tables_async()
+        try:
+            if args.command == "run":
+                return await run_maintenance(args.dry_run, args.full_vacuum)
+            if args.command == "list":
+                return list_archives()
+            if args.command == "restore":
+                # 恢复的消息需要计算token数
+                await asyncio.to_thread(load_encoding)
+                return await restore_session(args.session_id)
+            if args.command == "archive":
+                return await archive_session(args.session_id) or {"error": "会话不存在"}
+            return vacuum(args.full)
+        finally:
+            await async_engine.dispose()
+
+    print(json.dumps(asyncio.run(execute()), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
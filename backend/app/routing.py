@@ -0,0 +1,64 @@
+from typing import Dict, List, Optional, Tuple
+import re
+
+from app.config import settings
+
+# 快速通道路由：判断一轮用户消息是否需要工具
+# 寒暄、致谢，以及针对上文的翻译/改写/解释等消息不需要检索论文，直接调用LLM（精简提示词、较低max_tokens）；
+# 其余消息交给带工具的Agent。规则宁可漏判（多走Agent）也不误判，出现任何检索信号都走Agent。
+# 路由结果按 (route, reason) 记录到 agent_route_decisions_total，reason 取值固定，便于按原因调整规则。
+
+ROUTE_AGENT = "agent"
+ROUTE_DIRECT = "direct"
+
+# 检索信号：出现即走Agent
+RESEARCH_PATTERN = re.compile(
+    r"论文|文献|综述|预印本|期刊|会议|作者|引用|arxiv|最新|最近|近期|进展|前沿|搜索|检索|查找|查一下|找一下|找找|推荐|"
+    r"\bpapers?\b|\barticles?\b|\bsurveys?\b|\bresearch\b|\bpublications?\b|\bpreprints?\b|\bjournals?\b|"
+    r"\bconferences?\b|\bauthors?\b|\bcit(?:e|ed|ation|ations)\b|\blatest\b|\brecent\b|\bsota\b|"
+    r"state of the art|\bsearch\b|\bfind\b|look up|\brecommend",
+    re.I
+)
+# arXiv编号或链接
+REFERENCE_PATTERN = re.compile(r"\b\d{4}\.\d{4,5}(?:v\d+)?\b|https?://", re.I)
+# 整条消息只是寒暄、致谢或确认（可以连用，后面只能跟标点、空白和语气词）
+SMALL_TALK_WORDS = (
+    r"你好|您好|嗨|哈喽|早上好|下午好|晚上好|谢谢|多谢|感谢|好的|好吧|明白|知道了|收到|没问题|再见|拜拜|"
+    r"hi|hello|hey|thanks|thank you|thx|ok|okay|got it|great|cool|nice|bye|goodbye"
+)
+SMALL_TALK_PATTERN = re.compile(
+    rf"^(?:(?:{SMALL_TALK_WORDS})(?![a-z])[\s,，、!！。.~～啊呀呢哈啦了哦噢嗯你您]*)+$",
+    re.I
+)
+# 针对上一轮回答的加工：翻译、改写、解释等（需要有历史消息，且明确指代上文或消息很短，见classify_turn）
+TRANSFORM_PATTERN = re.compile(
+    r"翻译|译成|译为|用(?:英文|中文|英语|汉语)|换(?:个|种)说法|改写|润色|简化|精简|缩短|通俗|再详细|更详细|展开说|"
+    r"总结一下|概括|解释一下|什么意思|举个例子|"
+    r"\btranslate|\brephrase|\brewrite|\bparaphrase|\bsimplify|\bshorten|\bsummari[sz]e|\bexplain|\belaborate|"
+    r"in (?:english|chinese)",
+    re.I
+)
+# 指代上一轮回答的词：“解释一下这个”“translate it”；没有指代的“解释一下注意力机制”“explain transformers”是新问题
+DEICTIC_PATTERN = re.compile(
+    r"上面|上文|上述|以上|前面|刚才|刚刚|这个|这段|这句|这些|这里|这是|那个|那段|那句|你的回答|你说的|"
+    r"\b(?:it|this|that|these|those|above|previous|your (?:answer|reply|response))\b",
+    re.I
+)
+
+def _refers_to_answer(text: str) -> bool:
+    """消息明确指代上一轮回答，或短到只剩加工指令本身（“翻译成英文”“什么意思”）"""
+    return len(text) <= settings.fast_path_transform_max_chars or bool(DEICTIC_PATTERN.search(text))
+
+def classify_turn(message: str, history: Optional[List[Dict]] = None) -> Tuple[str, str]:
+    """判断本轮消息走快速通道还是Agent，返回 (route, reason)"""
+    if not settings.fast_path_enabled:
+        return ROUTE_AGENT, "disabled"
+    text = message.strip()
+    if RESEARCH_PATTERN.search(text) or REFERENCE_PATTERN.search(text):
+        return ROUTE_AGENT, "research"
+    if len(text) <= settings.fast_path_small_talk_max_chars and SMALL_TALK_PATTERN.match(text):
+        return ROUTE_DIRECT, "small_talk"
+    has_answer = any(msg["role"] == "assistant" for msg in (history or []))
+    if has_answer and TRANSFORM_PATTERN.search(text) and _refers_to_answer(text):
+        return ROUTE_DIRECT, "transform"
+    return ROUTE_AGENT, "default"
@@ -0,0 +1,376 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import time
+import uuid
+
+from app.config import settings
+from app.context import build_history
+from app.services import agent_service
+from app.routing import ROUTE_DIRECT
+from app.persistence import message_writer
+from app.scheduler import agent_scheduler, AdmissionTicket
+from app.schemas import MessageCreate
+from app.singleflight import EventBroadcast
+from app.metrics import STREAM_FIRST_CHUNK, ERRORS
+
+logger = logging.getLogger(__name__)
+
+def make_event_id(run_id: str, index: int) -> str:
+    """SSE事件ID：运行ID:事件序号"""
+    return f"{run_id}:{index}"
+
+def parse_event_id(value: str) -> Tuple[str, int]:
+    """解析Last-Event-ID，格式错误时抛出ValueError"""
+    run_id, sep, index = value.strip().rpartition(":")
+    if not sep or not run_id:
+        raise ValueError(f"无效的事件ID: {value}")
+    return run_id, int(index)
+
+class RunQueueFull(Exception):
+    """后台运行队列已满"""
+
+# 运行被取消时发送给订阅者的最后一个事件
+CANCELLED_EVENT = {"type": "cancelled", "content": "", "is_final": True, "tool_calls": None}
+
+class StreamRun:
+    """一次Agent运行，事件写入有界回放缓冲区，与发起请求的连接解耦
+
+    状态：queued -> running -> succeeded / failed / cancelled
+    """
+
+    def __init__(self, run_id: str, session_id: str, message: str, max_events: int, ttl_seconds: float,
+                 detached: bool = False):
+        self.id = run_id
+        self.session_id = session_id
+        self.message = message
+        self.detached = detached
+        self.ttl_seconds = ttl_seconds
+        self.broadcast = EventBroadcast(max_events=max_events)
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.content = ""
+        self.message_id: Optional[str] = None
+        self.error: Optional[str] = None
+        self.cancelled = False
+        self.subscribers = 0  # 当前连接的SSE客户端数
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "detached": self.detached,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "events": self.broadcast.total,
+            "content": self.content,
+            "message_id": self.message_id,
+            "error": self.error
+        }
+
+async def agent_events(run: StreamRun, history: List[Dict],
+                       started: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+    """运行Agent并产出流式事件，结束后保存Assistant消息
+
+    运行被取消时，已生成的部分内容标记为cancelled后保存，保持会话历史完整。
+    运行凭证由执行该事件流的StreamRunRegistry在保存完成后释放。
+    started为/stream收到请求的时刻，用于统计首个数据块耗时；后台运行（/runs）没有等待首字节的客户端，不传也不统计。
+    """
+    logger.info(f"Starting stream generation (run {run.id})")
+    tool_calls: List[Dict[str, Any]] = []
+    tool_results: Dict[str, Any] = {}
+    meta = None
+    saved = False
+    stream = agent_service.process_stream(run.message, history, run.session_id)
+    try:
+        first_chunk = started is not None
+
+        async for chunk in stream:
+            if chunk.get("type") in ("token", "error"):
+                run.content += chunk["content"]
+            if chunk.get("type") == "error":
+                run.error = chunk["content"]
+            elif chunk.get("type") == "tool_call":
+                tool_calls.extend(chunk.get("tool_calls") or [])
+            elif chunk.get("type") == "tool_result":
+                tool_results[chunk["tool_call_id"]] = chunk.get("result")
+            if chunk.get("is_final"):
+                tool_calls = chunk.get("tool_calls") or tool_calls
+                tool_results = chunk.get("tool_results") or tool_results
+                if chunk.get("cached"):
+                    meta = {"cache_hit": True}
+                elif chunk.get("route") == ROUTE_DIRECT:
+                    meta = {"route": ROUTE_DIRECT}
+
+            if first_chunk:
+                first_chunk = False
+                STREAM_FIRST_CHUNK.observe(time.perf_counter() - started)
+            yield chunk
+
+        # 保存完整的Assistant消息（经写入管线，不依赖请求级数据库会话的生命周期）
+        if run.content:
+            saved = True
+            message = await message_writer.submit(MessageCreate(
+                session_id=run.session_id,
+                role="assistant",
+                content=run.content,
+                tool_calls=tool_calls or None,
+                tool_results=tool_results or None,
+                meta=meta
+            ))
+            run.message_id = message.id
+
+    except Exception as e:
+        logger.error(f"流式处理异常: {e}")
+        ERRORS.inc(component="stream")
+        run.error = f"错误: {str(e)}"
+        yield {'type': 'error', 'content': run.error, 'is_final': True}
+    finally:
+        # 逐层关闭生成器，使取消传递到Agent运行及其中的工具调用
+        await stream.aclose()
+        # 被取消（CancelledError）或被关闭（GeneratorExit）时保存已生成的部分内容
+        if run.cancelled and not saved and (run.content or tool_calls):
+            message = await message_writer.submit(MessageCreate(
+                session_id=run.session_id,
+                role="assistant",
+                content=run.content,
+                tool_calls=tool_calls or None,
+                tool_results=tool_results or None,
+                meta={"cancelled": True}
+            ))
+            run.message_id = message.id
+            logger.info(f"运行 {run.id} 已取消，保存部分内容 {len(run.content)} 字符")
+
+class StreamRunRegistry:
+    """进行中和刚结束的Agent运行，断线重连时按Last-Event-ID续传
+
+    运行在后台任务中执行，客户端断开不影响运行；运行结束后缓冲区保留ttl_seconds秒。
+    """
+
+    def __init__(self, ttl_seconds: float, max_events: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_events = max_events
+        self._runs: Dict[str, StreamRun] = {}
+        self._aborting: Set[asyncio.Task] = set()
+
+    def create(self, session_id: str, message: str, detached: bool = False,
+               ttl_seconds: Optional[float] = None) -> StreamRun:
+        run = StreamRun(
+            uuid.uuid4().hex, session_id, message, self.max_events,
+            self.ttl_seconds if ttl_seconds is None else ttl_seconds, detached
+        )
+        self._runs[run.id] = run
+        return run
+
+    def start(self, run: StreamRun, source: AsyncIterator[Dict],
+              ticket: Optional[AdmissionTicket] = None) -> StreamRun:
+        """在后台任务中消费source，事件发布到运行的回放缓冲区；运行结束时释放ticket"""
+        run.task = asyncio.create_task(self.execute(run, source, ticket))
+        run.task.add_done_callback(lambda task: self._on_task_done(run, source, ticket, task))
+        return run
+
+    def _on_task_done(self, run: StreamRun, source: AsyncIterator[Dict],
+                      ticket: Optional[AdmissionTicket], task: asyncio.Task):
+        """任务在开始执行前就被取消时execute不会运行：在这里释放凭证并结束运行"""
+        if ticket is not None:
+            ticket.release()
+        if run.finished:
+            return
+        run.cancelled = run.cancelled or task.cancelled()
+        abort = asyncio.get_running_loop().create_task(self._abort(run, source))
+        self._aborting.add(abort)
+        abort.add_done_callback(self._aborting.discard)
+
+    async def _abort(self, run: StreamRun, source: AsyncIterator[Dict]):
+        await source.aclose()
+        await self.close(run, CANCELLED_EVENT if run.cancelled else None)
+
+    async def execute(self, run: StreamRun, source: AsyncIterator[Dict],
+                      ticket: Optional[AdmissionTicket] = None):
+        """在当前任务中消费source直到结束或被取消，结束时释放ticket（可为None）"""
+        run.status = "running"
+        run.started_at = time.time()
+        try:
+            async for event in source:
+                await run.broadcast.publish(event)
+        except asyncio.CancelledError:
+            # 关闭生成器以保存部分内容，通知订阅者后正常结束（取消已处理，不再向上传播）
+            run.cancelled = True
+            await source.aclose()
+            await run.broadcast.publish(CANCELLED_EVENT)
+        except Exception as e:
+            logger.error(f"运行 {run.id} 异常结束: {e}")
+            run.error = run.error or str(e)
+        finally:
+            # 事件流结束时部分内容已保存，先释放会话锁和并发名额再通知订阅者
+            if ticket is not None:
+                ticket.release()
+            await self.close(run)
+
+    async def close(self, run: StreamRun, event: Optional[Dict[str, Any]] = None):
+        """结束运行：可选地发布最后一个事件，关闭事件流并在ttl后移除"""
+        if event is not None:
+            await run.broadcast.publish(event)
+        await run.broadcast.close()
+        if run.finished:
+            return
+        run.status = "cancelled" if run.cancelled else "failed" if run.error else "succeeded"
+        run.finished_at = time.time()
+        asyncio.get_running_loop().call_later(run.ttl_seconds, self._expire, run.id)
+
+    def _expire(self, run_id: str):
+        self._runs.pop(run_id, None)
+
+    def cancel(self, run: StreamRun) -> bool:
+        """取消运行（排队中的运行在出队时跳过），已结束时返回False"""
+        if run.finished:
+            return False
+        run.cancelled = True
+        if run.task is not None:
+            run.task.cancel()
+        logger.info(f"取消运行 {run.id}")
+        return True
+
+    def cancel_session(self, session_id: str) -> int:
+        """取消会话中进行中的交互式运行（用户开始了新的问题）"""
+        return sum(
+            self.cancel(run) for run in list(self._runs.values())
+            if run.session_id == session_id and not run.detached and not run.finished
+        )
+
+    def subscribe(self, run: StreamRun):
+        run.subscribers += 1
+
+    def unsubscribe(self, run: StreamRun, grace_seconds: float):
+        """SSE客户端断开；交互式运行在宽限期内无人重连则取消"""
+        run.subscribers -= 1
+        if run.detached or run.finished or run.subscribers > 0 or grace_seconds < 0:
+            return
+        asyncio.get_running_loop().call_later(grace_seconds, self._cancel_if_abandoned, run.id)
+
+    def _cancel_if_abandoned(self, run_id: str):
+        run = self._runs.get(run_id)
+        if run is not None and run.subscribers <= 0 and not run.finished:
+            logger.info(f"客户端已断开且未重连，取消运行 {run.id}")
+            self.cancel(run)
+
+    def get(self, run_id: str) -> Optional[StreamRun]:
+        return self._runs.get(run_id)
+
+    def stats(self) -> Dict[str, int]:
+        counts = {"queued": 0, "running": 0, "succeeded": 0, "failed": 0, "cancelled": 0}
+        for run in self._runs.values():
+            counts[run.status] = counts.get(run.status, 0) + 1
+        return counts
+
+class RunWorkerPool:
+    """后台（分离式）Agent运行：提交后立即返回运行ID，由固定数量的工作协程执行
+
+    运行不依赖任何HTTP连接；客户端可轮询运行状态，或按运行ID订阅SSE事件。
+    """
+
+    def __init__(self, registry: StreamRunRegistry, workers: int, max_pending: int, ttl_seconds: float):
+        self.registry = registry
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.ttl_seconds = ttl_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"后台运行工作池已启动（{self.workers} 个工作协程）")
+
+    async def stop(self):
+        """停止工作协程，尚未执行的运行标记为失败"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self._queue is not None and not self._queue.empty():
+            run = self._queue.get_nowait()
+            run.error = "服务关闭，运行未执行"
+            await self.registry.close(run, {'type': 'error', 'content': run.error, 'is_final': True})
+
+    def submit(self, session_id: str, message: str) -> StreamRun:
+        """提交后台运行，队列已满时抛出RunQueueFull"""
+        if not self.running:
+            raise RunQueueFull("后台运行工作池未启动")
+        if self.pending >= self.max_pending:
+            raise RunQueueFull("后台运行排队过多，请稍后重试")
+        run = self.registry.create(session_id, message, detached=True, ttl_seconds=self.ttl_seconds)
+        self._queue.put_nowait(run)
+        return run
+
+    async def _worker(self):
+        while True:
+            run = await self._queue.get()
+            if run.cancelled:
+                await self.registry.close(run, CANCELLED_EVENT)
+                continue
+            # 每个运行在独立任务中执行，取消运行不影响工作协程
+            run.task = asyncio.create_task(self._execute(run))
+            await asyncio.wait([run.task])
+            if not run.finished:
+                # 在开始执行前被取消
+                await self.registry.close(run, CANCELLED_EVENT)
+            if not run.task.cancelled() and run.task.exception():
+                logger.error(f"后台运行 {run.id} 失败: {run.task.exception()}")
+
+    async def _execute(self, run: StreamRun):
+        # 后台运行已由本队列限流，不受请求准入的排队上限和时限约束，但仍遵守全局并发和会话内串行
+        ticket = None
+        try:
+            ticket = await agent_scheduler.acquire(run.session_id, bounded=False)
+            history = await build_history(run.session_id)
+            await message_writer.submit(MessageCreate(
+                session_id=run.session_id,
+                role="user",
+                content=run.message
+            ))
+        except asyncio.CancelledError:
+            if ticket is not None:
+                ticket.release()
+            await self.registry.close(run, CANCELLED_EVENT)
+            return
+        except Exception as e:
+            if ticket is not None:
+                ticket.release()
+            run.error = f"错误: {str(e)}"
+            await self.registry.close(run, {'type': 'error', 'content': run.error, 'is_final': True})
+            return
+        await self.registry.execute(run, agent_events(run, history), ticket)
+
+# 全局运行表
+stream_runs = StreamRunRegistry(
+    ttl_seconds=settings.stream_replay_ttl_seconds,
+    max_events=settings.stream_replay_max_events
+)
+
+# 全局后台运行工作池
+run_workers = RunWorkerPool(
+    stream_runs,
+    workers=settings.run_workers,
+    max_pending=settings.run_queue_max_size,
+    ttl_seconds=settings.run_result_ttl_seconds
+)
@@ -0,0 +1,150 @@
+from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import math
+
+from app.config import settings
+from app.metrics import registry, Gauge, ADMISSION_REJECTED
+
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """请求未被接纳（队列已满或排队超时）"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class AdmissionTicket:
+    """已接纳的Agent运行凭证，结束时必须释放（可重复调用）"""
+
+    def __init__(self, scheduler: "AgentScheduler", session_id: Optional[str], started: float):
+        self.scheduler = scheduler
+        self.session_id = session_id
+        self.started = started
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.scheduler._release(self)
+
+class AgentScheduler:
+    """Agent运行的准入控制
+
+    - 全局并发上限：同时运行的Agent数量
+    - 有界等待队列：队列已满立即返回429，排队超过时限返回503，均附带Retry-After
+    - 会话内串行：同一会话的消息依次处理，避免历史交错
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        # session_id -> [锁, 引用计数]
+        self._session_locks: Dict[str, List] = {}
+        self.waiting = 0
+        self.running = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._avg_run_seconds = 0.0
+
+    def retry_after(self) -> int:
+        """按平均运行时长估算排队者需要等待的秒数"""
+        avg = self._avg_run_seconds or 5.0
+        return max(1, math.ceil(avg * (self.waiting + 1) / self.max_concurrency))
+
+    def _get_session_lock(self, session_id: str) -> asyncio.Lock:
+        entry = self._session_locks.get(session_id)
+        if entry is None:
+            entry = self._session_locks[session_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _put_session_lock(self, session_id: str):
+        entry = self._session_locks.get(session_id)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._session_locks[session_id]
+
+    async def acquire(self, session_id: Optional[str] = None, bounded: bool = True) -> AdmissionTicket:
+        """等待运行资格，失败时抛出AdmissionRejected
+        
+        bounded为False时不受等待队列长度和排队时限约束（用于已由后台任务队列限流的运行）。
+        """
+        if bounded and self.waiting >= self.max_queue and self._slots.locked():
+            self.rejected += 1
+            ADMISSION_REJECTED.inc(reason="queue_full")
+            raise AdmissionRejected(429, "请求过多，请稍后重试", self.retry_after())
+
+        loop = asyncio.get_running_loop()
+        timeout = self.queue_timeout if bounded else None
+        deadline = loop.time() + self.queue_timeout
+        lock = self._get_session_lock(session_id) if session_id else None
+        got_lock = got_slot = False
+        self.waiting += 1
+        try:
+            if lock:
+                await asyncio.wait_for(lock.acquire(), timeout)
+                got_lock = True
+            await asyncio.wait_for(self._slots.acquire(), max(0.0, deadline - loop.time()) if bounded else None)
+            got_slot = True
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            ADMISSION_REJECTED.inc(reason="queue_timeout")
+            raise AdmissionRejected(503, "服务繁忙，排队超时，请稍后重试", self.retry_after())
+        finally:
+            self.waiting -= 1
+            if not got_slot:
+                if got_lock:
+                    lock.release()
+                if session_id:
+                    self._put_session_lock(session_id)
+
+        self.running += 1
+        return AdmissionTicket(self, session_id, loop.time())
+
+    def _release(self, ticket: AdmissionTicket):
+        self.running -= 1
+        self._slots.release()
+        if ticket.session_id:
+            entry = self._session_locks.get(ticket.session_id)
+            if entry is not None:
+                entry[0].release()
+            self._put_session_lock(ticket.session_id)
+        duration = asyncio.get_running_loop().time() - ticket.started
+        # 指数移动平均，用于估算Retry-After
+        self._avg_run_seconds = duration if not self._avg_run_seconds else 0.8 * self._avg_run_seconds + 0.2 * duration
+
+    @asynccontextmanager
+    async def admit(self, session_id: Optional[str] = None):
+        ticket = await self.acquire(session_id)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_run_seconds": round(self._avg_run_seconds, 3)
+        }
+
+# 全局调度器
+agent_scheduler = AgentScheduler(
+    max_concurrency=settings.agent_max_concurrency,
+    max_queue=settings.agent_queue_max_size,
+    queue_timeout=settings.agent_queue_timeout_seconds
+)
+
+registry.register(Gauge(
+    "agent_queue_waiting", "等待运行的Agent请求数", callback=lambda: agent_scheduler.waiting
+))
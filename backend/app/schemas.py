@@ -8,6 +8,7 @@ class MessageBase(BaseModel):
     content: str
     tool_calls: Optional[List[Dict[str, Any]]] = None
     tool_results: Optional[Dict[str, Any]] = None
+    meta: Optional[Dict[str, Any]] = None
 
 # 消息创建请求
 class MessageCreate(MessageBase):
@@ -38,6 +39,72 @@ class SessionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# 会话摘要（列表用，不含消息内容）
+class SessionSummary(BaseModel):
+    id: str
+    title: str
+    created_at: datetime
+    updated_at: datetime
+    is_active: bool
+    message_count: int = 0
+    last_message_preview: Optional[str] = None
+    last_message_at: Optional[datetime] = None
+
+# 搜索结果：消息命中
+class MessageSearchHit(BaseModel):
+    message_id: str
+    session_id: str
+    session_title: str
+    role: str
+    created_at: datetime
+    snippet: str  # 命中片段，关键词以<mark>标记
+    rank: Optional[float] = None  # BM25得分，越小越相关
+
+# 搜索结果：会话标题命中
+class SessionSearchHit(BaseModel):
+    session_id: str
+    title: str
+    updated_at: datetime
+    snippet: str
+    rank: Optional[float] = None
+
+# 搜索响应
+class SearchResponse(BaseModel):
+    query: str
+    sessions: List[SessionSearchHit] = []  # 仅第一页返回
+    messages: List[MessageSearchHit] = []
+    has_more: bool = False
+    next_offset: Optional[int] = None
+
+# 本地论文库检索结果
+class PaperHit(BaseModel):
+    id: str  # arXiv ID；没有ID的论文为 title:<标题哈希>
+    title: str
+    authors: Optional[str] = None
+    published: Optional[str] = None
+    snippet: str  # 摘要中的命中片段，关键词以<mark>标记
+    rank: Optional[float] = None  # BM25得分，越小越相关
+
+class PaperSearchResponse(BaseModel):
+    query: str
+    papers: List[PaperHit] = []
+    has_more: bool = False
+    next_offset: Optional[int] = None
+
+# 论文详情
+class PaperResponse(BaseModel):
+    id: str
+    title: str
+    authors: Optional[str] = None
+    summary: Optional[str] = None
+    published: Optional[str] = None
+    seen: int = 1
+    created_at: datetime
+    updated_at: datetime
+    
+    class Config:
+        from_attributes = True
+
 # 聊天请求
 class ChatRequest(BaseModel):
     session_id: Optional[str] = None
@@ -52,6 +119,11 @@ class ChatResponse(BaseModel):
 
 # 流式响应块
 class ChatStreamChunk(BaseModel):
+    type: str = "token"  # token, tool_call, tool_result, final, error, cancelled
     content: str
     is_final: bool = False
     tool_calls: Optional[List[Dict[str, Any]]] = None
+    tool_results: Optional[Dict[str, Any]] = None
+    tool_call_id: Optional[str] = None
+    name: Optional[str] = None
+    result: Optional[str] = None
@@ -0,0 +1,285 @@
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text, DateTime
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+import re
+
+from app.metrics import observe_db
+
+logger = logging.getLogger(__name__)
+
+# SQLite FTS5 全文索引（外部内容表，不重复存储正文）
+#
+# 约定：只有活跃会话的消息和标题在索引中。触发器在消息插入/删除、会话软删除/恢复/删除时
+# 维护该约定，因此外部内容表的'delete'命令总能给出与索引一致的旧值。
+# 使用trigram分词器，支持中文等无空格语言的子串匹配（检索词至少3个字符，更短的词用LIKE补充）。
+
+FTS_TABLES = ("chat_messages_fts", "chat_sessions_fts", "papers_fts")
+
+FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE chat_messages_fts USING fts5("
+    "content, content='chat_messages', content_rowid='rowid', tokenize='trigram')",
+    "CREATE VIRTUAL TABLE chat_sessions_fts USING fts5("
+    "title, content='chat_sessions', content_rowid='rowid', tokenize='trigram')",
+    # 论文库以英文为主，使用词干化分词以获得更好的BM25相关度
+    "CREATE VIRTUAL TABLE papers_fts USING fts5("
+    "title, authors, summary, content='papers', content_rowid='rowid', tokenize='porter unicode61')",
+)
+
+FTS_TRIGGERS = (
+    # 消息：仅索引活跃会话中的消息
+    """CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ai AFTER INSERT ON chat_messages
+    WHEN (SELECT is_active FROM chat_sessions WHERE id = new.session_id) = 1
+    BEGIN
+        INSERT INTO chat_messages_fts(rowid, content) VALUES (new.rowid, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ad AFTER DELETE ON chat_messages
+    WHEN (SELECT is_active FROM chat_sessions WHERE id = old.session_id) = 1
+    BEGIN
+        INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_messages_fts_au AFTER UPDATE OF content ON chat_messages
+    WHEN (SELECT is_active FROM chat_sessions WHERE id = new.session_id) = 1
+    BEGIN
+        INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+        INSERT INTO chat_messages_fts(rowid, content) VALUES (new.rowid, new.content);
+    END""",
+    # 会话软删除/恢复：整体移出/放回该会话的消息
+    """CREATE TRIGGER IF NOT EXISTS chat_sessions_fts_deactivate AFTER UPDATE OF is_active ON chat_sessions
+    WHEN old.is_active = 1 AND new.is_active IS NOT 1
+    BEGIN
+        INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content)
+            SELECT 'delete', rowid, content FROM chat_messages WHERE session_id = old.id;
+        INSERT INTO chat_sessions_fts(chat_sessions_fts, rowid, title) VALUES ('delete', old.rowid, old.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_sessions_fts_activate AFTER UPDATE OF is_active ON chat_sessions
+    WHEN old.is_active IS NOT 1 AND new.is_active = 1
+    BEGIN
+        INSERT INTO chat_messages_fts(rowid, content)
+            SELECT rowid, content FROM chat_messages WHERE session_id = new.id;
+        INSERT INTO chat_sessions_fts(rowid, title) VALUES (new.rowid, new.title);
+    END""",
+    # 会话标题
+    """CREATE TRIGGER IF NOT EXISTS chat_sessions_fts_ai AFTER INSERT ON chat_sessions
+    WHEN new.is_active = 1
+    BEGIN
+        INSERT INTO chat_sessions_fts(rowid, title) VALUES (new.rowid, new.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_sessions_fts_au AFTER UPDATE OF title ON chat_sessions
+    WHEN old.is_active = 1 AND new.is_active = 1
+    BEGIN
+        INSERT INTO chat_sessions_fts(chat_sessions_fts, rowid, title) VALUES ('delete', old.rowid, old.title);
+        INSERT INTO chat_sessions_fts(rowid, title) VALUES (new.rowid, new.title);
+    END""",
+    # 硬删除活跃会话：先移出其消息（无论ORM先删子行还是外键级联后删子行都保持一致）
+    """CREATE TRIGGER IF NOT EXISTS chat_sessions_fts_bd BEFORE DELETE ON chat_sessions
+    WHEN old.is_active = 1
+    BEGIN
+        INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content)
+            SELECT 'delete', rowid, content FROM chat_messages WHERE session_id = old.id;
+        INSERT INTO chat_sessions_fts(chat_sessions_fts, rowid, title) VALUES ('delete', old.rowid, old.title);
+    END""",
+    # 本地论文库（app.papers）
+    """CREATE TRIGGER IF NOT EXISTS papers_fts_ai AFTER INSERT ON papers
+    BEGIN
+        INSERT INTO papers_fts(rowid, title, authors, summary) VALUES (new.rowid, new.title, new.authors, new.summary);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS papers_fts_ad AFTER DELETE ON papers
+    BEGIN
+        INSERT INTO papers_fts(papers_fts, rowid, title, authors, summary)
+            VALUES ('delete', old.rowid, old.title, old.authors, old.summary);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS papers_fts_au AFTER UPDATE OF title, authors, summary ON papers
+    BEGIN
+        INSERT INTO papers_fts(papers_fts, rowid, title, authors, summary)
+            VALUES ('delete', old.rowid, old.title, old.authors, old.summary);
+        INSERT INTO papers_fts(rowid, title, authors, summary) VALUES (new.rowid, new.title, new.authors, new.summary);
+    END""",
+)
+
+FTS_BACKFILL = (
+    """INSERT INTO chat_messages_fts(rowid, content)
+    SELECT m.rowid, m.content FROM chat_messages m JOIN chat_sessions s ON s.id = m.session_id
+    WHERE s.is_active = 1""",
+    "INSERT INTO chat_sessions_fts(rowid, title) SELECT rowid, title FROM chat_sessions WHERE is_active = 1",
+    "INSERT INTO papers_fts(rowid, title, authors, summary) SELECT rowid, title, authors, summary FROM papers",
+)
+
+# 建表时检测到FTS5可用后置为True；不可用（非SQLite或未编译FTS5/trigram）时使用LIKE检索
+fts_enabled = False
+
+def _existing_fts_tables(connection) -> set:
+    return {
+        row[0] for row in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ("
+            + ", ".join(f"'{table}'" for table in FTS_TABLES) + ")"
+        )
+    }
+
+def detect_search_index(connection):
+    """不建表的进程（多worker部署）根据索引表是否存在决定使用FTS5还是LIKE"""
+    global fts_enabled
+    if connection.dialect.name == "sqlite":
+        fts_enabled = set(FTS_TABLES) <= _existing_fts_tables(connection)
+
+def create_search_index(connection):
+    """创建FTS5索引表和同步触发器；首次创建时回填已有数据（在建表事务中调用）"""
+    global fts_enabled
+    if connection.dialect.name != "sqlite":
+        return
+    existing = _existing_fts_tables(connection)
+    try:
+        created = []
+        for table, statement, backfill in zip(FTS_TABLES, FTS_SCHEMA, FTS_BACKFILL):
+            if table not in existing:
+                connection.exec_driver_sql(statement)
+                created.append(backfill)
+        for statement in FTS_TRIGGERS:
+            connection.exec_driver_sql(statement)
+        for statement in created:
+            connection.exec_driver_sql(statement)
+        if created:
+            logger.info(f"已创建全文索引并回填已有数据: {len(created)} 张索引表")
+        fts_enabled = True
+    except Exception as e:
+        logger.warning(f"FTS5不可用，搜索将退化为LIKE扫描: {e}")
+
+def fts_query(query: str) -> Tuple[str, List[str]]:
+    """把用户输入拆成FTS5短语查询（各词为AND关系）和需要用LIKE匹配的短词"""
+    phrases, short_terms = [], []
+    for term in query.split():
+        if len(term) >= 3:
+            phrases.append('"' + term.replace('"', '""') + '"')
+        else:
+            short_terms.append(term)
+    return " ".join(phrases), short_terms
+
+# FTS5查询语法错误（检索词本身的问题）；锁等待超时、缺表等其他数据库错误属于服务端故障
+FTS_SYNTAX_ERROR = re.compile(r"fts5: syntax error|unterminated string", re.I)
+
+def is_query_syntax_error(error: Exception) -> bool:
+    return isinstance(error, OperationalError) and bool(FTS_SYNTAX_ERROR.search(str(error.orig)))
+
+def _like(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def make_snippet(content: str, terms: List[str], width: int = 32) -> str:
+    """在第一个命中词附近截取片段并高亮（LIKE检索时使用）"""
+    lower = content.lower()
+    positions = [(lower.find(term.lower()), term) for term in terms]
+    positions = [(pos, term) for pos, term in positions if pos >= 0]
+    if not positions:
+        return content[:width * 2]
+    pos, term = min(positions)
+    start = max(0, pos - width)
+    end = min(len(content), pos + len(term) + width)
+    return (
+        ("…" if start > 0 else "")
+        + content[start:pos] + "<mark>" + content[pos:pos + len(term)] + "</mark>" + content[pos + len(term):end]
+        + ("…" if end < len(content) else "")
+    )
+
+@observe_db
+async def search_messages(db: AsyncSession, query: str, limit: int, offset: int = 0,
+                          session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """检索活跃会话中的消息，按BM25相关度排序，返回limit+1条用于判断是否还有更多"""
+    match, short_terms = fts_query(query)
+    params: Dict[str, Any] = {"limit": limit + 1, "offset": offset}
+    conditions = ["s.is_active = 1" if db.bind.dialect.name == "sqlite" else "s.is_active = true"]
+    if session_id:
+        conditions.append("m.session_id = :session_id")
+        params["session_id"] = session_id
+
+    if fts_enabled and match:
+        for i, term in enumerate(short_terms):
+            conditions.append(f"m.content LIKE :term{i} ESCAPE '\\'")
+            params[f"term{i}"] = _like(term)
+        params["match"] = match
+        sql = f"""
+            SELECT m.id, m.session_id, s.title, m.role, m.created_at,
+                   snippet(chat_messages_fts, 0, '<mark>', '</mark>', '…', 24) AS snippet,
+                   bm25(chat_messages_fts) AS rank
+            FROM chat_messages_fts
+            JOIN chat_messages m ON m.rowid = chat_messages_fts.rowid
+            JOIN chat_sessions s ON s.id = m.session_id
+            WHERE chat_messages_fts MATCH :match AND {' AND '.join(conditions)}
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset
+        """
+    else:
+        terms = query.split()
+        for i, term in enumerate(terms):
+            conditions.append(f"m.content LIKE :term{i} ESCAPE '\\'")
+            params[f"term{i}"] = _like(term)
+        sql = f"""
+            SELECT m.id, m.session_id, s.title, m.role, m.created_at, m.content AS snippet, NULL AS rank
+            FROM chat_messages m
+            JOIN chat_sessions s ON s.id = m.session_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY m.created_at DESC, m.id DESC
+            LIMIT :limit OFFSET :offset
+        """
+
+    rows = (await db.execute(text(sql).columns(created_at=DateTime), params)).mappings().all()
+    hits = []
+    for row in rows:
+        snippet = row["snippet"]
+        if row["rank"] is None:
+            snippet = make_snippet(snippet, query.split())
+        hits.append({
+            "message_id": row["id"],
+            "session_id": row["session_id"],
+            "session_title": row["title"],
+            "role": row["role"],
+            "created_at": row["created_at"],
+            "snippet": snippet,
+            "rank": row["rank"]
+        })
+    return hits
+
+@observe_db
+async def search_sessions(db: AsyncSession, query: str, limit: int) -> List[Dict[str, Any]]:
+    """按标题检索活跃会话"""
+    match, short_terms = fts_query(query)
+    params: Dict[str, Any] = {"limit": limit}
+    conditions = ["s.is_active = 1" if db.bind.dialect.name == "sqlite" else "s.is_active = true"]
+    if fts_enabled and match:
+        for i, term in enumerate(short_terms):
+            conditions.append(f"s.title LIKE :term{i} ESCAPE '\\'")
+            params[f"term{i}"] = _like(term)
+        params["match"] = match
+        sql = f"""
+            SELECT s.id, s.title, s.updated_at,
+                   highlight(chat_sessions_fts, 0, '<mark>', '</mark>') AS snippet,
+                   bm25(chat_sessions_fts) AS rank
+            FROM chat_sessions_fts
+            JOIN chat_sessions s ON s.rowid = chat_sessions_fts.rowid
+            WHERE chat_sessions_fts MATCH :match AND {' AND '.join(conditions)}
+            ORDER BY rank
+            LIMIT :limit
+        """
+    else:
+        for i, term in enumerate(query.split()):
+            conditions.append(f"s.title LIKE :term{i} ESCAPE '\\'")
+            params[f"term{i}"] = _like(term)
+        sql = f"""
+            SELECT s.id, s.title, s.updated_at, s.title AS snippet, NULL AS rank
+            FROM chat_sessions s
+            WHERE {' AND '.join(conditions)}
+            ORDER BY s.updated_at DESC
+            LIMIT :limit
+        """
+
+    rows = (await db.execute(text(sql).columns(updated_at=DateTime), params)).mappings().all()
+    return [
+        {
+            "session_id": row["id"],
+            "title": row["title"],
+            "updated_at": row["updated_at"],
+            "snippet": row["snippet"] if row["rank"] is not None else make_snippet(row["snippet"], query.split()),
+            "rank": row["rank"]
+        }
+        for row in rows
+    ]
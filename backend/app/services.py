@@ -1,96 +1,454 @@
 # backend/app/services.py
-from typing import List, Dict, Any
-from langchain_deepseek import ChatDeepSeek
-from langchain.agents import create_agent
-from langchain_community.agent_toolkits.load_tools import load_tools
-from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+from typing import List, Dict, Any, Optional, Tuple
 from app.config import settings
+from app.tool_cache import tool_cache
+from app.papers import paper_store
+from app.singleflight import SingleFlight, EventBroadcast
+from app.response_cache import create_response_cache
+from app.routing import classify_turn, ROUTE_AGENT, ROUTE_DIRECT
+from app.checkpoints import create_checkpointer, prune_thread, close_checkpointer
+from app.tokens import count_tokens
+from app.metrics import AGENT_RUNS_IN_FLIGHT, AGENT_RUN_LATENCY, AGENT_ROUTES, AGENT_THREAD_TURNS, LLM_LATENCY, ERRORS
+import asyncio
+import hashlib
 import logging
 import json
+import time
+import uuid
+
+# langchain/langgraph相关模块导入较慢，统一在首次使用时导入，保证应用快速启动
 
 logger = logging.getLogger(__name__)
 
+# 快速通道的精简系统提示词（不描述工具，不带滚动摘要）
+FAST_PATH_PROMPT = "你是一个专业的研究助手。请直接、简洁地回答；翻译、改写或解释时基于之前的对话内容。始终用中文回答，除非用户特别要求使用其他语言。"
+
+def build_system_prompt() -> str:
+    """Agent系统提示词（按配置列出可用工具）"""
+    tool_lines = ["arxiv - 在arXiv上搜索和获取学术论文"]
+    if settings.paper_store_enabled:
+        tool_lines.insert(0, "local_papers - 检索本地论文库（之前搜索过的论文，毫秒级返回），优先使用，没有相关结果时再用arxiv")
+    tool_list = "\n    ".join(f"{i}. {line}" for i, line in enumerate(tool_lines, 1))
+    return f"""你是一个专业的研究助手，专门帮助用户查找、理解和总结学术论文。
+    你可以使用以下工具：
+    {tool_list}
+    
+    请按照以下步骤帮助用户：
+    1. 理解用户的研究需求
+    2. 使用合适的工具搜索相关论文
+    3. 提供论文的关键信息：标题、作者、摘要、关键贡献
+    4. 如果用户要求，可以提供论文的详细总结
+    5. 保持回答专业、准确、有用
+    
+    **重要提示**：
+    - 优先搜索最近2-3年的论文
+    - 使用具体的搜索词，避免过于宽泛的查询
+    - 最多搜索2-3次，避免过多API调用
+    
+    记住：始终用中文回答，除非用户特别要求使用其他语言。
+    """
+
 class ResearchAgentService:
-    """研究助手Agent服务"""
+    """研究助手Agent服务（Agent在首次使用或启动预热时构建）
+
+    并发上限由调用方持有的准入凭证（app.scheduler）保证，本服务内不再单独限流；
+    会话摘要在组装上下文时调用，同样占用调用方的凭证。
+    """
     
     def __init__(self):
         self.agent = None
-        self._initialize_agent()
+        self.llm = None
+        # Agent状态检查点（每个会话一个线程），未启用时每轮回放会话历史
+        self.checkpointer = None
+        self._callbacks = []
+        self._init_lock = asyncio.Lock()
+        # 相同输入的并发请求共享同一次Agent运行
+        self._message_flights = SingleFlight()
+        self._stream_flights: Dict[str, EventBroadcast] = {}
+        # 可选的回复缓存（精确匹配模型、温度、系统提示词和上下文）
+        self.response_cache = create_response_cache()
+        # 系统提示词只取决于配置，构建Agent之前即可用于回复缓存键
+        self.system_prompt = build_system_prompt()
+    
+    @property
+    def is_ready(self) -> bool:
+        return self.agent is not None
+    
+    async def ensure_agent(self):
+        """确保Agent已初始化（在线程中完成导入和构建，不阻塞事件循环）"""
+        if self.agent is not None:
+            return
+        async with self._init_lock:
+            if self.agent is None:
+                # 检查点存储的异步连接需要在事件循环中创建
+                if self.checkpointer is None:
+                    self.checkpointer = await create_checkpointer()
+                await asyncio.to_thread(self._initialize_agent)
+    
+    async def close(self):
+        """关闭检查点存储的连接"""
+        await close_checkpointer(self.checkpointer)
+        self.checkpointer = None
+    
+    def _create_llm(self):
+        """创建对话模型（压测时可替换为本地假模型）"""
+        from langchain_deepseek import ChatDeepSeek
+        
+        return ChatDeepSeek(
+            model=settings.deepseek_model,
+            temperature=settings.agent_temperature,
+            max_tokens=settings.agent_max_tokens,
+            timeout=None,
+            max_retries=2,
+            api_key=settings.deepseek_api_key,
+            base_url=settings.deepseek_base_url
+        )
+    
+    def _load_tools(self, llm) -> List:
+        """加载Agent工具（压测时可替换为本地假工具）"""
+        from langchain_community.utilities.arxiv import ArxivAPIWrapper
+        from app.tools import ArxivSearch
+        
+        return [ArxivSearch(api_wrapper=ArxivAPIWrapper())]
     
     def _initialize_agent(self):
         """初始化Agent"""
+        started = time.perf_counter()
         try:
+            from langchain.agents import create_agent
+            from app.tools import wrap_tool, LocalPaperSearch
+            from app.agent_callbacks import MetricsCallbackHandler
+            
             # 1. 初始化DeepSeek模型
-            llm = ChatDeepSeek(
-                model=settings.deepseek_model,
-                temperature=settings.agent_temperature,
-                max_tokens=settings.agent_max_tokens,
-                timeout=None,
-                max_retries=2,
-                api_key=settings.deepseek_api_key,
-                base_url=settings.deepseek_base_url
-            )
+            llm = self._create_llm()
+            logger.info(f"模型创建耗时（含依赖导入）: {time.perf_counter() - started:.2f}s")
             
             # 2. 加载工具
-            tools = load_tools(
-                ["arxiv"], 
-                llm=llm
-            )
+            tools = self._load_tools(llm)
+            # 包装工具：结果缓存 + 并发相同调用合并
+            cache = tool_cache if settings.tool_cache_enabled else None
+            # 本地论文库：收录arxiv返回的论文，并作为优先使用的本地检索工具
+            ingest = paper_store.ingest if settings.paper_store_enabled else None
+            tools = [wrap_tool(tool, cache, ingest if tool.name == "arxiv" else None) for tool in tools]
+            if settings.paper_store_enabled:
+                tools.append(LocalPaperSearch(store=paper_store))
             
             # 3. 创建Agent
-            system_prompt = """你是一个专业的研究助手，专门帮助用户查找、理解和总结学术论文。
-            你可以使用以下工具：
-            1. arxiv - 在arXiv上搜索和获取学术论文
-            
-            请按照以下步骤帮助用户：
-            1. 理解用户的研究需求
-            2. 使用合适的工具搜索相关论文
-            3. 提供论文的关键信息：标题、作者、摘要、关键贡献
-            4. 如果用户要求，可以提供论文的详细总结
-            5. 保持回答专业、准确、有用
-            
-            **重要提示**：
-            - 优先搜索最近2-3年的论文
-            - 使用具体的搜索词，避免过于宽泛的查询
-            - 最多搜索2-3次，避免过多API调用
-            
-            记住：始终用中文回答，除非用户特别要求使用其他语言。
-            """
-            
+            self.llm = llm
+            self._callbacks = [MetricsCallbackHandler()]
             self.agent = create_agent(
                 model=llm,
                 tools=tools,
-                system_prompt=system_prompt
+                system_prompt=self.system_prompt,
+                checkpointer=self.checkpointer
             )
             
-            logger.info("Agent初始化成功")
+            logger.info(f"Agent初始化成功，耗时: {time.perf_counter() - started:.2f}s")
             
         except Exception as e:
             logger.error(f"Agent初始化失败: {e}")
             raise
     
-    async def process_message(self, message: str, history: List[Dict] = None) -> Dict[str, Any]:
-        """处理用户消息"""
+    def _build_messages(self, message: str, history: List[Dict] = None) -> List:
+        """将历史记录和当前消息转换为LangChain消息列表"""
+        from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+        
+        messages = []
+        if history:
+            for msg in history:
+                if msg["role"] == "user":
+                    messages.append(HumanMessage(content=msg["content"]))
+                elif msg["role"] == "assistant":
+                    messages.append(AIMessage(content=msg["content"]))
+                elif msg["role"] == "system":
+                    messages.append(SystemMessage(content=msg["content"]))
+        
+        # 添加当前消息
+        messages.append(HumanMessage(content=message))
+        return messages
+    
+    @staticmethod
+    def _extract_tool_calls(message) -> List[Dict[str, Any]]:
+        """从AIMessage中提取工具调用信息"""
+        tool_calls = []
+        if hasattr(message, 'tool_calls') and message.tool_calls:
+            for tool_call in message.tool_calls:
+                tool_calls.append({
+                    "name": tool_call.get('name', ''),
+                    "args": tool_call.get('args', {}),
+                    "id": tool_call.get('id', '')
+                })
+        return tool_calls
+    
+    @staticmethod
+    def _text_of(content: Any) -> str:
+        """提取消息内容中的文本（兼容字符串和内容块列表）"""
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            return "".join(
+                block if isinstance(block, str) else block.get("text", "")
+                for block in content
+                if isinstance(block, (str, dict))
+            )
+        return ""
+    
+    async def summarize(self, previous_summary: str, messages: List[Dict]) -> str:
+        """将已滑出上下文窗口的消息折叠进滚动摘要"""
+        from langchain_core.messages import HumanMessage, SystemMessage
+        
+        await self.ensure_agent()
+        
+        transcript = "\n".join(
+            f"{'用户' if msg['role'] == 'user' else '助手'}: {msg['content']}"
+            for msg in messages
+            if msg["role"] in ("user", "assistant")
+        )
+        prompt = (
+            f"已有摘要：\n{previous_summary or '（无）'}\n\n"
+            f"新增对话：\n{transcript}\n\n"
+            "请将新增对话合并进已有摘要，输出更新后的完整摘要。"
+            "保留用户的研究主题、关注的论文（标题/arXiv ID）和已得出的结论，省略寒暄。"
+        )
+        
+        async with LLM_LATENCY.time(kind="summary"):
+            result = await self.llm.bind(max_tokens=settings.summary_max_tokens).ainvoke([
+                SystemMessage(content="你负责为学术问答对话维护简洁的中文摘要。"),
+                HumanMessage(content=prompt)
+            ])
+        return self._text_of(result.content)
+    
+    def _thread_config(self, thread_id: str) -> Dict[str, Any]:
+        return {"callbacks": self._callbacks, "configurable": {"thread_id": thread_id}}
+    
+    async def _thread_messages(self, thread_id: str) -> List:
+        state = await self.agent.aget_state({"configurable": {"thread_id": thread_id}})
+        return (state.values or {}).get("messages", [])
+    
+    def _thread_in_sync(self, messages: List, history: List[Dict] = None) -> bool:
+        """线程是否与会话历史一致：以完整的一轮结束（没有待执行的工具调用），且最后一轮的问题和回答与历史相同"""
+        from langchain_core.messages import AIMessage, HumanMessage
+        
+        turns = [msg for msg in (history or []) if msg["role"] in ("user", "assistant")]
+        if len(turns) < 2 or turns[-2]["role"] != "user" or turns[-1]["role"] != "assistant":
+            return False
+        if not messages or not isinstance(messages[-1], AIMessage) or messages[-1].tool_calls:
+            return False
+        last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=None)
+        if last_human is None or self._text_of(messages[last_human].content) != turns[-2]["content"]:
+            return False
+        # 非流式保存的是最终回复，流式保存的是本轮所有模型输出的拼接
+        replies = [self._text_of(m.content) for m in messages[last_human + 1:] if isinstance(m, AIMessage)]
+        return turns[-1]["content"] in (replies[-1], "".join(replies))
+    
+    def _thread_tokens(self, messages: List) -> int:
+        return sum(count_tokens(self._text_of(m.content)) for m in messages)
+    
+    async def _agent_input(self, message: str, history: List[Dict] = None,
+                           session_id: Optional[str] = None) -> Tuple[List, Dict[str, Any], Optional[str]]:
+        """Agent的输入消息、运行配置和线程ID
+        
+        启用检查点时，线程与会话历史一致则只追加新消息（之前的工具调用和结果保留在线程中），
+        否则删除线程并按会话历史重新播种。没有会话ID时使用临时线程。
+        """
+        from langchain_core.messages import HumanMessage
+        
+        if self.checkpointer is None:
+            return self._build_messages(message, history), {"callbacks": self._callbacks}, None
+        thread_id = session_id or f"tmp-{uuid.uuid4().hex}"
+        config = self._thread_config(thread_id)
+        messages = await self._thread_messages(thread_id) if session_id else []
+        if messages and self._thread_in_sync(messages, history) \
+                and self._thread_tokens(messages) <= settings.agent_checkpoint_token_budget:
+            AGENT_THREAD_TURNS.inc(result="append")
+            logger.info(f"线程 {thread_id} 追加新消息（已有{len(messages)}条）")
+            return [HumanMessage(content=message)], config, thread_id
+        if messages:
+            await self.checkpointer.adelete_thread(thread_id)
+            logger.info(f"线程 {thread_id} 与会话历史不一致或超出预算，按会话历史重建")
+        AGENT_THREAD_TURNS.inc(result="reseed" if messages else "seed")
+        return self._build_messages(message, history), config, thread_id
+    
+    async def _finish_thread(self, thread_id: Optional[str], session_id: Optional[str] = None):
+        """一轮结束：会话线程只保留最新检查点，临时线程直接删除"""
+        if self.checkpointer is None or thread_id is None:
+            return
         try:
-            if not self.agent:
-                self._initialize_agent()
-            
-            # 准备消息历史
-            messages = []
-            if history:
-                for msg in history:
-                    if msg["role"] == "user":
-                        messages.append(HumanMessage(content=msg["content"]))
-                    elif msg["role"] == "assistant":
-                        messages.append(AIMessage(content=msg["content"]))
+            if session_id:
+                await prune_thread(self.checkpointer, thread_id)
+            else:
+                await self.checkpointer.adelete_thread(thread_id)
+        except Exception as e:
+            logger.warning(f"清理线程检查点失败: {e}")
+    
+    async def _append_direct_turn(self, message: str, content: str, history: List[Dict] = None,
+                                  session_id: Optional[str] = None):
+        """快速通道的一轮也写入线程（线程原本与会话历史一致时），下一轮Agent无需重新播种"""
+        from langchain_core.messages import AIMessage, HumanMessage
+        
+        if self.checkpointer is None or not session_id or not content:
+            return
+        try:
+            messages = await self._thread_messages(session_id)
+            if not messages or not self._thread_in_sync(messages, history):
+                return
+            await self.agent.aupdate_state(
+                {"configurable": {"thread_id": session_id}},
+                {"messages": [HumanMessage(content=message), AIMessage(content=content)]},
+                as_node="model"
+            )
+            await prune_thread(self.checkpointer, session_id)
+        except Exception as e:
+            logger.warning(f"快速通道写入线程失败（下一轮将重新播种）: {e}")
+    
+    def _route(self, message: str, history: List[Dict] = None) -> str:
+        """路由本轮消息并记录决策"""
+        route, reason = classify_turn(message, history)
+        AGENT_ROUTES.inc(route=route, reason=reason)
+        logger.info(f"消息路由: {route}（{reason}）")
+        return route
+    
+    def _fast_path_messages(self, message: str, history: List[Dict] = None) -> List:
+        """快速通道的消息列表：精简提示词 + 最近几条对话"""
+        from langchain_core.messages import SystemMessage
+        
+        recent = [msg for msg in (history or []) if msg["role"] in ("user", "assistant")]
+        recent = recent[-settings.fast_path_history_messages:] if settings.fast_path_history_messages > 0 else []
+        return [SystemMessage(content=FAST_PATH_PROMPT)] + self._build_messages(message, recent)
+    
+    async def _run_direct(self, message: str, history: List[Dict] = None,
+                          session_id: Optional[str] = None) -> Dict[str, Any]:
+        """快速通道：不经过Agent，直接调用LLM"""
+        llm = self.llm.bind(max_tokens=settings.fast_path_max_tokens)
+        async with AGENT_RUN_LATENCY.time(mode="message", route=ROUTE_DIRECT), \
+                LLM_LATENCY.time(kind="fast_path"):
+            result = await llm.ainvoke(self._fast_path_messages(message, history))
+        content = self._text_of(result.content)
+        await self._append_direct_turn(message, content, history, session_id)
+        return {"content": content, "tool_calls": None, "tool_results": None, "route": ROUTE_DIRECT}
+    
+    async def _stream_direct(self, message: str, history: List[Dict] = None, session_id: Optional[str] = None):
+        """快速通道的流式版本，事件格式与Agent一致（没有工具事件）"""
+        llm = self.llm.bind(max_tokens=settings.fast_path_max_tokens)
+        content = ""
+        async with AGENT_RUN_LATENCY.time(mode="stream", route=ROUTE_DIRECT), \
+                LLM_LATENCY.time(kind="fast_path"):
+            async for chunk in llm.astream(self._fast_path_messages(message, history)):
+                text = self._text_of(chunk.content)
+                if text:
+                    content += text
+                    yield {"type": "token", "content": text, "is_final": False, "tool_calls": None}
+        await self._append_direct_turn(message, content, history, session_id)
+        yield {"type": "final", "content": "", "is_final": True, "tool_calls": None, "tool_results": None, "route": ROUTE_DIRECT}
+    
+    @staticmethod
+    def _request_key(message: str, history: List[Dict] = None, session_id: Optional[str] = None) -> str:
+        """由规范化的问题和上下文历史生成请求合并键
+
+        启用Agent状态检查点时键中包含会话ID：每次运行都要向本会话的线程追加本轮消息，
+        不同会话即使问题和历史相同也不能共享一次运行（否则只有发起运行的会话线程被更新）。
+        """
+        payload = {
+            "message": " ".join(message.split()),
+            "history": [
+                [msg["role"], msg["content"]] for msg in (history or [])
+            ]
+        }
+        if settings.agent_checkpoint_backend:
+            payload["session_id"] = session_id
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def _response_key(self, message: str, history: List[Dict] = None) -> str:
+        """回复缓存键：模型、温度、系统提示词和完整消息列表的哈希"""
+        payload = {
+            "model": settings.deepseek_model,
+            "temperature": settings.agent_temperature,
+            "system_prompt": self.system_prompt,
+            "messages": [
+                [msg["role"], msg["content"]] for msg in (history or [])
+            ] + [["user", message]]
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _cacheable(result: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "content": result["content"],
+            "tool_calls": result.get("tool_calls"),
+            "tool_results": result.get("tool_results")
+        }
+    
+    @staticmethod
+    def _replay_events(cached: Dict[str, Any], chunk_size: int = 50) -> List[Dict[str, Any]]:
+        """将缓存的回复还原为流式事件序列"""
+        events = []
+        if cached.get("tool_calls"):
+            events.append({"type": "tool_call", "content": "", "is_final": False, "tool_calls": cached["tool_calls"]})
+        for tool_call_id, result in (cached.get("tool_results") or {}).items():
+            events.append({
+                "type": "tool_result",
+                "content": "",
+                "is_final": False,
+                "tool_calls": None,
+                "tool_call_id": tool_call_id,
+                "result": result
+            })
+        content = cached.get("content") or ""
+        for i in range(0, len(content), chunk_size):
+            events.append({"type": "token", "content": content[i:i+chunk_size], "is_final": False, "tool_calls": None})
+        events.append({
+            "type": "final",
+            "content": "",
+            "is_final": True,
+            "cached": True,
+            "tool_calls": cached.get("tool_calls"),
+            "tool_results": cached.get("tool_results")
+        })
+        return events
+    
+    async def process_message(self, message: str, history: List[Dict] = None,
+                              session_id: Optional[str] = None) -> Dict[str, Any]:
+        """处理用户消息（相同问题与上下文的并发请求只运行一次Agent）"""
+        cache_key = None
+        if self.response_cache:
+            cache_key = self._response_key(message, history)
+            cached = await self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("回复缓存命中")
+                return {**cached, "cached": True}
+        
+        if not settings.coalesce_requests:
+            result = await self._run_message(message, history, session_id)
+        else:
+            key = self._request_key(message, history, session_id)
+            result = await self._message_flights.do(key, lambda: self._run_message(message, history, session_id))
+        
+        if cache_key and not result.get("error"):
+            await self.response_cache.set(cache_key, self._cacheable(result))
+        return result
+    
+    async def _run_message(self, message: str, history: List[Dict] = None,
+                           session_id: Optional[str] = None) -> Dict[str, Any]:
+        """运行Agent处理用户消息（不需要工具的消息走快速通道）"""
+        try:
+            await self.ensure_agent()
+            if self._route(message, history) == ROUTE_DIRECT:
+                return await self._run_direct(message, history, session_id)
+            from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
             
-            # 添加当前消息
-            messages.append(HumanMessage(content=message))
+            # 准备消息历史（启用检查点时只有新消息）
+            messages, config, thread_id = await self._agent_input(message, history, session_id)
             
-            # 调用Agent
-            result = self.agent.invoke({
-                "messages": messages
-            })
+            # 异步调用Agent，不阻塞事件循环
+            async with AGENT_RUN_LATENCY.time(mode="message", route=ROUTE_AGENT):
+                AGENT_RUNS_IN_FLIGHT.inc()
+                try:
+                    result = await self.agent.ainvoke({"messages": messages}, config=config)
+                finally:
+                    AGENT_RUNS_IN_FLIGHT.dec()
+            await self._finish_thread(thread_id, session_id)
             
             # 提取工具调用和结果信息
             tool_calls = []
@@ -98,22 +456,20 @@ class ResearchAgentService:
             
             if result and 'messages' in result and result['messages']:
                 logger.info(f"Agent返回消息数量: {len(result['messages'])}")
+                # 返回的是完整的线程/上下文消息，只提取本轮（最后一条用户消息之后）的工具调用和结果
+                start = max((i for i, m in enumerate(result['messages']) if isinstance(m, HumanMessage)), default=-1) + 1
                 
-                for i, m in enumerate(result['messages']):
+                for i, m in enumerate(result['messages'][start:], start):
                     logger.debug(f"消息 {i}: {type(m).__name__}")
                     
                     # 提取工具调用（从AIMessage中）
                     if isinstance(m, AIMessage):
-                        if hasattr(m, 'tool_calls') and m.tool_calls:
-                            logger.info(f"找到工具调用: {len(m.tool_calls)}个")
-                            for tool_call in m.tool_calls:
-                                tool_info = {
-                                    "name": tool_call.get('name', ''),
-                                    "args": tool_call.get('args', {}),
-                                    "id": tool_call.get('id', '')
-                                }
-                                tool_calls.append(tool_info)
-                                logger.info(f"工具调用: {tool_info['name']} - {tool_info['args']}")
+                        calls = self._extract_tool_calls(m)
+                        if calls:
+                            logger.info(f"找到工具调用: {len(calls)}个")
+                        for tool_info in calls:
+                            tool_calls.append(tool_info)
+                            logger.info(f"工具调用: {tool_info['name']} - {tool_info['args']}")
                     
                     # 提取工具结果（从ToolMessage中）
                     elif isinstance(m, ToolMessage):
@@ -131,33 +487,162 @@ class ResearchAgentService:
                 return {
                     "content": content,
                     "tool_calls": tool_calls if tool_calls else None,
-                    "tool_results": tool_results if tool_results else None
+                    "tool_results": tool_results if tool_results else None,
+                    "route": ROUTE_AGENT
                 }
             else:
                 logger.warning("Agent未返回有效消息")
-                return {"content": "抱歉，我没有收到回复。", "tool_calls": None, "tool_results": None}
+                return {"content": "抱歉，我没有收到回复。", "tool_calls": None, "tool_results": None, "error": True}
                 
         except Exception as e:
             logger.error(f"处理消息失败: {e}")
-            return {"content": f"处理消息时出错: {str(e)}", "tool_calls": None, "tool_results": None}
+            ERRORS.inc(component="agent")
+            return {"content": f"处理消息时出错: {str(e)}", "tool_calls": None, "tool_results": None, "error": True}
     
-    async def process_stream(self, message: str, history: List[Dict] = None):
-        """流式处理用户消息（简化版）"""
+    async def process_stream(self, message: str, history: List[Dict] = None, session_id: Optional[str] = None):
+        """流式处理用户消息
+        
+        相同问题与上下文的并发流式请求共享同一次Agent运行，事件扇出给所有订阅者；
+        启用回复缓存时，命中的回复按相同的事件格式回放。
+        """
+        cache_key = None
+        if self.response_cache:
+            cache_key = self._response_key(message, history)
+            cached = await self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("回复缓存命中（流式回放）")
+                for event in self._replay_events(cached):
+                    yield event
+                return
+        
+        broadcast = None
+        if not settings.coalesce_requests:
+            events = self._run_stream(message, history, session_id)
+        else:
+            key = self._request_key(message, history, session_id)
+            broadcast = self._stream_flights.get(key)
+            if broadcast is None:
+                broadcast = EventBroadcast()
+                self._stream_flights[key] = broadcast
+                task = broadcast.start(self._run_stream(message, history, session_id))
+                task.add_done_callback(lambda _t: self._stream_flights.pop(key, None))
+            else:
+                logger.info("合并到进行中的相同流式请求")
+            events = broadcast.subscribe()
+        
+        content = ""
         try:
-            result = await self.process_message(message, history)
-            # 模拟流式输出
-            content = result["content"]
-            for i in range(0, len(content), 10):
-                chunk = content[i:i+10]
-                yield {
-                    "content": chunk,
-                    "is_final": i+10 >= len(content),
-                    "tool_calls": result["tool_calls"] if i+10 >= len(content) else None
-                }
+            async for event in events:
+                if event.get("type") == "token":
+                    content += event["content"]
+                elif event.get("type") == "final" and cache_key and content:
+                    await self.response_cache.set(cache_key, self._cacheable({**event, "content": content}))
+                yield event
+        finally:
+            await events.aclose()
+            # 所有订阅者都已离开（运行被取消），停止共享的Agent运行
+            if broadcast is not None and broadcast.subscribers == 0 and not broadcast.done:
+                logger.info("共享流式运行已无订阅者，取消Agent运行")
+                broadcast.task.cancel()
+    
+    async def _run_stream(self, message: str, history: List[Dict] = None, session_id: Optional[str] = None):
+        """运行Agent并流式产出事件
+        
+        基于Agent的异步流式接口，产出以下事件（均包含content/is_final字段）：
+        - token:       LLM生成的文本片段，到达即转发
+        - tool_call:   模型发起工具调用
+        - tool_result: 工具返回结果
+        - final:       结束事件，携带本轮全部tool_calls/tool_results和路由结果
+        
+        不需要工具的消息走快速通道，只产出token和final事件。
+        """
+        tool_calls = []
+        tool_results = {}
+        try:
+            await self.ensure_agent()
+            if self._route(message, history) == ROUTE_DIRECT:
+                async for event in self._stream_direct(message, history, session_id):
+                    yield event
+                return
+            from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+            
+            messages, config, thread_id = await self._agent_input(message, history, session_id)
+            
+            streamed = False
+            last_ai_message = None
+            
+            # messages模式逐token输出LLM内容；updates模式在每个节点完成后给出完整消息
+            async with AGENT_RUN_LATENCY.time(mode="stream", route=ROUTE_AGENT):
+                AGENT_RUNS_IN_FLIGHT.inc()
+                try:
+                    async for mode, data in self.agent.astream(
+                        {"messages": messages},
+                        stream_mode=["messages", "updates"],
+                        config=config
+                    ):
+                        if mode == "messages":
+                            chunk, _metadata = data
+                            if not isinstance(chunk, AIMessageChunk):
+                                continue
+                            text = self._text_of(chunk.content)
+                            if text:
+                                streamed = True
+                                yield {"type": "token", "content": text, "is_final": False, "tool_calls": None}
+                
+                        elif mode == "updates":
+                            for _node, update in data.items():
+                                if not isinstance(update, dict):
+                                    continue
+                                for m in update.get("messages", []) or []:
+                                    if isinstance(m, AIMessage):
+                                        last_ai_message = m
+                                        calls = self._extract_tool_calls(m)
+                                        if calls:
+                                            tool_calls.extend(calls)
+                                            logger.info(f"工具调用: {[c['name'] for c in calls]}")
+                                            yield {"type": "tool_call", "content": "", "is_final": False, "tool_calls": calls}
+                                    elif isinstance(m, ToolMessage):
+                                        result = self._text_of(m.content)
+                                        tool_results[m.tool_call_id] = result
+                                        logger.info(f"工具结果: {m.tool_call_id} - {len(result)}字符")
+                                        yield {
+                                            "type": "tool_result",
+                                            "content": "",
+                                            "is_final": False,
+                                            "tool_calls": None,
+                                            "tool_call_id": m.tool_call_id,
+                                            "name": getattr(m, "name", None),
+                                            "result": result
+                                        }
+                finally:
+                    AGENT_RUNS_IN_FLIGHT.dec()
+            await self._finish_thread(thread_id, session_id)
+            
+            # 模型未以流式返回token时，补发最终回复内容
+            if not streamed and last_ai_message is not None:
+                text = self._text_of(last_ai_message.content)
+                if text:
+                    yield {"type": "token", "content": text, "is_final": False, "tool_calls": None}
+            
+            yield {
+                "type": "final",
+                "content": "",
+                "is_final": True,
+                "tool_calls": tool_calls if tool_calls else None,
+                "tool_results": tool_results if tool_results else None,
+                "route": ROUTE_AGENT
+            }
                 
         except Exception as e:
             logger.error(f"流式处理失败: {e}")
-            yield {"content": f"错误: {str(e)}", "is_final": True, "tool_calls": None}
+            ERRORS.inc(component="agent")
+            yield {
+                "type": "error",
+                "content": f"错误: {str(e)}",
+                "is_final": True,
+                "tool_calls": tool_calls if tool_calls else None,
+                "tool_results": tool_results if tool_results else None
+            }
 
-# 创建全局Agent实例
+# 创建全局Agent服务实例（不在导入时构建Agent）
 agent_service = ResearchAgentService()
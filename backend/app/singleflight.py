@@ -0,0 +1,146 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import threading
+
+class SingleFlight:
+    """异步请求合并：相同key的并发调用共享同一个进行中的计算"""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.coalesced += 1
+        # 单个调用方被取消时不影响共享的计算
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+class _ThreadCall:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+class ThreadSingleFlight:
+    """线程版请求合并，供在线程池中同步执行的工具使用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _ThreadCall] = {}
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _ThreadCall()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+class ReplayExpired(Exception):
+    """请求的事件已被移出回放缓冲区"""
+
+class EventBroadcast:
+    """将一个事件流扇出给多个订阅者，后加入的订阅者会先回放已产生的事件
+
+    指定max_events时只保留最近的max_events个事件（有界回放缓冲区），
+    事件序号在整个事件流中保持不变。subscribers为当前订阅者数量。
+    """
+
+    def __init__(self, max_events: Optional[int] = None):
+        self.events: List[Dict[str, Any]] = []
+        self.offset = 0  # events[0]在整个事件流中的序号
+        self.max_events = max_events
+        self.done = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._cond = asyncio.Condition()
+
+    @property
+    def total(self) -> int:
+        """已产生的事件总数"""
+        return self.offset + len(self.events)
+
+    async def publish(self, event: Dict[str, Any]):
+        async with self._cond:
+            self.events.append(event)
+            if self.max_events and len(self.events) > self.max_events:
+                dropped = len(self.events) - self.max_events
+                del self.events[:dropped]
+                self.offset += dropped
+            self._cond.notify_all()
+
+    async def close(self):
+        async with self._cond:
+            self.done = True
+            self._cond.notify_all()
+
+    async def subscribe(self, start: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """从第start个事件开始订阅，直到事件流结束"""
+        events = self.subscribe_indexed(start)
+        try:
+            async for _index, event in events:
+                yield event
+        finally:
+            await events.aclose()
+
+    async def subscribe_indexed(self, start: int = 0) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """同subscribe，同时给出每个事件的序号；所需事件已移出缓冲区时抛出ReplayExpired"""
+        index = start
+        self.subscribers += 1
+        try:
+            while True:
+                async with self._cond:
+                    await self._cond.wait_for(lambda: index < self.total or self.done)
+                    if index < self.offset:
+                        raise ReplayExpired(f"事件 {index} 已移出回放缓冲区（最早 {self.offset}）")
+                    batch = self.events[index - self.offset:]
+                    finished = self.done
+                for event in batch:
+                    yield index, event
+                    index += 1
+                if finished and index >= self.total:
+                    return
+        finally:
+            self.subscribers -= 1
+
+    def start(self, source: AsyncIterator[Dict[str, Any]]) -> asyncio.Task:
+        """在后台任务中发布source的全部事件"""
+        self.task = asyncio.ensure_future(self.pump(source))
+        return self.task
+
+    async def pump(self, source: AsyncIterator[Dict[str, Any]]):
+        """消费source并发布其全部事件，结束后关闭广播"""
+        try:
+            async for event in source:
+                await self.publish(event)
+        finally:
+            await self.close()
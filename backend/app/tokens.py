@@ -0,0 +1,31 @@
+from app.config import settings
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# tiktoken首次加载编码时会联网下载（离线部署可预先下载并设置TIKTOKEN_CACHE_DIR）。
+# 编码只在启动时于线程中加载（load_encoding），请求路径不触发下载；加载完成前按字符数估算token。
+_encoding = None
+_load_lock = threading.Lock()
+
+def load_encoding():
+    """加载tiktoken编码（阻塞调用，服务启动时在后台线程执行），加载完成前和失败时按字符数估算"""
+    global _encoding
+    with _load_lock:
+        if _encoding is not None:
+            return _encoding
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(settings.tokenizer_encoding)
+        except Exception as e:
+            logger.warning(f"tiktoken编码加载失败，按字符数估算token: {e}")
+        return _encoding
+
+def count_tokens(text: str) -> int:
+    """计算文本的token数"""
+    if not text:
+        return 0
+    if _encoding is None:
+        return len(text)
+    return len(_encoding.encode(text, disallowed_special=()))
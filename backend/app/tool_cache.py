@@ -0,0 +1,113 @@
+from typing import Any, Dict, Optional
+from datetime import timedelta
+from sqlalchemy import delete, select, func
+import hashlib
+import json
+import logging
+import threading
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import ToolCacheEntry, utc_now
+from app.singleflight import ThreadSingleFlight
+from app.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+def normalize_arguments(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """规范化工具参数：字符串去首尾空白、合并连续空白并转小写"""
+    normalized = {}
+    for key, value in sorted(arguments.items()):
+        if isinstance(value, str):
+            value = " ".join(value.split()).lower()
+        normalized[key] = value
+    return normalized
+
+def make_cache_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+    """由工具名和规范化参数生成缓存键"""
+    raw = json.dumps([tool_name, arguments], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ToolResultCache:
+    """保存在应用数据库中的工具结果缓存（TTL过期 + 按最近访问时间的LRU淘汰）
+
+    工具在线程池中同步执行，因此使用同步数据库会话。
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+        if name in ("hits", "misses"):
+            CACHE_REQUESTS.inc(n, cache="tool", result=name[:-1] if name == "hits" else "miss")
+
+    def stats(self) -> Dict[str, Any]:
+        """命中/未命中/淘汰计数，以及被合并的并发调用数"""
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / total, 4) if total else 0.0
+        stats["coalesced"] = tool_flights.coalesced
+        return stats
+
+    def get(self, key: str) -> Optional[str]:
+        """读取未过期的缓存结果，命中时刷新访问时间"""
+        db = SessionLocal()
+        try:
+            entry = db.get(ToolCacheEntry, key)
+            now = utc_now()
+            if entry is None or entry.created_at < now - self.ttl:
+                self._count("misses")
+                return None
+            entry.hits = (entry.hits or 0) + 1
+            entry.last_accessed_at = now
+            db.commit()
+            self._count("hits")
+            return entry.result
+        finally:
+            db.close()
+
+    def set(self, key: str, tool_name: str, arguments: Dict[str, Any], result: str):
+        """写入缓存，并清理过期条目和超出容量的最久未访问条目"""
+        db = SessionLocal()
+        try:
+            now = utc_now()
+            db.merge(ToolCacheEntry(
+                key=key,
+                tool_name=tool_name,
+                arguments=arguments,
+                result=result,
+                hits=0,
+                created_at=now,
+                last_accessed_at=now
+            ))
+            evicted = db.execute(
+                delete(ToolCacheEntry).where(ToolCacheEntry.created_at < now - self.ttl)
+            ).rowcount or 0
+            overflow = db.execute(select(func.count(ToolCacheEntry.key))).scalar_one() - self.max_entries
+            if overflow > 0:
+                stale_keys = select(ToolCacheEntry.key).order_by(
+                    ToolCacheEntry.last_accessed_at.asc()
+                ).limit(overflow)
+                evicted += db.execute(
+                    delete(ToolCacheEntry).where(ToolCacheEntry.key.in_(stale_keys))
+                ).rowcount or 0
+            db.commit()
+            if evicted:
+                self._count("evictions", evicted)
+        finally:
+            db.close()
+
+# 全局工具调用合并器
+tool_flights = ThreadSingleFlight()
+
+# 全局工具结果缓存
+tool_cache = ToolResultCache(
+    ttl_seconds=settings.tool_cache_ttl_seconds,
+    max_entries=settings.tool_cache_max_entries
+)
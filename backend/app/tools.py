@@ -0,0 +1,155 @@
+from typing import Any, Dict, Optional, Tuple, Type
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+import asyncio
+import logging
+import threading
+
+from app.tool_cache import ToolResultCache, normalize_arguments, make_cache_key, tool_flights
+from app.papers import format_papers, make_paper_id
+
+logger = logging.getLogger(__name__)
+
+# Agent工具包装（依赖langchain，仅在Agent初始化时导入）
+
+class CachedTool(BaseTool):
+    """带缓存的工具包装器，名称、描述和参数结构与原工具一致，对Agent透明
+
+    并发的相同调用（规范化参数一致）只执行一次，其余调用共享结果。
+    Agent异步执行时（_arun）运行被取消会立即放弃等待：线程中的同步请求无法中断，
+    但其结果被丢弃，不写入缓存也不收录到论文库。
+    """
+
+    inner: BaseTool
+    cache: Any = None  # ToolResultCache，为None时只做请求合并
+    flights: Any = None  # ThreadSingleFlight
+    on_result: Any = None  # 实际执行（未命中缓存）得到有效结果后的回调，如收录到本地论文库
+    # 以这些前缀开头的结果视为错误，不写入缓存
+    uncacheable_prefixes: Tuple[str, ...] = ("Arxiv exception",)
+
+    def _lookup(self, kwargs: Dict[str, Any]) -> Tuple[str, Dict[str, Any], Optional[str]]:
+        arguments = normalize_arguments(kwargs)
+        key = make_cache_key(self.name, arguments)
+        if self.cache is None:
+            return key, arguments, None
+        try:
+            return key, arguments, self.cache.get(key)
+        except Exception as e:
+            logger.warning(f"读取工具缓存失败: {e}")
+            return key, arguments, None
+
+    def _store(self, key: str, arguments: Dict[str, Any], result: Any):
+        if not isinstance(result, str) or not result or result.startswith(self.uncacheable_prefixes):
+            return
+        if self.on_result is not None:
+            try:
+                self.on_result(result)
+            except Exception as e:
+                logger.warning(f"处理工具结果失败: {e}")
+        if self.cache is None:
+            return
+        try:
+            self.cache.set(key, self.name, arguments, result)
+        except Exception as e:
+            logger.warning(f"写入工具缓存失败: {e}")
+
+    def _run(self, run_manager=None, **kwargs) -> Any:
+        key, arguments, cached = self._lookup(kwargs)
+        if cached is not None:
+            logger.info(f"工具缓存命中: {self.name} - {arguments}")
+            return cached
+        return self.flights.do(key, lambda: self._invoke(key, arguments, kwargs))
+
+    async def _arun(self, run_manager=None, **kwargs) -> Any:
+        key, arguments, cached = await asyncio.to_thread(self._lookup, kwargs)
+        if cached is not None:
+            logger.info(f"工具缓存命中: {self.name} - {arguments}")
+            return cached
+        abandoned = threading.Event()
+        try:
+            return await asyncio.to_thread(
+                self.flights.do, key, lambda: self._invoke(key, arguments, kwargs, abandoned)
+            )
+        except asyncio.CancelledError:
+            abandoned.set()
+            logger.info(f"工具调用已取消，放弃结果: {self.name} - {arguments}")
+            raise
+
+    def _invoke(self, key: str, arguments: Dict[str, Any], kwargs: Dict[str, Any],
+                abandoned: Optional[threading.Event] = None) -> Any:
+        # 不向内层工具传递回调，避免同名工具被重复计时/追踪
+        result = self.inner.invoke(kwargs, config={"callbacks": []})
+        if abandoned is None or not abandoned.is_set():
+            self._store(key, arguments, result)
+        return result
+
+def wrap_tool(tool: BaseTool, cache: Optional[ToolResultCache] = None, on_result=None) -> BaseTool:
+    """包装工具：可选的结果缓存 + 并发相同调用合并"""
+    return CachedTool(
+        name=tool.name,
+        description=tool.description,
+        args_schema=tool.args_schema,
+        inner=tool,
+        cache=cache,
+        flights=tool_flights,
+        on_result=on_result
+    )
+
+class ArxivSearchInput(BaseModel):
+    query: str = Field(description="search query to look up")
+
+class ArxivSearch(BaseTool):
+    """arxiv工具：与ArxivQueryRun同名同参数，输出额外带arXiv ID行
+
+    ArxivQueryRun的文本输出不含entry_id，论文库只能按标题去重；这里从检索结果的entry_id
+    取arXiv编号，论文库按编号去重，输出格式与local_papers一致。
+    """
+
+    name: str = "arxiv"
+    description: str = (
+        "A wrapper around Arxiv.org "
+        "Useful for when you need to answer questions about Physics, Mathematics, "
+        "Computer Science, Quantitative Biology, Quantitative Finance, Statistics, "
+        "Electrical Engineering, and Economics "
+        "from scientific articles on arxiv.org. "
+        "Input should be a search query."
+    )
+    args_schema: Type[BaseModel] = ArxivSearchInput
+    api_wrapper: Any = None  # langchain_community ArxivAPIWrapper
+
+    def _run(self, query: str, run_manager=None) -> str:
+        docs = self.api_wrapper.get_summaries_as_docs(query)
+        # 出错时返回单个不含元数据的文档，内容为 "Arxiv exception: ..."
+        if len(docs) == 1 and not docs[0].metadata:
+            return docs[0].page_content
+        if not docs:
+            return "No good Arxiv Result was found"
+        papers = [
+            {
+                "id": make_paper_id(doc.metadata["Title"], doc.metadata.get("Entry ID")),
+                "title": doc.metadata["Title"],
+                "authors": doc.metadata["Authors"],
+                "summary": doc.page_content,
+                "published": doc.metadata["Published"]
+            }
+            for doc in docs
+        ]
+        return format_papers(papers)[: self.api_wrapper.doc_content_chars_max]
+
+class LocalPaperSearchInput(BaseModel):
+    query: str = Field(description="search query, preferably English keywords")
+
+class LocalPaperSearch(BaseTool):
+    """检索本地论文库（之前arxiv调用返回过的论文），本地查询毫秒级返回，不访问网络"""
+
+    name: str = "local_papers"
+    description: str = (
+        "Search the local library of arXiv papers that were retrieved earlier (title, authors, abstract), "
+        "ranked by relevance. Fast and offline: try this before the arxiv tool, and use arxiv when nothing "
+        "relevant is found or the user asks for the latest papers. Input should be a search query."
+    )
+    args_schema: Type[BaseModel] = LocalPaperSearchInput
+    store: Any = None  # PaperStore
+
+    def _run(self, query: str, run_manager=None) -> str:
+        return self.store.lookup(query)
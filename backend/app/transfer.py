@@ -0,0 +1,175 @@
+from typing import Any, AsyncIterator, Dict, List, Optional
+from datetime import datetime
+from sqlalchemy import select
+import json
+import logging
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import ChatSession, ChatMessage, ToolResultBlob
+from app.crud import insert_ignore
+from app.blobs import externalize, load_blobs, referenced_hashes, resolve
+
+logger = logging.getLogger(__name__)
+
+# NDJSON格式：每行一个对象，先输出全部会话（type=session），再按会话输出消息（type=message）
+# 消息中的工具结果以完整内容导出（不含blob引用），导入时重新按内容哈希去重存储
+
+SESSION_FIELDS = ("id", "title", "created_at", "updated_at", "is_active")
+MESSAGE_FIELDS = (
+    "id", "session_id", "role", "content", "tool_calls", "tool_results",
+    "meta", "tokens", "created_at"
+)
+DATETIME_FIELDS = ("created_at", "updated_at")
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def _to_record(kind: str, obj: Any, fields) -> Dict[str, Any]:
+    record = {"type": kind}
+    for field in fields:
+        value = getattr(obj, field)
+        record[field] = value.isoformat() if isinstance(value, datetime) else value
+    return record
+
+# 导入时缺失字段的默认值（批量插入要求每行字段一致）
+FIELD_DEFAULTS = {"title": "新对话", "is_active": True, "tokens": 0}
+
+def _from_record(record: Dict[str, Any], fields) -> Dict[str, Any]:
+    row = {field: record.get(field, FIELD_DEFAULTS.get(field)) for field in fields}
+    for field in DATETIME_FIELDS:
+        if row.get(field):
+            row[field] = datetime.fromisoformat(row[field])
+    return row
+
+async def export_ndjson(
+    include_inactive: bool = False,
+    session_ids: Optional[List[str]] = None
+) -> AsyncIterator[bytes]:
+    """流式导出会话和消息，服务端按批(yield_per)迭代，内存占用与数据量无关
+
+    指定session_ids时只导出这些会话（用于归档）。
+    """
+    batch_size = settings.bulk_batch_size
+    async with AsyncSessionLocal() as db, AsyncSessionLocal() as blob_db:
+        session_stmt = select(ChatSession).order_by(ChatSession.created_at, ChatSession.id)
+        message_stmt = select(ChatMessage).order_by(
+            ChatMessage.session_id, ChatMessage.created_at, ChatMessage.id
+        )
+        if not include_inactive:
+            session_stmt = session_stmt.where(ChatSession.is_active == True)
+            message_stmt = message_stmt.join(ChatSession).where(ChatSession.is_active == True)
+        if session_ids is not None:
+            session_stmt = session_stmt.where(ChatSession.id.in_(session_ids))
+            message_stmt = message_stmt.where(ChatMessage.session_id.in_(session_ids))
+
+        for kind, stmt, fields in (
+            ("session", session_stmt, SESSION_FIELDS),
+            ("message", message_stmt, MESSAGE_FIELDS),
+        ):
+            result = await db.stream(stmt.execution_options(yield_per=batch_size))
+            async for partition in result.scalars().partitions():
+                records = [_to_record(kind, obj, fields) for obj in partition]
+                if kind == "message":
+                    # 流式结果占用着db的连接，blob用单独的会话按批读取
+                    payloads = await load_blobs(blob_db, referenced_hashes(r["tool_results"] for r in records))
+                    for record in records:
+                        record["tool_results"] = resolve(record["tool_results"], payloads)
+                lines = [json.dumps(record, ensure_ascii=False) for record in records]
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+                # 已输出的对象不再需要，避免identity map随导出量增长
+                db.expunge_all()
+
+async def zstd_compress(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """流式zstd压缩"""
+    import zstandard
+
+    compressor = zstandard.ZstdCompressor().compressobj()
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+async def zstd_decompress_if_needed(chunks: AsyncIterator[bytes], compressed: bool = None) -> AsyncIterator[bytes]:
+    """按需流式解压：compressed为None时根据zstd魔数自动判断"""
+    decompressor = None
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if compressed is None:
+            compressed = chunk.startswith(ZSTD_MAGIC)
+        if compressed:
+            if decompressor is None:
+                import zstandard
+                decompressor = zstandard.ZstdDecompressor().decompressobj()
+            chunk = decompressor.decompress(chunk)
+        if chunk:
+            yield chunk
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """逐行解析NDJSON字节流"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+async def import_ndjson(chunks: AsyncIterator[bytes]) -> Dict[str, int]:
+    """流式导入会话和消息，按批批量插入，每批一个事务
+
+    返回实际插入的会话数和消息数；已存在的ID和无法识别的记录计入skipped。
+    """
+    batch_size = settings.bulk_batch_size
+    counts = {"sessions": 0, "messages": 0, "skipped": 0}
+    sessions: List[Dict[str, Any]] = []
+    messages: List[Dict[str, Any]] = []
+    blobs: Dict[str, Dict[str, Any]] = {}
+
+    async with AsyncSessionLocal() as db:
+        session_insert = insert_ignore(db, ChatSession)
+        message_insert = insert_ignore(db, ChatMessage)
+        blob_insert = insert_ignore(db, ToolResultBlob)
+
+        async def insert_rows(statement, rows: List[Dict[str, Any]], kind: str):
+            """按实际插入的行数计数，已存在而被忽略的行计入skipped"""
+            # 在会话的连接上执行Core语句（ORM批量插入的结果不提供rowcount）
+            result = await (await db.connection()).execute(statement, rows)
+            # 驱动不提供批量rowcount时按全部插入计
+            inserted = result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(rows)
+            counts[kind] += inserted
+            counts["skipped"] += len(rows) - inserted
+            rows.clear()
+
+        async def flush():
+            # 会话先于消息写入，保证外键引用有效
+            if sessions:
+                await insert_rows(session_insert, sessions, "sessions")
+            if blobs:
+                await db.execute(blob_insert, list(blobs.values()))
+                blobs.clear()
+            if messages:
+                await insert_rows(message_insert, messages, "messages")
+            await db.commit()
+
+        async for record in iter_ndjson(chunks):
+            kind = record.get("type")
+            if kind == "session":
+                sessions.append(_from_record(record, SESSION_FIELDS))
+            elif kind == "message":
+                row = _from_record(record, MESSAGE_FIELDS)
+                row["tool_results"] = externalize(row["tool_results"], blobs)
+                messages.append(row)
+            else:
+                counts["skipped"] += 1
+                continue
+            if len(sessions) + len(messages) >= batch_size:
+                await flush()
+        await flush()
+
+    logger.info(f"导入完成: {counts}")
+    return counts
@@ -0,0 +1,167 @@
+from typing import Any, AsyncIterator, Iterator, List, Optional, Type
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+import asyncio
+import hashlib
+import json
+import time
+
+# 压测用的确定性假模型和假arXiv工具：不访问网络，相同输入总是得到相同输出
+
+VOCABULARY = (
+    "扩散模型", "注意力机制", "检索增强", "大语言模型", "对比学习", "强化学习",
+    "该论文", "提出了", "一种", "新的", "方法", "实验表明", "在", "基准上",
+    "显著", "优于", "基线", "，", "。"
+)
+
+def _digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+def _last_human_text(messages: List[BaseMessage]) -> str:
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.content if isinstance(message.content, str) else str(message.content)
+    return ""
+
+def _tool_results_since_last_human(messages: List[BaseMessage]) -> int:
+    count = 0
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            break
+        if isinstance(message, ToolMessage):
+            count += 1
+    return count
+
+class FakeChatModel(BaseChatModel):
+    """可配置延迟和生成速率的确定性对话模型
+
+    绑定工具后，每轮先发起tool_rounds次arxiv调用，再输出最终回复；
+    未绑定工具时（如摘要调用）直接输出回复。
+    """
+
+    first_token_latency: float = 0.3  # 首个token前的等待秒数（模拟排队和预填充）
+    tokens_per_second: float = 50.0  # 生成速率
+    response_tokens: int = 120  # 每条回复的token数
+    tool_rounds: int = 1  # 每轮用户消息发起的工具调用次数
+    tool_name: str = "arxiv"
+    bound_tools: List[str] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-research-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        names = [getattr(tool, "name", None) or tool.get("name", "") for tool in tools]
+        return self.model_copy(update={"bound_tools": names})
+
+    def _wants_tool(self, messages: List[BaseMessage]) -> bool:
+        return (
+            self.tool_name in self.bound_tools
+            and _tool_results_since_last_human(messages) < self.tool_rounds
+        )
+
+    def _tool_call(self, messages: List[BaseMessage]) -> dict:
+        question = _last_human_text(messages)
+        round_index = _tool_results_since_last_human(messages)
+        digest = _digest(f"{question}|{round_index}").hex()
+        return {
+            "name": self.tool_name,
+            "args": {"query": " ".join(question.split()[:8]) or "diffusion models"},
+            "id": f"call_{digest[:16]}"
+        }
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        digest = _digest(_last_human_text(messages) + f"|{len(messages)}")
+        return [
+            VOCABULARY[digest[i % len(digest)] % len(VOCABULARY)]
+            for i in range(self.response_tokens)
+        ]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.first_token_latency)
+        if self._wants_tool(messages):
+            call = self._tool_call(messages)
+            message = AIMessage(content="", tool_calls=[call])
+        else:
+            tokens = self._tokens(messages)
+            time.sleep(len(tokens) / self.tokens_per_second)
+            message = AIMessage(content="".join(tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.first_token_latency)
+        if self._wants_tool(messages):
+            call = self._tool_call(messages)
+            message = AIMessage(content="", tool_calls=[call])
+        else:
+            tokens = self._tokens(messages)
+            await asyncio.sleep(len(tokens) / self.tokens_per_second)
+            message = AIMessage(content="".join(tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        if self._wants_tool(messages):
+            yield self._tool_call_chunk(messages)
+            return
+        for token in self._tokens(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            time.sleep(1.0 / self.tokens_per_second)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        if self._wants_tool(messages):
+            yield self._tool_call_chunk(messages)
+            return
+        for token in self._tokens(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            await asyncio.sleep(1.0 / self.tokens_per_second)
+
+    def _tool_call_chunk(self, messages: List[BaseMessage]) -> ChatGenerationChunk:
+        call = self._tool_call(messages)
+        return ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            tool_call_chunks=[tool_call_chunk(
+                name=call["name"], args=json.dumps(call["args"]), id=call["id"], index=0
+            )]
+        ))
+
+class FakeArxivInput(BaseModel):
+    query: str = Field(description="search query to look up")
+
+class FakeArxivTool(BaseTool):
+    """与arxiv工具同名同参数的假工具，按查询确定性地生成论文列表"""
+
+    name: str = "arxiv"
+    description: str = (
+        "A wrapper around Arxiv.org. Useful for when you need to answer questions about "
+        "Physics, Mathematics, Computer Science, Quantitative Biology, Quantitative Finance, "
+        "Statistics, Electrical Engineering, and Economics from scientific articles on arxiv.org. "
+        "Input should be a search query."
+    )
+    args_schema: Type[BaseModel] = FakeArxivInput
+    latency: float = 0.5  # 每次调用的耗时秒数（模拟网络请求）
+    max_results: int = 3
+
+    def _run(self, query: str, run_manager=None) -> str:
+        time.sleep(self.latency)
+        # 输出格式与arxiv工具（app.tools.ArxivSearch）一致
+        papers = []
+        for i in range(self.max_results):
+            digest = _digest(f"{query}|{i}").hex()
+            papers.append(
+                f"arXiv ID: 24{int(digest[18:20], 16) % 12 + 1:02d}.{int(digest[20:25], 16) % 100000:05d}\n"
+                f"Published: 2024-{int(digest[:2], 16) % 12 + 1:02d}-{int(digest[2:4], 16) % 28 + 1:02d}\n"
+                f"Title: {query.title()} Study {digest[:6]}\n"
+                f"Authors: Author {digest[6:9].upper()}, Author {digest[9:12].upper()}\n"
+                f"Summary: We study {query} and report results on benchmark {digest[12:18]}."
+            )
+        return "\n\n".join(papers)
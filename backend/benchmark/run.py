@@ -0,0 +1,287 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import math
+import subprocess
+import tempfile
+import time
+
+from benchmark.server import add_fake_arguments, configure_environment, install_fakes
+
+# 离线压测：在进程内启动后端（假模型 + 假arXiv工具），按指定并发驱动会话、/message 和 /stream 接口，
+# 输出各接口的延迟分位数、首token时间和吞吐，并保存为JSON以便跨提交对比。
+#   cd backend && python -m benchmark.run --concurrency 16 --requests 200
+# 也可以用 --url 压测已启动的服务（例如 python -m benchmark.server 启动的假模型服务）。
+
+SCENARIOS = ("sessions", "message", "stream")
+RESULTS_DIR = Path(__file__).parent / "results"
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """最近秩法分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def describe(values: List[float]) -> Dict[str, Optional[float]]:
+    """延迟分布摘要（毫秒）"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    return {
+        "p50": round(percentile(values, 50) * 1000, 2),
+        "p95": round(percentile(values, 95) * 1000, 2),
+        "p99": round(percentile(values, 99) * 1000, 2),
+        "mean": round(sum(values) / len(values) * 1000, 2),
+        "max": round(max(values) * 1000, 2)
+    }
+
+def summarize(samples: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """按接口汇总样本"""
+    by_endpoint: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample["endpoint"]].append(sample)
+
+    report = {}
+    for endpoint, items in by_endpoint.items():
+        ok = [s for s in items if s["ok"]]
+        statuses: Dict[str, int] = defaultdict(int)
+        for s in items:
+            statuses[str(s["status"])] += 1
+        entry = {
+            "requests": len(items),
+            "errors": len(items) - len(ok),
+            "statuses": dict(statuses),
+            "requests_per_second": round(len(ok) / elapsed, 2) if elapsed else None,
+            "latency_ms": describe([s["latency"] for s in ok])
+        }
+        ttft = [s["ttft"] for s in ok if s.get("ttft") is not None]
+        if ttft:
+            entry["time_to_first_token_ms"] = describe(ttft)
+            entry["chunks_per_request"] = round(sum(s["chunks"] for s in ok) / len(ok), 1)
+        report[endpoint] = entry
+    return report
+
+async def drive(total: int, concurrency: int,
+                request: Callable[[int, int], Awaitable[List[Dict[str, Any]]]]):
+    """以固定并发执行total次请求，每个worker完成一次后立即领取下一次"""
+    samples: List[Dict[str, Any]] = []
+    counter = iter(range(total))
+
+    async def worker(worker_id: int):
+        for i in counter:
+            samples.extend(await request(worker_id, i))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+async def timed(client, endpoint: str, method: str, url: str, **kwargs) -> Dict[str, Any]:
+    """发送一次普通请求并记录耗时"""
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        status = response.status_code
+        body = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
+    except Exception as e:
+        status, body = type(e).__name__, None
+    return {
+        "endpoint": endpoint,
+        "ok": isinstance(status, int) and status < 400,
+        "status": status,
+        "latency": time.perf_counter() - started,
+        "body": body
+    }
+
+async def timed_stream(client, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """发送一次流式请求，记录首token时间、总耗时和事件数"""
+    started = time.perf_counter()
+    ttft = None
+    chunks = 0
+    failed = False
+    try:
+        async with client.stream("POST", "/api/chat/stream", json=payload) as response:
+            status = response.status_code
+            if status >= 400:
+                await response.aread()
+            else:
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        chunks += 1
+                        if line == "event: token" and ttft is None:
+                            ttft = time.perf_counter() - started
+                        elif line == "event: error":
+                            failed = True
+                    elif line == "data: [DONE]":
+                        break
+    except Exception as e:
+        status = type(e).__name__
+    return {
+        "endpoint": "POST /api/chat/stream",
+        "ok": isinstance(status, int) and status < 400 and not failed,
+        "status": status,
+        "latency": time.perf_counter() - started,
+        "ttft": ttft,
+        "chunks": chunks
+    }
+
+async def create_sessions(client, count: int) -> List[str]:
+    """为每个worker预先创建会话（不计入结果），避免会话内串行影响并发"""
+    sessions = []
+    for i in range(count):
+        response = await client.post("/api/chat/sessions", json={"title": f"benchmark {i}"})
+        response.raise_for_status()
+        sessions.append(response.json()["id"])
+    return sessions
+
+def message_text(args: argparse.Namespace, i: int) -> str:
+    # 默认每个请求使用不同问题，避免请求合并和缓存掩盖真实开销
+    return args.prompt if args.same_prompt else f"{args.prompt} #{i}"
+
+async def run_scenario(client, name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    if name == "sessions":
+        async def request(worker_id: int, i: int):
+            created = await timed(client, "POST /api/chat/sessions", "POST", "/api/chat/sessions",
+                                  json={"title": f"benchmark session {i}"})
+            samples = [created]
+            if created["ok"]:
+                session_id = created["body"]["id"]
+                samples.append(await timed(client, "GET /api/chat/sessions/{id}", "GET", f"/api/chat/sessions/{session_id}"))
+                samples.append(await timed(client, "GET /api/chat/sessions/{id}/messages", "GET", f"/api/chat/sessions/{session_id}/messages"))
+            samples.append(await timed(client, "GET /api/chat/sessions/summary", "GET", "/api/chat/sessions/summary"))
+            return samples
+    else:
+        sessions = await create_sessions(client, args.concurrency)
+
+        if name == "message":
+            async def request(worker_id: int, i: int):
+                return [await timed(client, "POST /api/chat/message", "POST", "/api/chat/message",
+                                    json={"session_id": sessions[worker_id], "message": message_text(args, i)})]
+        else:
+            async def request(worker_id: int, i: int):
+                return [await timed_stream(client, {"session_id": sessions[worker_id], "message": message_text(args, i)})]
+
+    samples, elapsed = await drive(args.requests, args.concurrency, request)
+    for sample in samples:
+        sample.pop("body", None)
+    return {"elapsed_seconds": round(elapsed, 3), "endpoints": summarize(samples, elapsed)}
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+async def start_server(app, port: int):
+    """在当前事件循环中启动uvicorn，返回(server, task, base_url)"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+            raise RuntimeError("压测服务启动失败")
+        await asyncio.sleep(0.05)
+    bound_port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f"http://127.0.0.1:{bound_port}"
+
+async def benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    server = task = None
+    base_url = args.url
+    if not base_url:
+        app = install_fakes(args)
+        server, task, base_url = await start_server(app, args.port)
+        # 预先构建Agent，避免首个请求计入构建耗时
+        from app.services import agent_service
+        await agent_service.ensure_agent()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    report: Dict[str, Any] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "target": args.url or "in-process",
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": {}
+    }
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            for name in args.scenarios:
+                print(f"运行场景 {name}: {args.requests} 次请求，并发 {args.concurrency}")
+                report["scenarios"][name] = await run_scenario(client, name, args)
+            response = await client.get("/api/chat/scheduler/stats")
+            if response.status_code == 200:
+                report["scheduler"] = response.json()
+    finally:
+        if server is not None:
+            server.should_exit = True
+            await task
+    return report
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    """打印各接口的p50/p95/p99延迟和吞吐，提供基线时附带相对变化"""
+    def delta(current, previous):
+        if current is None or not previous:
+            return ""
+        return f" ({(current - previous) / previous * 100:+.1f}%)"
+
+    for name, scenario in report["scenarios"].items():
+        for endpoint, stats in scenario["endpoints"].items():
+            base = (((baseline or {}).get("scenarios", {}).get(name) or {}).get("endpoints") or {}).get(endpoint) or {}
+            latency, base_latency = stats["latency_ms"], base.get("latency_ms") or {}
+            line = (
+                f"[{name}] {endpoint}: {stats['requests']} req, {stats['errors']} err, "
+                f"{stats['requests_per_second']} req/s{delta(stats['requests_per_second'], base.get('requests_per_second'))}, "
+                + ", ".join(
+                    f"{p}={latency[p]}ms{delta(latency[p], base_latency.get(p))}" for p in ("p50", "p95", "p99")
+                )
+            )
+            if "time_to_first_token_ms" in stats:
+                ttft, base_ttft = stats["time_to_first_token_ms"], base.get("time_to_first_token_ms") or {}
+                line += ", ttft " + ", ".join(
+                    f"{p}={ttft[p]}ms{delta(ttft[p], base_ttft.get(p))}" for p in ("p50", "p95", "p99")
+                )
+            print(line)
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Research Agent 离线压测")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8, help="并发请求数")
+    parser.add_argument("--requests", type=int, default=100, help="每个场景的请求数")
+    parser.add_argument("--prompt", default="最近有哪些关于扩散模型的论文？")
+    parser.add_argument("--same-prompt", action="store_true", help="所有请求使用相同问题（测试合并/缓存）")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单次请求超时（秒）")
+    parser.add_argument("--url", default="", help="压测已启动的服务，不在进程内启动")
+    parser.add_argument("--port", type=int, default=0, help="进程内服务端口，0表示随机")
+    parser.add_argument("--output", default="", help="结果JSON路径，默认保存到benchmark/results/")
+    parser.add_argument("--compare", default="", help="与之前保存的结果JSON对比")
+    add_fake_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="research-agent-bench-") as workdir:
+        if not args.url:
+            configure_environment(args, workdir)
+        report = asyncio.run(benchmark(args))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['commit'] or 'unknown'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+    print_report(report, baseline)
+    print(f"结果已保存: {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import os
+
+# 使用假模型和假arXiv工具启动后端，供外部压测工具（或 benchmark.run --url）使用
+#   python -m benchmark.server --port 8001 --llm-latency 0.3 --tokens-per-second 50
+
+def add_fake_arguments(parser: argparse.ArgumentParser):
+    """假模型/假工具及压测环境相关的命令行参数"""
+    group = parser.add_argument_group("fake backend")
+    group.add_argument("--llm-latency", type=float, default=0.3, help="假模型首token延迟（秒）")
+    group.add_argument("--tokens-per-second", type=float, default=50.0, help="假模型生成速率")
+    group.add_argument("--response-tokens", type=int, default=120, help="每条回复的token数")
+    group.add_argument("--tool-rounds", type=int, default=1, help="每轮用户消息的arxiv调用次数")
+    group.add_argument("--tool-latency", type=float, default=0.5, help="假arxiv工具耗时（秒）")
+    group.add_argument("--database-url", default="", help="默认使用临时目录中的SQLite文件")
+    group.add_argument("--coalesce", action="store_true", help="开启相同请求合并")
+    group.add_argument("--tool-cache", action="store_true", help="开启工具结果缓存")
+    group.add_argument("--response-cache", default="", help="回复缓存后端：memory 或 sqlite")
+    group.add_argument("--agent-concurrency", type=int, default=None, help="覆盖AGENT_MAX_CONCURRENCY")
+    group.add_argument("--queue-size", type=int, default=None, help="覆盖AGENT_QUEUE_MAX_SIZE")
+
+def configure_environment(args: argparse.Namespace, workdir: str):
+    """在导入app之前设置环境变量（配置在导入时读取）"""
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ["ASYNC_DATABASE_URL"] = ""
+    os.environ["DEBUG"] = "false"
+    os.environ["AGENT_WARMUP"] = "false"
+    os.environ["COALESCE_REQUESTS"] = "true" if args.coalesce else "false"
+    os.environ["TOOL_CACHE_ENABLED"] = "true" if args.tool_cache else "false"
+    os.environ["RESPONSE_CACHE_BACKEND"] = args.response_cache
+    os.environ["RESPONSE_CACHE_PATH"] = os.path.join(workdir, "response_cache.db")
+    os.environ["AGENT_CHECKPOINT_PATH"] = os.path.join(workdir, "agent_checkpoints.db")
+    os.environ["DEEPSEEK_API_KEY"] = "benchmark"
+    if args.agent_concurrency is not None:
+        os.environ["AGENT_MAX_CONCURRENCY"] = str(args.agent_concurrency)
+    if args.queue_size is not None:
+        os.environ["AGENT_QUEUE_MAX_SIZE"] = str(args.queue_size)
+
+def install_fakes(args: argparse.Namespace):
+    """让全局Agent服务使用假模型和假工具，返回FastAPI应用"""
+    import logging
+    from app.main import app
+    from app.services import agent_service
+    from benchmark.fakes import FakeChatModel, FakeArxivTool
+
+    agent_service._create_llm = lambda: FakeChatModel(
+        first_token_latency=args.llm_latency,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        tool_rounds=args.tool_rounds
+    )
+    agent_service._load_tools = lambda llm: [FakeArxivTool(latency=args.tool_latency)]
+    # 逐请求的INFO日志会显著影响吞吐，压测时只保留警告
+    logging.getLogger().setLevel(logging.WARNING)
+    return app
+
+def main():
+    import tempfile
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="使用假模型启动Research Agent后端")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="research-agent-bench-") as workdir:
+        configure_environment(args, workdir)
+        app = install_fakes(args)
+        uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
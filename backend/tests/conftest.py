@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+# 配置在导入app时读取：测试使用临时目录中的SQLite文件，不访问DeepSeek和网络
+WORKDIR = tempfile.mkdtemp(prefix="research-agent-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["ASYNC_DATABASE_URL"] = ""
+os.environ["DEEPSEEK_API_KEY"] = "test"
+os.environ["DEBUG"] = "false"
+os.environ["AGENT_WARMUP"] = "false"
+os.environ["RESPONSE_CACHE_BACKEND"] = ""
+os.environ["AGENT_CHECKPOINT_PATH"] = os.path.join(WORKDIR, "agent_checkpoints.db")
+os.environ["RETENTION_ARCHIVE_DIR"] = os.path.join(WORKDIR, "archives")
+
+import pytest
+
+@pytest.fixture(scope="session", autouse=True)
+def tables():
+    from app.database import create_tables
+
+    create_tables()
+
+@pytest.fixture
+def session_id():
+    """新建一个空会话"""
+    from app.database import SessionLocal
+    from app import crud
+    from app.schemas import SessionCreate
+
+    db = SessionLocal()
+    try:
+        return crud.create_session(db, SessionCreate(title="test")).id
+    finally:
+        db.close()
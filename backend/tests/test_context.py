@@ -0,0 +1,52 @@
+from app import crud
+from app.config import settings
+from app.context import build_history
+from app.database import SessionLocal
+from app.schemas import MessageCreate
+from app.services import agent_service
+
+def add_messages(session_id, count):
+    db = SessionLocal()
+    try:
+        return [
+            crud.create_message(db, MessageCreate(
+                session_id=session_id,
+                role="user" if i % 2 == 0 else "assistant",
+                content=f"message {i} " + "word " * 50
+            )).id
+            for i in range(count)
+        ]
+    finally:
+        db.close()
+
+async def test_fold_catches_up_oldest_first(session_id, monkeypatch):
+    """一次滑出窗口的消息多于summary_fold_max_messages时，分批按时间正序全部折叠"""
+    ids = add_messages(session_id, 12)
+    batches = []
+
+    async def fake_summarize(previous, messages):
+        batches.append([m["content"].split()[1] for m in messages])
+        return f"{previous}|{len(messages)}"
+
+    monkeypatch.setattr(agent_service, "summarize", fake_summarize)
+    monkeypatch.setattr(settings, "summary_fold_max_messages", 3)
+    monkeypatch.setattr(settings, "context_token_budget", 120)
+
+    history = await build_history(session_id)
+
+    window = [m for m in history if m["role"] != "system"]
+    folded = [n for batch in batches for n in batch]
+    assert folded == [str(i) for i in range(12 - len(window))]
+    assert all(len(batch) <= 3 for batch in batches)
+
+    db = SessionLocal()
+    try:
+        summary = crud.get_conversation_summary(db, session_id)
+        assert summary.covered_until_id == ids[11 - len(window)]
+    finally:
+        db.close()
+
+    # 已追上窗口起点：再次组装上下文不会重新摘要
+    batches.clear()
+    await build_history(session_id)
+    assert batches == []
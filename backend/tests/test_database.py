@@ -0,0 +1,116 @@
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import multiprocessing
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database import configure_sqlite, engine_options
+
+WORKERS = 4
+TASKS = 4
+WRITES = 40
+
+INSERT = text("INSERT INTO writes (worker, task, n) VALUES (:worker, :task, :n)")
+
+def _record(errors, e):
+    errors.append(f"{type(e).__name__}: {e}")
+
+def write_sync(url: str, worker: int, tuned: bool = True):
+    """一个worker进程：多线程通过同步引擎写入；tuned=False时不设PRAGMA且驱动不等待锁（对照组）"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    if tuned:
+        engine = create_engine(url, **engine_options(url))
+        configure_sqlite(engine)
+    else:
+        engine = create_engine(url, connect_args={"timeout": 0, "check_same_thread": False})
+    errors = []
+
+    def task(i):
+        for n in range(WRITES):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(INSERT, {"worker": worker, "task": i, "n": n})
+            except Exception as e:
+                _record(errors, e)
+
+    try:
+        with ThreadPoolExecutor(TASKS) as pool:
+            list(pool.map(task, range(TASKS)))
+    finally:
+        engine.dispose()
+    return errors
+
+def write_async(url: str, worker: int):
+    """一个worker进程：多个协程通过aiosqlite引擎写入"""
+    async def run():
+        engine = create_async_engine(url, **engine_options(url))
+        configure_sqlite(engine.sync_engine)
+        errors = []
+
+        async def task(i):
+            for n in range(WRITES):
+                try:
+                    async with engine.begin() as conn:
+                        await conn.execute(INSERT, {"worker": worker, "task": i, "n": n})
+                except Exception as e:
+                    _record(errors, e)
+
+        try:
+            await asyncio.gather(*(task(i) for i in range(TASKS)))
+        finally:
+            await engine.dispose()
+        return errors
+
+    return asyncio.run(run())
+
+@pytest.mark.parametrize("driver, writer", [("sqlite", write_sync), ("sqlite+aiosqlite", write_async)])
+def test_concurrent_writer_processes_never_see_database_locked(driver, writer, tmp_path):
+    """多worker部署：多个进程同时打开同一个新的SQLite文件并持续写入，
+    连接参数和连接时的PRAGMA（busy_timeout先于journal_mode）保证写入只等待、不报 database is locked"""
+    path = str(tmp_path / "workers.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE writes (worker INTEGER, task INTEGER, n INTEGER)")
+
+    url = f"{driver}:///{path}"
+    # spawn：每个worker是全新的解释器，与uvicorn多worker一致，各自建立连接池并在首次连接时切换WAL
+    with ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = list(pool.map(writer, [url] * WORKERS, range(WORKERS)))
+
+    errors = [error for result in results for error in result]
+    assert not [error for error in errors if "database is locked" in error]
+    assert errors == []
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM writes").fetchone()[0] == WORKERS * TASKS * WRITES
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def test_untuned_writers_do_see_database_locked(tmp_path):
+    """对照组：同样的写入负载在不等待锁时会报 database is locked，说明上面的测试确实产生了写锁竞争"""
+    path = str(tmp_path / "untuned.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE writes (worker INTEGER, task INTEGER, n INTEGER)")
+
+    with ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = list(pool.map(write_sync, [f"sqlite:///{path}"] * WORKERS, range(WORKERS), [False] * WORKERS))
+
+    assert [error for result in results for error in result if "database is locked" in error]
+
+async def test_connect_pragmas_applied_to_aiosqlite_connections(tmp_path):
+    from app.config import settings
+
+    url = f"sqlite+aiosqlite:///{tmp_path / 'pragmas.db'}"
+    engine = create_async_engine(url, **engine_options(url))
+    configure_sqlite(engine.sync_engine)
+    try:
+        async with engine.connect() as conn:
+            pragmas = {
+                name: (await conn.exec_driver_sql(f"PRAGMA {name}")).scalar()
+                for name in ("busy_timeout", "journal_mode", "synchronous")
+            }
+    finally:
+        await engine.dispose()
+    # synchronous: NORMAL = 1
+    assert pragmas == {"busy_timeout": settings.sqlite_busy_timeout_ms, "journal_mode": "wal", "synchronous": 1}
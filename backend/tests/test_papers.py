@@ -0,0 +1,50 @@
+from datetime import date
+
+from langchain_core.documents import Document
+
+from app.database import SessionLocal
+from app.models import Paper
+from app.papers import PaperStore, parse_arxiv_results, title_key
+from app.tools import ArxivSearch
+
+class StubArxivWrapper:
+    doc_content_chars_max = 4000
+
+    def get_summaries_as_docs(self, query):
+        return [
+            Document(
+                page_content="We extend the method of arXiv:2101.00001 to long contexts.",
+                metadata={
+                    "Entry ID": "http://arxiv.org/abs/2402.12345v2",
+                    "Published": date(2024, 2, 20),
+                    "Title": "Long Context Retrieval",
+                    "Authors": "Ada Lovelace, Alan Turing",
+                },
+            )
+        ]
+
+def test_arxiv_tool_keys_papers_on_entry_id():
+    """论文按entry_id中的arXiv编号去重，摘要中引用的其他编号不影响去重键"""
+    output = ArxivSearch(api_wrapper=StubArxivWrapper()).invoke({"query": "long context"})
+    assert output.startswith("arXiv ID: 2402.12345\nPublished: 2024-02-20\n")
+    papers = parse_arxiv_results(output)
+    assert [paper["id"] for paper in papers] == ["2402.12345"]
+
+def test_title_keyed_paper_upgraded_to_arxiv_id():
+    """旧结果按标题收录的论文，再次出现且带arXiv ID时改为按ID收录，不产生重复"""
+    legacy = (
+        "Published: 2023-05-01\nTitle: Sparse Mixture Routing\nAuthors: Grace Hopper\n"
+        "Summary: Short summary."
+    )
+    store = PaperStore(top_k=3)
+    assert store.ingest(legacy) == 1
+    assert store.ingest("arXiv ID: 2305.00042\n" + legacy.replace("Short summary.", "A longer summary.")) == 0
+
+    db = SessionLocal()
+    try:
+        assert db.get(Paper, title_key("Sparse Mixture Routing")) is None
+        paper = db.get(Paper, "2305.00042")
+        assert paper.summary == "A longer summary."
+        assert paper.seen == 2
+    finally:
+        db.close()
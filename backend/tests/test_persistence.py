@@ -0,0 +1,26 @@
+import asyncio
+
+from app.persistence import MessageWriter
+from app.schemas import MessageCreate
+
+async def test_bad_row_fails_only_its_own_submit(session_id):
+    """组提交中一条消息写入失败时，同批其他消息仍然写入成功"""
+    writer = MessageWriter(batch_size=16, flush_interval=0.05)
+    await writer.start()
+    try:
+        good = [
+            await writer.submit(MessageCreate(session_id=session_id, role="user", content=f"ok {i}"), wait=False)
+            for i in range(3)
+        ]
+        # 不可JSON序列化的工具结果使整批事务失败
+        bad = await writer.submit(MessageCreate(
+            session_id=session_id, role="assistant", content="bad", tool_results={"call": {1, 2}}
+        ), wait=False)
+        results = await asyncio.gather(*good, bad, return_exceptions=True)
+    finally:
+        await writer.stop()
+
+    assert [message.content for message in results[:3]] == ["ok 0", "ok 1", "ok 2"]
+    assert isinstance(results[3], Exception)
+    # 整批失败后逐条重试：3条各自提交成功
+    assert writer.batches == 3
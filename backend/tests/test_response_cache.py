@@ -0,0 +1,27 @@
+import sqlite3
+
+import pytest
+
+from app import response_cache
+from app.response_cache import SQLiteResponseCache
+
+async def test_sqlite_cache_closes_connections(tmp_path, monkeypatch):
+    """每次读写结束后关闭连接，不依赖GC回收文件句柄"""
+    opened = []
+    connect = sqlite3.connect
+
+    def tracking_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(response_cache.sqlite3, "connect", tracking_connect)
+    cache = SQLiteResponseCache(str(tmp_path / "responses.db"), ttl_seconds=60, max_entries=10)
+    await cache.set("k", {"content": "hello"})
+    assert await cache.get("k") == {"content": "hello"}
+    assert await cache.get("missing") is None
+
+    assert len(opened) == 4
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
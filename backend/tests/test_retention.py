@@ -0,0 +1,43 @@
+import asyncio
+import os
+import time
+
+from app import crud, retention
+from app.database import SessionLocal
+from app.retention import archive_path, archive_session, restore_session
+from app.schemas import MessageCreate
+
+async def test_archive_write_does_not_block_event_loop(session_id, monkeypatch):
+    """归档文件的写入和fsync在线程中执行：慢速落盘期间事件循环仍能调度其他任务"""
+    db = SessionLocal()
+    try:
+        crud.create_message(db, MessageCreate(session_id=session_id, role="user", content="hello"))
+    finally:
+        db.close()
+
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        time.sleep(0.3)
+        fsync(fd)
+
+    monkeypatch.setattr(retention.os, "fsync", slow_fsync)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    try:
+        archived = await archive_session(session_id)
+    finally:
+        task.cancel()
+    assert archived["messages"] == 1 and archived["bytes"] > 0
+    assert ticks >= 10
+    assert archive_path(session_id).exists()
+
+    counts = await restore_session(session_id)
+    assert counts["sessions"] == 1 and counts["messages"] == 1
@@ -0,0 +1,41 @@
+import pytest
+
+from app.routing import ROUTE_AGENT, ROUTE_DIRECT, classify_turn
+
+HISTORY = [
+    {"role": "user", "content": "有哪些关于检索增强生成的论文？"},
+    {"role": "assistant", "content": "以下是几篇相关论文……"},
+]
+
+@pytest.mark.parametrize("message", [
+    "翻译成英文",
+    "什么意思",
+    "explain",
+    "把上面的回答翻译成英文",
+    "解释一下这个结论",
+    "这是什么意思？",
+    "can you explain that in simpler terms",
+    "please translate your answer into Chinese",
+])
+def test_transform_of_previous_answer_goes_direct(message):
+    assert classify_turn(message, HISTORY) == (ROUTE_DIRECT, "transform")
+
+@pytest.mark.parametrize("message", [
+    "解释一下注意力机制",
+    "Transformer中的位置编码是什么意思",
+    "explain how diffusion models work",
+    "explain transformers",
+])
+def test_new_topical_question_goes_to_agent(message):
+    assert classify_turn(message, HISTORY) == (ROUTE_AGENT, "default")
+
+def test_transform_without_previous_answer_goes_to_agent():
+    assert classify_turn("翻译成英文", []) == (ROUTE_AGENT, "default")
+
+@pytest.mark.parametrize("message", ["你好", "谢谢！", "好的，谢谢啦", "thanks!", "ok", "Thank you~", "谢谢你"])
+def test_small_talk_goes_direct(message):
+    assert classify_turn(message, []) == (ROUTE_DIRECT, "small_talk")
+
+@pytest.mark.parametrize("message", ["你好，注意力机制是什么", "ok what is LoRA?", "谢谢，那transformer呢", "hello, explain RLHF"])
+def test_greeting_followed_by_question_goes_to_agent(message):
+    assert classify_turn(message, [])[0] == ROUTE_AGENT
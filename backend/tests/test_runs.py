@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from app.metrics import STREAM_FIRST_CHUNK
+from app.runs import StreamRunRegistry, CANCELLED_EVENT, agent_events
+from app.scheduler import AgentScheduler
+
+async def slow_events():
+    yield {"type": "token", "content": "x", "is_final": False}
+    await asyncio.sleep(10)
+
+async def test_cancel_right_after_start_releases_ticket(session_id):
+    """运行任务在开始执行前被取消：凭证仍被释放，订阅者收到结束事件"""
+    scheduler = AgentScheduler(max_concurrency=1, max_queue=4, queue_timeout=1)
+    registry = StreamRunRegistry(ttl_seconds=60, max_events=100)
+    ticket = await scheduler.acquire(session_id)
+
+    run = registry.create(session_id, "hello")
+    registry.start(run, slow_events(), ticket)
+    assert registry.cancel(run)
+
+    events = [event async for event in run.broadcast.subscribe()]
+    assert events == [CANCELLED_EVENT]
+    assert ticket.released
+    assert run.status == "cancelled"
+    # 全局名额和会话锁已释放，同一会话的下一个请求无需等待
+    next_ticket = await asyncio.wait_for(scheduler.acquire(session_id), timeout=0.5)
+    next_ticket.release()
+
+async def test_cancel_while_running_releases_ticket(session_id):
+    scheduler = AgentScheduler(max_concurrency=1, max_queue=4, queue_timeout=1)
+    registry = StreamRunRegistry(ttl_seconds=60, max_events=100)
+    ticket = await scheduler.acquire(session_id)
+
+    run = registry.create(session_id, "hello")
+    registry.start(run, slow_events(), ticket)
+    await asyncio.sleep(0.05)
+    registry.cancel(run)
+
+    events = [event async for event in run.broadcast.subscribe()]
+    assert events[-1] == CANCELLED_EVENT
+    assert ticket.released and run.status == "cancelled"
+
+def first_chunk_count() -> float:
+    state = STREAM_FIRST_CHUNK._values.get(())
+    return state[-1] if state else 0
+
+async def test_first_chunk_metric_only_for_stream_requests(session_id, monkeypatch):
+    """首个数据块耗时只统计/stream请求（传入收到请求的时刻），后台运行不计入"""
+    from app.runs import agent_service
+
+    async def events(message, history, session_id):
+        yield {"type": "final", "content": "", "is_final": True, "tool_calls": None}
+
+    monkeypatch.setattr(agent_service, "process_stream", events)
+    registry = StreamRunRegistry(ttl_seconds=60, max_events=100)
+
+    before = first_chunk_count()
+    [event async for event in agent_events(registry.create(session_id, "hello"), [])]
+    assert first_chunk_count() == before
+    [event async for event in agent_events(registry.create(session_id, "hello"), [], time.perf_counter())]
+    assert first_chunk_count() == before + 1
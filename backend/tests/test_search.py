@@ -0,0 +1,32 @@
+import sqlite3
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import OperationalError
+
+from app import api
+
+def operational_error(message: str) -> OperationalError:
+    return OperationalError("SELECT ...", {}, sqlite3.OperationalError(message))
+
+async def search_with_error(monkeypatch, error):
+    async def failing(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(api, "search_messages", failing)
+    return await api.search(q="attention", limit=20, offset=0, session_id=None, db=None)
+
+async def test_fts_syntax_error_is_client_error(monkeypatch):
+    with pytest.raises(HTTPException) as raised:
+        await search_with_error(monkeypatch, operational_error('fts5: syntax error near "AND"'))
+    assert raised.value.status_code == 400
+
+@pytest.mark.parametrize("error", [
+    operational_error("database is locked"),
+    operational_error("no such table: chat_messages_fts"),
+    RuntimeError("bug"),
+])
+async def test_server_errors_propagate(monkeypatch, error):
+    """锁超时、缺表和程序错误不伪装成400，交给框架按500上报"""
+    with pytest.raises(type(error)):
+        await search_with_error(monkeypatch, error)
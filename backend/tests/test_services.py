@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from app.services import ResearchAgentService
+from benchmark.fakes import FakeChatModel, FakeArxivTool
+
+def fake_service(**model_options) -> ResearchAgentService:
+    """使用假模型和假arXiv工具的Agent服务"""
+    service = ResearchAgentService()
+    options = {"first_token_latency": 0, "tokens_per_second": 1000, "response_tokens": 5, "tool_rounds": 0}
+    options.update(model_options)
+    service._create_llm = lambda: FakeChatModel(**options)
+    service._load_tools = lambda llm: [FakeArxivTool(latency=0)]
+    return service
+
+async def test_response_key_stable_across_agent_build():
+    """构建Agent前后相同请求的回复缓存键一致（预热期间写入的缓存可以命中）"""
+    service = fake_service()
+    history = [{"role": "user", "content": "q0"}, {"role": "assistant", "content": "a0"}]
+    before = service._response_key("diffusion papers", history)
+    await service.ensure_agent()
+    try:
+        assert service._response_key("diffusion papers", history) == before
+    finally:
+        await service.close()
+
+async def test_cancelled_run_abandons_tool_call(monkeypatch):
+    """取消Agent运行时取消传递到工具调用：运行立即结束，工具结果不写入缓存"""
+    from app.config import settings
+    from app.tool_cache import tool_cache
+
+    monkeypatch.setattr(settings, "fast_path_enabled", False)
+    service = fake_service(tool_rounds=1)
+    service._load_tools = lambda llm: [FakeArxivTool(latency=0.5)]
+    await service.ensure_agent()
+    stored = []
+    monkeypatch.setattr(tool_cache, "set", lambda *args: stored.append(args))
+
+    async def consume():
+        async for event in service._run_stream("papers on cancellation", []):
+            if event["type"] == "tool_call":
+                tool_started.set()
+
+    tool_started = asyncio.Event()
+    task = asyncio.create_task(consume())
+    try:
+        await asyncio.wait_for(tool_started.wait(), timeout=5)
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert task.cancelled()
+        assert time.perf_counter() - started < 0.3
+        await asyncio.sleep(0.6)
+        assert stored == []
+    finally:
+        await service.close()
+
+async def test_same_question_in_two_sessions_updates_both_threads(monkeypatch):
+    """启用检查点时不同会话的相同问题不合并：每个会话的线程都追加了本轮消息"""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "coalesce_requests", True)
+    service = fake_service(first_token_latency=0.2)
+    await service.ensure_agent()
+    try:
+        sessions = ["coalesce-a", "coalesce-b"]
+        results = await asyncio.gather(*(
+            service.process_message("what is attention", [], session_id) for session_id in sessions
+        ))
+        assert all(not result.get("error") for result in results)
+        for session_id in sessions:
+            messages = await service._thread_messages(session_id)
+            assert [m.content for m in messages if m.type == "human"] == ["what is attention"]
+    finally:
+        await service.close()
@@ -0,0 +1,35 @@
+from app import tokens
+
+def test_count_tokens_never_loads_encoding(monkeypatch):
+    """请求路径不加载（下载）编码，未加载时按字符数估算"""
+    monkeypatch.setattr(tokens, "_encoding", None)
+    monkeypatch.setattr(tokens, "load_encoding", lambda: (_ for _ in ()).throw(AssertionError("不应加载编码")))
+    assert tokens.count_tokens("hello world") == len("hello world")
+
+def test_load_encoding_failure_falls_back(monkeypatch):
+    import tiktoken
+
+    def offline(name):
+        raise OSError("network unreachable")
+
+    monkeypatch.setattr(tokens, "_encoding", None)
+    monkeypatch.setattr(tiktoken, "get_encoding", offline)
+    assert tokens.load_encoding() is None
+    assert tokens.count_tokens("abc") == 3
+
+async def test_startup_does_not_wait_for_encoding(monkeypatch):
+    """服务启动不等待编码下载：下载期间已可处理请求"""
+    import threading
+    import time
+
+    from app import main
+
+    release = threading.Event()
+    monkeypatch.setattr(main, "load_encoding", lambda: release.wait(5))
+    started = time.perf_counter()
+    try:
+        async with main.lifespan(main.app):
+            assert time.perf_counter() - started < 2
+            assert not release.is_set()
+    finally:
+        release.set()
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from app.singleflight import ThreadSingleFlight
+from app.tools import wrap_tool
+from benchmark.fakes import FakeArxivTool
+
+class RecordingCache:
+    def __init__(self):
+        self.stored = []
+
+    def get(self, key):
+        return None
+
+    def set(self, key, tool_name, arguments, result):
+        self.stored.append(key)
+
+async def test_cancelled_call_returns_immediately_and_skips_cache():
+    """取消正在执行的工具调用：立即返回，线程中晚到的结果不写缓存、不触发回调"""
+    cache = RecordingCache()
+    ingested = []
+    tool = wrap_tool(FakeArxivTool(latency=0.5), cache, ingested.append)
+    tool.flights = ThreadSingleFlight()
+
+    task = asyncio.create_task(tool.ainvoke({"query": "diffusion"}))
+    await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    assert task.cancelled()
+    assert time.perf_counter() - started < 0.2
+
+    # 等线程中的请求结束后确认结果被丢弃
+    await asyncio.sleep(0.6)
+    assert cache.stored == []
+    assert ingested == []
+
+async def test_completed_call_is_cached():
+    cache = RecordingCache()
+    tool = wrap_tool(FakeArxivTool(latency=0), cache)
+    tool.flights = ThreadSingleFlight()
+    result = await tool.ainvoke({"query": "diffusion"})
+    assert result.startswith("arXiv ID: ")
+    assert len(cache.stored) == 1
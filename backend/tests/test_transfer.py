@@ -0,0 +1,35 @@
+from app import crud
+from app.database import SessionLocal
+from app.models import ChatMessage, ChatSession
+from app.schemas import MessageCreate
+from app.transfer import export_ndjson, import_ndjson
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+async def replay(chunks):
+    for chunk in chunks:
+        yield chunk
+
+async def test_reimport_counts_only_inserted_rows(session_id):
+    """重复导入同一份导出：没有新插入的行，已存在的会话和消息计入skipped"""
+    db = SessionLocal()
+    try:
+        for i in range(3):
+            crud.create_message(db, MessageCreate(session_id=session_id, role="user", content=f"m{i}"))
+    finally:
+        db.close()
+
+    exported = await collect(export_ndjson(session_ids=[session_id]))
+    counts = await import_ndjson(replay(exported))
+    assert counts == {"sessions": 0, "messages": 0, "skipped": 4}
+
+    db = SessionLocal()
+    try:
+        db.query(ChatMessage).filter(ChatMessage.session_id == session_id).delete()
+        db.query(ChatSession).filter(ChatSession.id == session_id).delete()
+        db.commit()
+    finally:
+        db.close()
+    counts = await import_ndjson(replay(exported))
+    assert counts == {"sessions": 1, "messages": 3, "skipped": 0}
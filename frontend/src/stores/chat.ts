@@ -59,7 +59,7 @@ export const useChatStore = defineStore('chat', () => {
   async function loadSessions() {
     try {
       console.log('正在加载会话列表...');
-      const data = await apiClient.getSessions();
+      const data = await apiClient.getSessionSummaries();
       sessions.value = data;
       console.log('会话列表加载成功，数量:', sessions.value.length);
       
@@ -29,6 +29,9 @@ export interface ChatSession {
   updated_at: string;
   is_active: boolean;
   messages?: ChatMessage[];
+  message_count?: number;
+  last_message_preview?: string | null;
+  last_message_at?: string | null;
 }
 
 export interface ChatRequest {
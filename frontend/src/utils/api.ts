@@ -16,6 +16,9 @@ export interface ChatSession {
   updated_at: string;
   is_active: boolean;
   messages?: ChatMessage[];
+  message_count?: number;
+  last_message_preview?: string | null;
+  last_message_at?: string | null;
 }
 
 export interface ChatMessage {
@@ -69,6 +72,19 @@ class ApiClient {
     return response.data;
   }
 
+  /**
+   * 获取会话摘要列表（不含消息，侧边栏使用）
+   * @param limit 最大数量
+   * @param offset 偏移量
+   * @returns 会话摘要列表
+   */
+  async getSessionSummaries(limit: number = 200, offset: number = 0): Promise<ChatSession[]> {
+    const response = await this.client.get('/api/chat/sessions/summary', {
+      params: { limit, offset },
+    });
+    return response.data;
+  }
+
   /**
    * 获取特定会话
    * @param sessionId 会话ID
@@ -131,114 +147,168 @@ class ApiClient {
       stream: true
     };
 
-    const controller = new AbortController();
-    const signal = controller.signal;
+    const MAX_RECONNECTS = 3;
+    let controller = new AbortController();
     
     let isActive = true;
     let isComplete = false;
+    let isOpened = false;
+    // 断线重连：服务端为每个事件编号，携带 Last-Event-ID 重发即可从断点续传同一次运行
+    let runId: string | null = null;
+    let lastEventId: string | null = null;
+    let reconnects = 0;
+    let reconnecting = false;
+
+    const reconnect = (error: any): boolean => {
+      // HTTP 错误（如运行已过期）和尚未建立的运行不重连
+      if (!isActive || isComplete || !runId || error?.status || reconnects >= MAX_RECONNECTS) {
+        return false;
+      }
+      reconnects += 1;
+      reconnecting = true;
+      console.warn(`流式连接中断，${reconnects} 秒后第 ${reconnects} 次重连`, error);
+      setTimeout(connect, 1000 * reconnects);
+      return true;
+    };
 
-    // 使用 fetch 发送 POST 请求
-    fetch(url, {
-      method: 'POST',
-      headers: {
+    const connect = () => {
+      reconnecting = false;
+      if (!isActive) return;
+      
+      const headers: Record<string, string> = {
         'Content-Type': 'application/json',
-      },
-      body: JSON.stringify(requestData),
-      signal,
-    })
-      .then(response => {
-        if (!response.ok) {
-          throw new Error(`HTTP 错误! 状态码: ${response.status} ${response.statusText}`);
-        }
+      };
+      if (runId) {
+        headers['Last-Event-ID'] = lastEventId || `${runId}:-1`;
+      }
+      controller = new AbortController();
+
+      // 使用 fetch 发送 POST 请求
+      fetch(url, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify(requestData),
+        signal: controller.signal,
+      })
+        .then(response => {
+          if (!response.ok) {
+            const error: any = new Error(`HTTP 错误! 状态码: ${response.status} ${response.statusText}`);
+            error.status = response.status;
+            throw error;
+          }
 
-        if (!response.body) {
-          throw new Error('浏览器不支持 ReadableStream');
-        }
+          if (!response.body) {
+            throw new Error('浏览器不支持 ReadableStream');
+          }
 
-        // 连接成功建立
-        console.log('流式连接已建立');
-        callbacks.onOpen?.();
-
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder('utf-8');
-        let buffer = '';
-
-        // 处理流式数据
-        const processStream = async (): Promise<void> => {
-          try {
-            while (isActive) {
-              const { done, value } = await reader.read();
-              
-              if (done) {
-                console.log('流式传输完成');
-                isComplete = true;
-                callbacks.onClose?.();
-                break;
-              }
+          runId = response.headers.get('X-Run-Id') || runId;
+          if (isOpened) {
+            console.log('流式连接已恢复');
+          } else {
+            // 连接成功建立
+            isOpened = true;
+            console.log('流式连接已建立');
+            callbacks.onOpen?.();
+          }
+
+          const reader = response.body.getReader();
+          const decoder = new TextDecoder('utf-8');
+          let buffer = '';
 
-              // 解码数据并添加到缓冲区
-              buffer += decoder.decode(value, { stream: true });
-              
-              // 按行分割处理 SSE 格式
-              const lines = buffer.split('\n');
-              buffer = lines.pop() || ''; // 保留未完成的行
-              
-              for (const line of lines) {
-                if (!isActive) break;
+          // 处理流式数据
+          const processStream = async (): Promise<void> => {
+            try {
+              while (isActive) {
+                const { done, value } = await reader.read();
                 
-                if (line.startsWith('data: ')) {
-                  const dataLine = line.substring(6).trim();
+                if (done) {
+                  // 未收到结束标记就断开，视为断线
+                  if (!isComplete && reconnect(new Error('连接在结束标记前关闭'))) {
+                    break;
+                  }
+                  console.log('流式传输完成');
+                  isComplete = true;
+                  callbacks.onClose?.();
+                  break;
+                }
+
+                // 解码数据并添加到缓冲区
+                buffer += decoder.decode(value, { stream: true });
+                
+                // 按行分割处理 SSE 格式
+                const lines = buffer.split('\n');
+                buffer = lines.pop() || ''; // 保留未完成的行
+                
+                for (const line of lines) {
+                  if (!isActive) break;
                   
-                  // 忽略空行和结束标记
-                  if (dataLine === '' || dataLine === '[DONE]') {
-                    if (dataLine === '[DONE]') {
-                      console.log('接收到结束标记 [DONE]');
-                      isComplete = true;
-                      callbacks.onClose?.();
-                    }
+                  if (line.startsWith('id: ')) {
+                    lastEventId = line.substring(4).trim();
                     continue;
                   }
                   
-                  try {
-                    const parsedData = JSON.parse(dataLine);
-                    callbacks.onMessage?.(parsedData);
-                  } catch (error) {
-                    console.error('解析 SSE 数据失败:', error, '原始数据:', dataLine);
+                  if (line.startsWith('data: ')) {
+                    const dataLine = line.substring(6).trim();
+                    
+                    // 忽略空行和结束标记
+                    if (dataLine === '' || dataLine === '[DONE]') {
+                      if (dataLine === '[DONE]') {
+                        console.log('接收到结束标记 [DONE]');
+                        isComplete = true;
+                        callbacks.onClose?.();
+                      }
+                      continue;
+                    }
                     
-                    // 如果解析失败，尝试发送原始内容
-                    if (dataLine) {
-                      callbacks.onMessage?.({
-                        content: dataLine,
-                        is_final: false
-                      });
+                    try {
+                      const parsedData = JSON.parse(dataLine);
+                      if (parsedData.is_final) {
+                        // 最终事件已送达即视为完成：之后关闭连接不会再通知服务端取消运行
+                        isComplete = true;
+                      }
+                      callbacks.onMessage?.(parsedData);
+                    } catch (error) {
+                      console.error('解析 SSE 数据失败:', error, '原始数据:', dataLine);
+                      
+                      // 如果解析失败，尝试发送原始内容
+                      if (dataLine) {
+                        callbacks.onMessage?.({
+                          content: dataLine,
+                          is_final: false
+                        });
+                      }
                     }
                   }
                 }
               }
-            }
-          } catch (error) {
-            if (error.name === 'AbortError') {
-              console.log('流式请求被主动中断');
-              if (!isComplete) {
-                callbacks.onClose?.();
+            } catch (error) {
+              if (error.name === 'AbortError') {
+                console.log('流式请求被主动中断');
+                if (!isComplete) {
+                  callbacks.onClose?.();
+                }
+              } else if (isActive && !reconnect(error)) {
+                console.error('读取流数据时发生错误:', error);
+                callbacks.onError?.(error);
+              }
+            } finally {
+              if (!reconnecting) {
+                isActive = false;
               }
-            } else if (isActive) {
-              console.error('读取流数据时发生错误:', error);
-              callbacks.onError?.(error);
             }
-          } finally {
-            isActive = false;
+          };
+
+          processStream();
+        })
+        .catch(error => {
+          if (isActive && !reconnect(error)) {
+            console.error('发送流式请求失败:', error);
+            callbacks.onError?.(error);
           }
-        };
+        });
+    };
 
-        processStream();
-      })
-      .catch(error => {
-        if (isActive) {
-          console.error('发送流式请求失败:', error);
-          callbacks.onError?.(error);
-        }
-      });
+    connect();
 
     return {
       close: () => {
@@ -246,6 +316,10 @@ class ApiClient {
         isActive = false;
         console.log('手动关闭流式连接');
         controller.abort();
+        if (runId && !isComplete) {
+          // 主动停止：通知服务端取消运行（已生成的部分回复会被保存）
+          fetch(`${API_BASE_URL}/api/chat/runs/${runId}`, { method: 'DELETE' }).catch(() => {});
+        }
         if (!isComplete) {
           callbacks.onClose?.();
         }
@@ -308,6 +382,7 @@ export const chatApi = {
   // 会话管理
   createSession: (title: string = '新对话') => apiClient.createSession(title),
   getSessions: () => apiClient.getSessions(),
+  getSessionSummaries: (limit?: number, offset?: number) => apiClient.getSessionSummaries(limit, offset),
   getSession: (sessionId: string) => apiClient.getSession(sessionId),
   deleteSession: (sessionId: string) => apiClient.deleteSession(sessionId),
   getSessionMessages: (sessionId: string) => apiClient.getSessionMessages(sessionId),